@@ -0,0 +1,20 @@
+"""Offline benchmarks for Chomp's hot paths.
+
+Benchmarks run against recorded fixtures in benchmark/fixtures (article HTML,
+Google CSE and Wordpress API result pages) and a synthetic manifest directory,
+so they never go online and give the same numbers from one run to the next.
+
+Usage:
+    python -m benchmark.run          # Compare against benchmark/baseline.json.
+    python -m benchmark.run --save   # Record a new baseline.
+
+Run it before and after every performance change, on the same machine. See
+python -m benchmark.run --help for the rest.
+
+The web layer is load-tested separately, against a local stand-in server for
+the APIs, sites and Selenium Grid (see standin.py):
+    python -m benchmark.load --latency 0.05 0.2 -w 1 4 16
+
+Import times are checked against their budgets with:
+    python -m benchmark.imports
+"""
@@ -0,0 +1,118 @@
+"""Recorded fixtures for benchmarks and load tests.
+
+articles/*.html are full article pages, boilerplate and all. google.json and
+wordpress.json are single result pages from each API, for the same kind of
+articles. Add more pages to articles/ with record(); every benchmark picks them
+up.
+"""
+from datetime import datetime
+from itertools import cycle
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import requests
+
+from we1s_chomp import db
+from we1s_chomp.model import Article, Query, Source
+
+###############################################################################
+# Internal configuration parameters.                                          #
+###############################################################################
+
+
+FIXTURES_DIRPATH = Path(__file__).parent
+"""Directory of fixture files."""
+
+QUERY_STR = "humanities"
+"""Search term the fixtures were recorded for."""
+
+START_DATE = datetime(year=2000, month=1, day=1)
+"""Start date to query the fixtures with."""
+
+END_DATE = datetime(year=2019, month=12, day=31)
+"""End date to query the fixtures with."""
+
+
+###############################################################################
+# Fixture functions.                                                          #
+###############################################################################
+
+
+def load_articles() -> Dict[str, str]:
+    """Load article pages, by filename."""
+    return {
+        filename.name: filename.read_text(encoding="utf-8")
+        for filename in sorted((FIXTURES_DIRPATH / "articles").glob("*.html"))
+    }
+
+
+def load_google() -> str:
+    """Load a raw Google CSE API result page."""
+    return (FIXTURES_DIRPATH / "google.json").read_text(encoding="utf-8")
+
+
+def load_wordpress() -> str:
+    """Load a raw Wordpress API result page."""
+    return (FIXTURES_DIRPATH / "wordpress.json").read_text(encoding="utf-8")
+
+
+def get_collector(pages: List[str]) -> Callable:
+    """Get a stand-in for web.get() that serves article pages in turn."""
+    pages = cycle(pages)
+
+    def get(url: str, *args, **kwargs) -> str:
+        return next(pages)
+
+    return get
+
+
+def make_manifests(dirpath: Path, num_articles: int) -> List[str]:
+    """Write a synthetic manifest directory: one source, one query and a number
+    of articles made from the article fixtures.
+
+    Returns:
+        Names of the articles.
+    """
+    source = Source(
+        name="courier", webpage="https://www.dailycourier.example.com", tags=[]
+    )
+    query = Query(
+        source_name=source.name,
+        query_str=QUERY_STR,
+        start_date=START_DATE,
+        end_date=END_DATE,
+    )
+    db.save_manifest_file(source, dirpath / "sources")
+    db.save_manifest_file(query, dirpath / "queries")
+
+    names = []
+    pages = cycle(load_articles().values())
+    for i in range(num_articles):
+        article = Article(
+            name=f"chomp_{query.name}_{i}",
+            url=f"https://www.dailycourier.example.com/education/story-{i}/",
+            title=f"Story {i}",
+            pub=source.name,
+            pub_date=datetime(year=2019, month=1 + i % 12, day=1 + i % 28),
+            content_html=next(pages),
+            content=" ".join(["The humanities still matter."] * 50),
+            source_name=source.name,
+            query_name=query.name,
+        )
+        db.save_manifest_file(article, dirpath / "articles")
+        names.append(article.name)
+    return names
+
+
+def record(url: str, name: str) -> Path:
+    """Download a live article page into the fixtures.
+
+    Args:
+        url: URL of the article.
+        name: Filename to save it as, without extension.
+    """
+    res = requests.get(url)
+    res.raise_for_status()
+    filename = FIXTURES_DIRPATH / "articles" / f"{name}.html"
+    filename.write_text(res.text, encoding="utf-8")
+    return filename
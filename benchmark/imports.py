@@ -0,0 +1,178 @@
+"""Check how long Chomp's modules take to import.
+
+Each module is imported in a fresh interpreter with python -X importtime, a
+few times over, and the best time is compared against the module's budget.
+Heavy dependencies (HTML and date parsers, Requests, Selenium) should only be
+imported when they're used, so importing a module that drags one in fails
+too. The run exits with status 1 if anything is over budget.
+
+Usage:
+    python -m benchmark.imports
+    python -m benchmark.imports -v    # Show the slowest imports under each.
+"""
+import argparse
+import subprocess
+import sys
+from typing import Dict, List, Optional, Set, Tuple
+
+###############################################################################
+# Internal configuration parameters.                                          #
+###############################################################################
+
+
+_DEFAULT_BUDGET = 0.15
+"""Default import time budget in seconds."""
+
+_DEFAULT_REPEAT = 5
+"""Default number of times to import each module."""
+
+BUDGETS = {
+    "we1s_chomp.cache": 0.1,
+    "we1s_chomp.corpus": 0.1,
+    "we1s_chomp.db": 0.1,
+    "we1s_chomp.frontier": 0.1,
+    "we1s_chomp.index": 0.1,
+    "we1s_chomp.metrics": 0.1,
+    "we1s_chomp.model": 0.1,
+    "we1s_chomp.clean": _DEFAULT_BUDGET,
+    "we1s_chomp.google": _DEFAULT_BUDGET,
+    "we1s_chomp.pipeline": _DEFAULT_BUDGET,
+    "we1s_chomp.sitemap": _DEFAULT_BUDGET,
+    "we1s_chomp.spool": 0.1,
+    "we1s_chomp.web": _DEFAULT_BUDGET,
+    "we1s_chomp.wordpress": _DEFAULT_BUDGET,
+}
+"""Import time budgets in seconds, by module."""
+
+HEAVY_MODULES = {
+    "bleach",
+    "bs4",
+    "dateparser",
+    "html5lib",
+    "ijson",
+    "pyarrow",
+    "pyinstrument",
+    "requests",
+    "selenium",
+    "unidecode",
+    "urllib3",
+}
+"""Packages no module should import until they're needed."""
+
+
+###############################################################################
+# Runner functions.                                                           #
+###############################################################################
+
+
+def get_import_times(module: str) -> Tuple[float, List[Tuple[float, str]]]:
+    """Import a module in a fresh interpreter and time it.
+
+    Returns:
+        Tuple with the total time in seconds, not counting interpreter startup,
+        and a list of (cumulative time, name) for every module imported along
+        the way.
+    """
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    # Lines look like "import time: self [us] | cumulative | imported package",
+    # with nested imports indented and listed before the one that needed them.
+    # Startup imports end with site.
+    total, imports = 0.0, []
+    is_started = False
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        is_top_level = not name.startswith("  ")
+        if not is_started:
+            is_started = is_top_level and name.strip() == "site"
+            continue
+        seconds = int(cumulative) / 1e6
+        imports.append((seconds, name.strip()))
+        if is_top_level:
+            total += seconds
+    return total, imports
+
+
+def get_heavy_imports(module: str) -> Set[str]:
+    """Import a module in a fresh interpreter and find out which heavy
+    dependencies come with it."""
+    code = f"import sys, {module}; print('\\n'.join(sys.modules))"
+    res = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return {name.split(".")[0] for name in res.stdout.split()} & HEAVY_MODULES
+
+
+def run(
+    modules: Optional[List[str]] = None, repeat: int = _DEFAULT_REPEAT
+) -> Dict[str, Dict]:
+    """Time module imports.
+
+    Args:
+        modules: Modules to import. Set None for all of them.
+        repeat: Number of times to import each module.
+
+    Returns:
+        Dict of best time, slowest imports and heavy dependencies, by module.
+    """
+    results = {}
+    for module in modules or BUDGETS:
+        runs = [get_import_times(module) for _ in range(repeat)]
+        best, imports = min(runs)
+        results[module] = {
+            "best": best,
+            "slowest": sorted(imports, reverse=True)[:10],
+            "heavy": sorted(get_heavy_imports(module)),
+        }
+    return results
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    """Check import times from the command line."""
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmark.imports",
+        description="Check Chomp's import times against their budgets.",
+    )
+    parser.add_argument("modules", nargs="*", help="modules to check (default: all)")
+    parser.add_argument(
+        "--repeat", type=int, default=_DEFAULT_REPEAT, help="imports per module"
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="show the slowest imports"
+    )
+    args = parser.parse_args(args)
+
+    failures = []
+    print("%-24s %10s %10s" % ("module", "budget", "best"))
+    for module, result in run(args.modules, args.repeat).items():
+        budget = BUDGETS.get(module, _DEFAULT_BUDGET)
+        status = ""
+        if result["heavy"]:
+            status = "IMPORTS " + ", ".join(result["heavy"])
+        elif result["best"] > budget:
+            status = "OVER BUDGET"
+        if status:
+            failures.append(module)
+        print(
+            "%-24s %8.1f ms %8.1f ms %s"
+            % (module, budget * 1e3, result["best"] * 1e3, status)
+        )
+        if args.verbose:
+            for seconds, name in result["slowest"]:
+                print("    %8.1f ms %s" % (seconds * 1e3, name))
+
+    if failures:
+        print("%i modules over budget: %s" % (len(failures), ", ".join(failures)))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""Load-test Google CSE and Wordpress collection against the stand-in server.
+
+Each run collects one query end to end: every response page from the API, then
+every article in them, fetched and cleaned the way the pipeline does it. The
+run is repeated for each number of workers asked for, so pooling, batching and
+scheduling changes can be compared under the same latency and faults.
+
+Usage:
+    python -m benchmark.load --latency 0.05 0.2 -w 1 4 16
+    python -m benchmark.load --api wordpress --error-rate 0.05 --rate-limit-rate 0.05
+    python -m benchmark.load --browser --max-sessions 4 -w 8
+"""
+import argparse
+import json
+import logging
+import sys
+from functools import partial
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+from unittest import mock
+
+from benchmark import fixtures, standin
+from benchmark.standin import StandIn
+from we1s_chomp import google, web, wordpress
+
+###############################################################################
+# Internal configuration parameters.                                          #
+###############################################################################
+
+
+_BROWSER_SLEEP = (0.01, 0.05)
+"""Tuple with minimum and maximum time to sleep between grid status checks, if
+no sleep is asked for. Browser waits for a grid slot by sleeping, so it can't
+be zero."""
+
+_DEFAULT_APIS = ["google", "wordpress"]
+"""Default APIs to collect from."""
+
+_DEFAULT_NUM_WORKERS = [1, 4, 16]
+"""Default numbers of workers to try."""
+
+_DEFAULT_PAGE_LIMIT = 10
+"""Default number of response pages to collect per run."""
+
+_DEFAULT_SLEEP = (0.0, 0.0)
+"""Default tuple with minimum and maximum time to sleep after each request."""
+
+
+###############################################################################
+# Load test functions.                                                        #
+###############################################################################
+
+
+def run(
+    server: StandIn,
+    api: str,
+    num_workers: int = 1,
+    num_clean_workers: int = 0,
+    page_limit: int = _DEFAULT_PAGE_LIMIT,
+    sleep_range: Tuple[float, float] = _DEFAULT_SLEEP,
+    browser: Optional[web.Browser] = None,
+) -> Dict:
+    """Collect one query from the stand-in server end to end.
+
+    Args:
+        server: Stand-in server to collect from.
+        api: "google" or "wordpress".
+        num_workers: Number of requests to make at once.
+        num_clean_workers: Number of processes to clean Google CSE articles
+            with, or 0 to clean them in this process.
+        page_limit: Stop after this # of response pages.
+        sleep_range: Min. and max. time to sleep after each request. Set it
+            on the Browser, if there is one.
+        browser: Selenium configuration pointed at the stand-in's grid. Set
+            None to use Requests module.
+
+    Returns:
+        Dict of results: counts, timing and the server's request stats.
+    """
+    server.reset()
+    url_stops = set()
+    num_responses = num_articles = 0
+    get = partial(web.get, sleep_range=sleep_range)
+    api_url = server.url + standin._GOOGLE_PATH
+    with mock.patch.object(web, "get", get), mock.patch.object(
+        google, "_API_URL", api_url
+    ):
+        start = perf_counter()
+        if api == "google":
+            responses = google.get_responses(
+                fixtures.QUERY_STR,
+                server.url,
+                google_cx="standin",
+                google_key="standin",
+                url_stops=url_stops,
+                page_limit=page_limit,
+                browser=browser,
+                num_workers=num_workers,
+            )
+        else:
+            responses = wordpress.get_responses(
+                fixtures.QUERY_STR,
+                server.url,
+                url_stops=url_stops,
+                page_limit=page_limit,
+                browser=browser,
+                num_workers=num_workers,
+            )
+
+        for _, response in responses:
+            num_responses += 1
+            if api == "google":
+                articles = google.get_metadata(
+                    response,
+                    fixtures.QUERY_STR,
+                    fixtures.START_DATE,
+                    fixtures.END_DATE,
+                    url_stops=url_stops,
+                    browser=browser,
+                    num_workers=num_workers,
+                    num_clean_workers=num_clean_workers,
+                )
+            else:
+                articles = wordpress.get_metadata(
+                    response,
+                    fixtures.QUERY_STR,
+                    fixtures.START_DATE,
+                    fixtures.END_DATE,
+                    url_stops=url_stops,
+                )
+            num_articles += sum(1 for _ in articles)
+        seconds = perf_counter() - start
+
+    return {
+        "api": api,
+        "num_workers": num_workers,
+        "responses": num_responses,
+        "articles": num_articles,
+        "seconds": seconds,
+        "articles_per_second": num_articles / seconds if seconds else 0.0,
+        "stats": dict(server.stats),
+    }
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    """Run load tests from the command line."""
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmark.load",
+        description="Load-test collection against a local stand-in server.",
+    )
+    parser.add_argument(
+        "--api",
+        nargs="+",
+        choices=_DEFAULT_APIS,
+        default=_DEFAULT_APIS,
+        help="APIs to collect from",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        nargs="+",
+        default=_DEFAULT_NUM_WORKERS,
+        help="numbers of workers to try (default: 1 4 16)",
+    )
+    parser.add_argument(
+        "--clean-workers",
+        type=int,
+        default=0,
+        help="processes to clean Google CSE articles with",
+    )
+    parser.add_argument(
+        "--pages",
+        type=int,
+        default=_DEFAULT_PAGE_LIMIT,
+        help="response pages to collect per run",
+    )
+    parser.add_argument(
+        "--sleep",
+        type=float,
+        nargs=2,
+        default=_DEFAULT_SLEEP,
+        metavar=("MIN", "MAX"),
+        help="range of time in seconds to sleep after each request",
+    )
+    parser.add_argument(
+        "--browser",
+        action="store_true",
+        help="collect through the stand-in's Selenium Grid",
+    )
+    parser.add_argument("--json", help="save results to this file")
+    standin.add_arguments(parser)
+    args = parser.parse_args(args)
+
+    # Don't time the console.
+    logging.disable(logging.CRITICAL)
+
+    results = []
+    columns = ("api", "workers", "responses", "articles", "seconds", "articles/s")
+    print("%-10s %7s %9s %8s %9s %10s %7s %5s" % (columns + ("errors", "peak")))
+    with standin.from_args(args) as server:
+        browser = None
+        if args.browser:
+            sleep_range = tuple(args.sleep) if max(args.sleep) else _BROWSER_SLEEP
+            browser = web.Browser(server.url, sleep_range=sleep_range, timeout=10.0)
+        for api in args.api:
+            for num_workers in args.workers:
+                result = run(
+                    server,
+                    api,
+                    num_workers=num_workers,
+                    num_clean_workers=args.clean_workers,
+                    page_limit=args.pages,
+                    sleep_range=tuple(args.sleep),
+                    browser=browser,
+                )
+                results.append(result)
+                errors = sum(
+                    count
+                    for key, count in result["stats"].items()
+                    if key.endswith((" 429", " 500"))
+                )
+                print(
+                    "%-10s %7i %9i %8i %9.2f %10.1f %7i %5i"
+                    % (
+                        api,
+                        num_workers,
+                        result["responses"],
+                        result["articles"],
+                        result["seconds"],
+                        result["articles_per_second"],
+                        errors,
+                        result["stats"].get("peak_in_flight", 0),
+                    )
+                )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as jsonfile:
+            json.dump(results, jsonfile, indent=4)
+        print("Saved results: %s" % args.json)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
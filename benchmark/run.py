@@ -0,0 +1,347 @@
+"""Run the benchmarks and compare them against a baseline.
+
+Each benchmark is timed with timeit: enough calls to fill a fraction of a
+second, repeated a few times, keeping the best (least disturbed) time per call.
+A benchmark counts as a regression if it's slower than the baseline by more
+than the threshold; the run then exits with status 1. Quick runs time single
+cold calls (first-use imports and all), so they aren't compared.
+"""
+import argparse
+import json
+import logging
+import platform
+import sys
+from datetime import datetime
+from pathlib import Path
+from statistics import median
+from tempfile import TemporaryDirectory
+from timeit import Timer
+from typing import Callable, Dict, List, Optional
+from unittest import mock
+
+from benchmark import fixtures
+from we1s_chomp import clean, db, google, model, web, wordpress
+from we1s_chomp.corpus import Corpus
+from we1s_chomp.model import Article
+
+###############################################################################
+# Internal configuration parameters.                                          #
+###############################################################################
+
+
+_DEFAULT_BASELINE = Path(__file__).parent / "baseline.json"
+"""Default file to keep baseline results in."""
+
+_DEFAULT_NUM_MANIFESTS = 500
+"""Default number of articles in the synthetic manifest directory."""
+
+_DEFAULT_REPEAT = 5
+"""Default number of times to repeat each benchmark."""
+
+_DEFAULT_THRESHOLD = 0.2
+"""Default slowdown (as a fraction of the baseline) that counts as a
+regression."""
+
+BENCHMARKS = {}
+"""Benchmark setup functions, by name."""
+
+
+###############################################################################
+# Environment class.                                                          #
+###############################################################################
+
+
+class Environment:
+    """Fixtures and scratch space shared by the benchmarks.
+
+    web.get() is swapped for a stand-in that serves the article fixtures for
+    as long as the environment is open, so nothing goes online.
+    """
+
+    def __init__(self, num_manifests: int = _DEFAULT_NUM_MANIFESTS):
+        self.num_manifests = num_manifests
+        self.tempdir = TemporaryDirectory()
+        self.dirpath = Path(self.tempdir.name)
+        self.articles = list(fixtures.load_articles().values())
+        self.google = fixtures.load_google()
+        self.wordpress = fixtures.load_wordpress()
+        self.manifests_dirpath = self.dirpath / "manifests"
+        self.manifest_names = fixtures.make_manifests(
+            self.manifests_dirpath, num_manifests
+        )
+        self.patch = mock.patch.object(
+            web, "get", fixtures.get_collector(self.articles)
+        )
+        self.patch.start()
+
+    def close(self) -> None:
+        self.patch.stop()
+        self.tempdir.cleanup()
+
+
+###############################################################################
+# Benchmarks.                                                                 #
+###############################################################################
+
+
+def benchmark(name: str) -> Callable:
+    """Decorator to register a benchmark.
+
+    The decorated function takes an Environment and returns the function to
+    time.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        BENCHMARKS[name] = func
+        return func
+
+    return decorator
+
+
+@benchmark("clean.get_content")
+def bench_get_content(env: Environment) -> Callable:
+    return lambda: [clean.get_content(page) for page in env.articles]
+
+
+@benchmark("clean.str_to_date")
+def bench_str_to_date(env: Environment) -> Callable:
+    date_range = (fixtures.START_DATE, fixtures.END_DATE)
+    date_strs = [
+        "2019-05-02T10:04:51",
+        "2019-03-14T08:30:00Z",
+        "Mar 14, 2019",
+        "14 March 2019",
+        "3 days ago",
+    ]
+    return lambda: [clean.str_to_date(s, date_range) for s in date_strs]
+
+
+def get_article(env: Environment) -> Article:
+    return Article(
+        name="chomp_benchmark_0",
+        url="https://www.dailycourier.example.com/education/story-0/",
+        title="Story 0",
+        pub_date=fixtures.START_DATE,
+        content_html=env.articles[0],
+        content=clean.get_content(env.articles[0]),
+    )
+
+
+@benchmark("model.to_json")
+def bench_to_json(env: Environment) -> Callable:
+    article = get_article(env)
+    return lambda: json.dumps(article, default=model.to_json)
+
+
+@benchmark("model.from_json")
+def bench_from_json(env: Environment) -> Callable:
+    article_json = json.dumps(get_article(env), default=model.to_json)
+    return lambda: json.loads(article_json, object_hook=model.from_json)
+
+
+@benchmark("db.save_manifest_file")
+def bench_save_manifest_file(env: Environment) -> Callable:
+    article = get_article(env)
+    dirpath = env.dirpath / "save"
+    return lambda: db.save_manifest_file(article, dirpath)
+
+
+@benchmark("db.load_manifest_file")
+def bench_load_manifest_file(env: Environment) -> Callable:
+    name = env.manifest_names[-1]
+    return lambda: db.load_manifest_file(name, env.manifests_dirpath)
+
+
+@benchmark("corpus.Corpus.load")
+def bench_corpus_load(env: Environment) -> Callable:
+    return lambda: Corpus(env.manifests_dirpath).load()
+
+
+@benchmark("web.is_url_ok")
+def bench_is_url_ok(env: Environment) -> Callable:
+    url_stops = {f"https://www.dailycourier.example.com/{i}/" for i in range(10000)}
+    url_stopwords = {f"stopword{i}" for i in range(50)}
+    urls = [f"https://www.dailycourier.example.com/{i}/" for i in range(0, 20000, 20)]
+    return lambda: [web.is_url_ok(url, url_stops, url_stopwords) for url in urls]
+
+
+@benchmark("google.get_metadata")
+def bench_google_get_metadata(env: Environment) -> Callable:
+    return lambda: list(
+        google.get_metadata(
+            env.google,
+            fixtures.QUERY_STR,
+            fixtures.START_DATE,
+            fixtures.END_DATE,
+            url_stops=set(),
+        )
+    )
+
+
+@benchmark("wordpress.get_metadata")
+def bench_wordpress_get_metadata(env: Environment) -> Callable:
+    return lambda: list(
+        wordpress.get_metadata(
+            env.wordpress,
+            fixtures.QUERY_STR,
+            fixtures.START_DATE,
+            fixtures.END_DATE,
+            url_stops=set(),
+        )
+    )
+
+
+###############################################################################
+# Runner functions.                                                           #
+###############################################################################
+
+
+def run(
+    names: Optional[List[str]] = None,
+    num_manifests: int = _DEFAULT_NUM_MANIFESTS,
+    repeat: int = _DEFAULT_REPEAT,
+    number: Optional[int] = None,
+) -> Dict:
+    """Run benchmarks.
+
+    Args:
+        names: Names of benchmarks to run. Set None for all of them.
+        num_manifests: Number of articles in the synthetic manifest directory.
+        repeat: Number of times to repeat each benchmark.
+        number: Number of calls per repeat. Set None to pick enough to fill
+            about 0.2 seconds.
+
+    Returns:
+        Dict of results, ready to save as a baseline.
+    """
+    results = {}
+    env = Environment(num_manifests)
+    try:
+        for name in BENCHMARKS if names is None else names:
+            timer = Timer(BENCHMARKS[name](env))
+            calls = number or timer.autorange()[0]
+            times = [t / calls for t in timer.repeat(repeat, calls)]
+            results[name] = {"best": min(times), "median": median(times)}
+            print("%-28s %12s" % (name, format_time(min(times))), file=sys.stderr)
+    finally:
+        env.close()
+
+    return {
+        "date": datetime.now().replace(microsecond=0).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "num_manifests": num_manifests,
+        "results": results,
+    }
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Compare results against a baseline and print a report.
+
+    Returns:
+        Names of the benchmarks that regressed.
+    """
+    regressions = []
+    print("%-28s %12s %12s %8s" % ("benchmark", "baseline", "current", "ratio"))
+    for name, result in results["results"].items():
+        if name not in baseline["results"]:
+            print("%-28s %12s %12s" % (name, "-", format_time(result["best"])))
+            continue
+        before = baseline["results"][name]["best"]
+        ratio = result["best"] / before
+        status = ""
+        if ratio > 1 + threshold:
+            status = "REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 / (1 + threshold):
+            status = "improved"
+        print(
+            "%-28s %12s %12s %7.2fx %s"
+            % (name, format_time(before), format_time(result["best"]), ratio, status)
+        )
+    return regressions
+
+
+def format_time(seconds: float) -> str:
+    """Format a time per call for humans."""
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return "%.2f %s" % (seconds / scale, unit)
+    return "%.0f ns" % (seconds / 1e-9)
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    """Run benchmarks from the command line."""
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmark.run", description="Benchmark Chomp's hot paths."
+    )
+    parser.add_argument(
+        "-k",
+        dest="keyword",
+        default="",
+        help="only run benchmarks whose names contain this",
+    )
+    parser.add_argument(
+        "--baseline", type=Path, default=_DEFAULT_BASELINE, help="baseline file"
+    )
+    parser.add_argument(
+        "--save", action="store_true", help="save results as the new baseline"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=_DEFAULT_THRESHOLD,
+        help="slowdown that counts as a regression (default: 0.2, i.e. 20%%)",
+    )
+    parser.add_argument(
+        "--manifests",
+        type=int,
+        default=_DEFAULT_NUM_MANIFESTS,
+        help="number of articles in the synthetic manifest directory",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=_DEFAULT_REPEAT, help="repeats per benchmark"
+    )
+    parser.add_argument(
+        "--quick", action="store_true", help="one call per benchmark, for smoke tests"
+    )
+    args = parser.parse_args(args)
+
+    # Don't time the console.
+    logging.disable(logging.CRITICAL)
+
+    names = [name for name in BENCHMARKS if args.keyword in name]
+    if not names:
+        parser.error('no benchmarks match "%s"' % args.keyword)
+    results = run(
+        names,
+        num_manifests=args.manifests,
+        repeat=1 if args.quick else args.repeat,
+        number=1 if args.quick else None,
+    )
+
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as jsonfile:
+            json.dump(results, jsonfile, indent=4)
+        print("Saved baseline: %s" % args.baseline)
+        return 0
+    if args.quick:
+        print("Quick run; not comparing against the baseline.")
+        return 0
+    if not args.baseline.exists():
+        print("No baseline to compare against: %s" % args.baseline)
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as jsonfile:
+        baseline = json.load(jsonfile)
+    if baseline.get("num_manifests") != args.manifests:
+        print("Warning: baseline used %s manifests." % baseline.get("num_manifests"))
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print("%i regressions: %s" % (len(regressions), ", ".join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
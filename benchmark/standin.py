@@ -0,0 +1,536 @@
+"""Local stand-in for the sites, APIs and Selenium Grid Chomp talks to.
+
+One threaded HTTP server plays every part:
+
+- A Selenium Grid hub: /wd/hub/status and enough of the WebDriver session API
+    for Browser.get() (new session, navigate, page source, find element,
+    element text, timeouts, DevTools commands, quit).
+- The Google CSE API at /customsearch/v1, serving the recorded result page
+    over and over with fresh links.
+- A Wordpress API at /wp-json/wp/v2, with a route index, pagination headers
+    and _envelope support, serving the recorded posts.
+- Article pages at every other path, from the recorded article fixtures.
+
+Every request except grid status and session bookkeeping can be slowed down or
+made to fail: latency is drawn from a range, and a fraction of requests get a
+500 or a 429. The grid can be given a fixed number of slots, so a Browser pool
+bigger than the grid runs out of them the way it would in production. Browser
+navigation goes through the same routes (whatever the host), so faults apply
+there too.
+
+Usage:
+    python -m benchmark.standin --port 4444 --latency 0.05 0.2 --error-rate 0.01
+"""
+import argparse
+import html
+import json
+import random
+from collections import Counter
+from copy import deepcopy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from math import ceil
+from threading import Lock, Thread
+from time import sleep
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+from uuid import uuid4
+
+from benchmark import fixtures
+
+###############################################################################
+# Internal configuration parameters.                                          #
+###############################################################################
+
+
+_DEFAULT_NUM_RESULTS = 100
+"""Default number of results each API claims to have for a query."""
+
+_DEFAULT_RETRY_AFTER = 1
+"""Retry-After value in seconds sent with 429 responses."""
+
+_ELEMENT_KEY = "element-6066-11e4-a52e-4f735466cecf"
+"""W3C WebDriver key for element references."""
+
+_GOOGLE_PATH = "/customsearch/v1"
+"""Path of the Google CSE API."""
+
+_GOOGLE_PER_PAGE = 10
+"""Number of results per Google CSE API page."""
+
+_HUB_PATH = "/wd/hub"
+"""Path of the Selenium Grid hub."""
+
+_JSON_PAGE = (
+    "<html><head></head><body>"
+    '<pre style="word-wrap: break-word; white-space: pre-wrap;">%s</pre>'
+    "</body></html>"
+)
+"""How Chrome renders a JSON response as a page."""
+
+_WORDPRESS_PATH = "/wp-json/wp/v2"
+"""Path of the Wordpress API."""
+
+
+###############################################################################
+# StandIn class.                                                              #
+###############################################################################
+
+
+class StandIn:
+    """Stand-in server, running in a background thread.
+
+    Use it as a context manager, or call start() and close(). Request counts
+    by kind and status are kept in stats, along with the most requests and
+    sessions there were at once.
+    """
+
+    def __init__(
+        self,
+        latency: Tuple[float, float] = (0.0, 0.0),
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        max_sessions: int = -1,
+        num_results: int = _DEFAULT_NUM_RESULTS,
+        seed: Optional[int] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        """Create a new stand-in server.
+
+        Args:
+            latency: Tuple with minimum and maximum time in seconds to take
+                over each response.
+            error_rate: Fraction of responses to fail with a 500.
+            rate_limit_rate: Fraction of responses to fail with a 429.
+            max_sessions: Number of grid slots, or -1 for no limit.
+            num_results: Number of results each API claims to have.
+            seed: Random seed, for repeatable faults.
+            host: Address to listen on.
+            port: Port to listen on, or 0 for any free port.
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.max_sessions = max_sessions
+        self.num_results = num_results
+        self.random = random.Random(seed)
+        self.lock = Lock()
+        self.sessions = {}
+        self.stats = Counter()
+        self.in_flight = 0
+
+        self.articles = list(fixtures.load_articles().values())
+        self.google = json.loads(fixtures.load_google())
+        self.wordpress = json.loads(fixtures.load_wordpress())
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.server.standin = self
+        self.url = "http://%s:%i" % self.server.server_address[:2]
+        self.thread = None
+
+    def __enter__(self) -> "StandIn":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def start(self) -> "StandIn":
+        """Start serving in a background thread."""
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self) -> None:
+        """Stop serving and close the socket."""
+        if self.thread is not None:
+            self.server.shutdown()
+            self.thread.join()
+        self.server.server_close()
+
+    def reset(self) -> None:
+        """Clear stats and close any sessions left open."""
+        with self.lock:
+            self.sessions.clear()
+            self.stats.clear()
+
+    def handle(
+        self, method: str, path: str, data: Optional[Dict] = None
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        """Answer a request.
+
+        Returns:
+            Tuple with the status code, headers and body.
+        """
+        if path.startswith(_HUB_PATH + "/"):
+            return self.handle_grid(method, path[len(_HUB_PATH) :], data or {})
+
+        status, headers, body = self.fetch(path)
+        return status, headers, body.encode("utf-8")
+
+    def fetch(self, path: str) -> Tuple[int, Dict[str, str], str]:
+        """Get a page and count it in the stats.
+
+        Returns:
+            Tuple with the status code, headers and body.
+        """
+        with self.lock:
+            self.in_flight += 1
+            self.stats["peak_in_flight"] = max(
+                self.stats["peak_in_flight"], self.in_flight
+            )
+        try:
+            kind, status, headers, body = self.get_page(path)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+        with self.lock:
+            self.stats["%s %i" % (kind, status)] += 1
+        return status, headers, body
+
+    ###########################################################################
+    # Sites and APIs.                                                         #
+    ###########################################################################
+
+    def get_page(self, path: str) -> Tuple[str, int, Dict[str, str], str]:
+        """Get a page, faults and all.
+
+        Returns:
+            Tuple with the kind of page ("google", "wordpress" or "article"),
+            status code, headers and body.
+        """
+        url = urlsplit(path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if "_envelope" in url.query.split("&"):
+            params["_envelope"] = ""
+        kind = "article"
+        if url.path == _GOOGLE_PATH:
+            kind = "google"
+        elif url.path.startswith("/wp-json"):
+            kind = "wordpress"
+
+        # Take our time, then maybe fall over.
+        with self.lock:
+            delay = self.random.uniform(*self.latency)
+            roll = self.random.random()
+        sleep(delay)
+        headers = {"Content-Type": "text/html"}
+        if roll < self.error_rate:
+            return kind, 500, headers, "<h1>500 Internal Server Error</h1>"
+        if roll < self.error_rate + self.rate_limit_rate:
+            headers["Retry-After"] = str(_DEFAULT_RETRY_AFTER)
+            return kind, 429, headers, "<h1>429 Too Many Requests</h1>"
+
+        headers = {"Content-Type": "application/json; charset=UTF-8"}
+        if kind == "google":
+            return kind, 200, headers, json.dumps(self.get_google(params))
+        if kind == "wordpress":
+            status, body, wp_headers = self.get_wordpress(url.path, params)
+            return kind, status, {**headers, **wp_headers}, json.dumps(body)
+        page = self.articles[sum(map(ord, url.path)) % len(self.articles)]
+        return kind, 200, {"Content-Type": "text/html; charset=utf-8"}, page
+
+    def get_google(self, params: Dict[str, str]) -> Dict:
+        """Get a Google CSE API result page."""
+        start = int(params.get("start", 1))
+        num_pages = ceil(self.num_results / _GOOGLE_PER_PAGE)
+        page = (start - 1) // _GOOGLE_PER_PAGE + 1
+
+        res = deepcopy(self.google)
+        request = res["queries"]["request"][0]
+        request.update(startIndex=start, searchTerms=params.get("q", ""))
+        if page >= num_pages:
+            del res["queries"]["nextPage"]
+        else:
+            res["queries"]["nextPage"][0]["startIndex"] = start + _GOOGLE_PER_PAGE
+        if page > num_pages:
+            del res["items"]
+            res["searchInformation"]["totalResults"] = "0"
+            return res
+
+        for i, item in enumerate(res["items"]):
+            n = start + i
+            item["link"] = f"{self.url}/education/story-{n}/"
+            item["displayLink"] = self.url.split("//")[1]
+            item["title"] = item["title"].replace(" 0 ", f" {n} ")
+        return res
+
+    def get_wordpress(
+        self, path: str, params: Dict[str, str]
+    ) -> Tuple[int, object, Dict[str, str]]:
+        """Get a Wordpress API response.
+
+        Returns:
+            Tuple with status code, body and pagination headers.
+        """
+        path = path.rstrip("/")
+        headers = {}
+        if path in {"/wp-json", _WORDPRESS_PATH}:
+            status, body = 200, self.get_wordpress_index()
+        elif path == _WORDPRESS_PATH + "/posts":
+            per_page = int(params.get("per_page", 10))
+            page = int(params.get("page", 1))
+            num_pages = ceil(self.num_results / per_page)
+            headers["X-WP-Total"] = str(self.num_results)
+            headers["X-WP-TotalPages"] = str(num_pages)
+            if not 1 <= page <= max(num_pages, 1):
+                status, body = get_wordpress_error(
+                    400,
+                    "rest_post_invalid_page_number",
+                    "The page number requested is larger than the number of "
+                    "pages available.",
+                )
+            else:
+                start = (page - 1) * per_page
+                stop = min(start + per_page, self.num_results)
+                body = [self.get_post(n) for n in range(start, stop)]
+                if params.get("_fields"):
+                    fields = params["_fields"].split(",")
+                    body = [{k: v for k, v in p.items() if k in fields} for p in body]
+                status = 200
+        else:
+            status, body = get_wordpress_error(
+                404,
+                "rest_no_route",
+                "No route was found matching the URL and request method.",
+            )
+
+        # Enveloped responses always come back OK, with the rest inside.
+        if "_envelope" in params:
+            return 200, {"body": body, "status": status, "headers": headers}, {}
+        return status, body, headers
+
+    def get_wordpress_index(self) -> Dict:
+        """Get the Wordpress API route index."""
+        args = {"search": {"required": False}, "page": {"required": False}}
+        return {
+            "namespace": "wp/v2",
+            "routes": {
+                "/wp/v2": {"methods": ["GET"], "endpoints": []},
+                "/wp/v2/posts": {
+                    "methods": ["GET", "POST"],
+                    "endpoints": [
+                        {"methods": ["GET"], "args": args},
+                        {"methods": ["POST"], "args": {}},
+                    ],
+                },
+            },
+        }
+
+    def get_post(self, n: int) -> Dict:
+        """Get the nth post, made from the recorded posts."""
+        post = deepcopy(self.wordpress[n % len(self.wordpress)])
+        post["id"] = n + 1
+        post["slug"] = "%s-%i" % (post["slug"], n)
+        post["link"] = "%s/%s/%s/" % (
+            self.url,
+            post["date"][:10].replace("-", "/"),
+            post["slug"],
+        )
+        return post
+
+    ###########################################################################
+    # Selenium Grid.                                                          #
+    ###########################################################################
+
+    def is_full(self) -> bool:
+        """Check if every grid slot is taken. Call with the lock held."""
+        return self.max_sessions != -1 and len(self.sessions) >= self.max_sessions
+
+    def handle_grid(
+        self, method: str, path: str, data: Dict
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        """Answer a Selenium Grid request, W3C WebDriver style."""
+        status, value = self.get_grid(method, path.rstrip("/").split("/")[1:], data)
+        with self.lock:
+            self.stats["grid %i" % status] += 1
+        body = json.dumps({"value": value}).encode("utf-8")
+        return status, {"Content-Type": "application/json; charset=utf-8"}, body
+
+    def get_grid(self, method: str, parts: List[str], data: Dict) -> Tuple[int, object]:
+        """Carry out a WebDriver command.
+
+        Args:
+            method: HTTP method.
+            parts: Path components after the hub path, e.g. ["session", id,
+                "url"].
+            data: Command parameters.
+
+        Returns:
+            Tuple with status code and value.
+        """
+        if parts == ["status"]:
+            with self.lock:
+                ready = not self.is_full()
+            message = "Ready" if ready else "No free slots"
+            return 200, {"ready": ready, "message": message}
+
+        # New session, if there's a slot for it.
+        if parts == ["session"] and method == "POST":
+            with self.lock:
+                if self.is_full():
+                    return get_grid_error(500, "session not created", "No free slots")
+                session_id = uuid4().hex
+                self.sessions[session_id] = {"url": "about:blank", "source": ""}
+                self.stats["peak_sessions"] = max(
+                    self.stats["peak_sessions"], len(self.sessions)
+                )
+            capabilities = data.get("capabilities", {}).get("alwaysMatch", {})
+            return 200, {
+                "sessionId": session_id,
+                "capabilities": {"browserName": "chrome", **capabilities},
+            }
+
+        if len(parts) < 2 or parts[0] != "session" or parts[1] not in self.sessions:
+            return get_grid_error(404, "invalid session id", "No such session")
+        session = self.sessions[parts[1]]
+        command = parts[2:]
+
+        if not command and method == "DELETE":
+            with self.lock:
+                self.sessions.pop(parts[1], None)
+            return 200, None
+        if command in (["timeouts"], ["goog", "cdp", "execute"]):
+            return 200, None
+        if command == ["url"] and method == "POST":
+            session["url"] = data.get("url", "")
+            url = urlsplit(session["url"])
+            _, headers, body = self.fetch(
+                url.path + ("?" + url.query if url.query else "")
+            )
+            session["text"] = body
+            session["source"] = body
+            if headers["Content-Type"].startswith("application/json"):
+                session["source"] = _JSON_PAGE % html.escape(body)
+            return 200, None
+        if command == ["url"]:
+            return 200, session["url"]
+        if command == ["source"]:
+            return 200, session["source"]
+        if command == ["element"] and method == "POST":
+            selector = data.get("value", "")
+            if selector.isalnum() and "<" + selector not in session["source"]:
+                return get_grid_error(404, "no such element", "No " + selector)
+            return 200, {_ELEMENT_KEY: selector}
+        if len(command) == 3 and command[0] == "element" and command[2] == "text":
+            return 200, session["text"] if command[1] == "pre" else ""
+
+        return get_grid_error(404, "unknown command", "/".join(parts))
+
+
+###############################################################################
+# Handler class.                                                              #
+###############################################################################
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Hand requests to the StandIn they came in for."""
+
+    def do_GET(self):
+        self.respond("GET")
+
+    def do_POST(self):
+        self.respond("POST")
+
+    def do_DELETE(self):
+        self.respond("DELETE")
+
+    def respond(self, method: str) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        data = json.loads(self.rfile.read(length) or "null") if length else None
+        status, headers, body = self.server.standin.handle(method, self.path, data)
+        self.send_response(status)
+        for header, value in headers.items():
+            self.send_header(header, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+###############################################################################
+# Helper functions.                                                           #
+###############################################################################
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the stand-in's fault options to a command line parser."""
+    parser.add_argument(
+        "--latency",
+        type=float,
+        nargs=2,
+        default=(0.0, 0.0),
+        metavar=("MIN", "MAX"),
+        help="range of time in seconds to take over each response",
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="fraction of 500 responses"
+    )
+    parser.add_argument(
+        "--rate-limit-rate", type=float, default=0.0, help="fraction of 429 responses"
+    )
+    parser.add_argument(
+        "--max-sessions",
+        type=int,
+        default=-1,
+        help="number of Selenium Grid slots (default: no limit)",
+    )
+    parser.add_argument(
+        "--results",
+        type=int,
+        default=_DEFAULT_NUM_RESULTS,
+        help="number of results each API claims to have",
+    )
+    parser.add_argument("--seed", type=int, help="random seed for faults")
+
+
+def from_args(args: argparse.Namespace, **kwargs) -> StandIn:
+    """Create a StandIn from options added with add_arguments()."""
+    return StandIn(
+        latency=tuple(args.latency),
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        max_sessions=args.max_sessions,
+        num_results=args.results,
+        seed=args.seed,
+        **kwargs,
+    )
+
+
+def get_grid_error(status: int, error: str, message: str) -> Tuple[int, Dict]:
+    """Get a W3C WebDriver error response."""
+    return status, {"error": error, "message": message, "stacktrace": ""}
+
+
+def get_wordpress_error(status: int, code: str, message: str) -> Tuple[int, Dict]:
+    """Get a Wordpress API error response."""
+    return status, {"code": code, "message": message, "data": {"status": status}}
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    """Run the stand-in server from the command line."""
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmark.standin",
+        description="Serve stand-ins for the Google CSE and Wordpress APIs, "
+        "article pages and a Selenium Grid hub.",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=4444, help="port to listen on")
+    add_arguments(parser)
+    args = parser.parse_args(args)
+
+    standin = from_args(args, host=args.host, port=args.port)
+    print("Serving on %s (Ctrl+C to stop)" % standin.url)
+    try:
+        standin.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        standin.server.server_close()
+        print(dict(standin.stats))
+
+
+if __name__ == "__main__":
+    main()
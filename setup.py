@@ -16,11 +16,16 @@
         "dateparser",
         "html5lib",
         "nbfilter",
-        "regex",
         "requests",
         "selenium",
         "unidecode",
     ],
+    entry_points={
+        "console_scripts": [
+            "chomp=we1s_chomp.pipeline:main",
+            "chomp-search=we1s_chomp.index:main",
+        ]
+    },
     license=we1s_chomp.__license__,
     url=we1s_chomp.__url__,
 )
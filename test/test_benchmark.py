@@ -0,0 +1,76 @@
+import json
+import logging
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import requests
+
+from benchmark import load, run
+from benchmark.standin import StandIn
+
+
+class TestBenchmark(unittest.TestCase):
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_run(self):
+        with TemporaryDirectory() as tempdir:
+            filename = Path(tempdir) / "baseline.json"
+            args = ["--quick", "--manifests", "3", "--baseline", str(filename)]
+            self.assertEqual(run.main(args + ["--save"]), 0)
+            with open(filename, encoding="utf-8") as jsonfile:
+                baseline = json.load(jsonfile)
+            self.assertSetEqual(set(baseline["results"]), set(run.BENCHMARKS))
+
+            # Nothing can be that fast, but quick runs aren't compared.
+            for result in baseline["results"].values():
+                result["best"] = 1e-12
+            with open(filename, "w", encoding="utf-8") as jsonfile:
+                json.dump(baseline, jsonfile)
+            self.assertEqual(run.main(args + ["-k", "is_url_ok"]), 0)
+            args[:1] = ["--repeat", "1"]
+            self.assertEqual(run.main(args + ["-k", "is_url_ok"]), 1)
+
+            # Asking for benchmarks that don't exist is an error.
+            with self.assertRaises(SystemExit):
+                run.main(args + ["-k", "no_such_benchmark"])
+
+    def test_load(self):
+        with StandIn(seed=0, num_results=30) as server:
+            result = load.run(server, "google", num_workers=4, page_limit=2)
+            self.assertEqual(result["responses"], 2)
+            self.assertEqual(result["articles"], 20)
+            self.assertEqual(result["stats"]["article 200"], 20)
+
+            result = load.run(server, "wordpress", num_workers=4)
+            self.assertEqual(result["articles"], 30)
+
+            # Every API request fails, so there's nothing to collect.
+            server.error_rate = 1.0
+            result = load.run(server, "google")
+            self.assertEqual(result["responses"], 0)
+            self.assertEqual(result["stats"]["google 500"], 1)
+
+    def test_grid(self):
+        with StandIn(max_sessions=1) as server:
+            url = server.url + "/wd/hub"
+            res = requests.post(url + "/session", json={"capabilities": {}})
+            session_url = url + "/session/" + res.json()["value"]["sessionId"]
+            self.assertFalse(requests.get(url + "/status").json()["value"]["ready"])
+            res = requests.post(url + "/session", json={"capabilities": {}})
+            self.assertEqual(res.json()["value"]["error"], "session not created")
+
+            # Navigate to a JSON page and read it back the way Browser.get() does.
+            page_url = "https://example.com/wp-json/wp/v2/posts?search=x&_fields=link"
+            requests.post(session_url + "/url", json={"url": page_url})
+            res = requests.post(
+                session_url + "/element",
+                json={"using": "css selector", "value": "pre"},
+            )
+            element_id = next(iter(res.json()["value"].values()))
+            res = requests.get(session_url + "/element/%s/text" % element_id)
+            self.assertEqual(len(json.loads(res.json()["value"])), 10)
+
+            requests.delete(session_url)
+            self.assertTrue(requests.get(url + "/status").json()["value"]["ready"])
@@ -0,0 +1,80 @@
+import unittest
+from datetime import datetime, timezone
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import perf_counter, sleep
+
+from we1s_chomp import google
+from we1s_chomp.cache import Cache
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+        self.dirpath = Path(self.tempdir.name)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_cache(self):
+        cache = Cache(self.dirpath / "cache")
+        key = [("q", "humanities"), ("siteSearch", "we1s.ucsb.edu"), ("start", "1")]
+        self.assertNotIn(key, cache)
+        self.assertIsNone(cache.get(key))
+
+        cache.set(key, {"items": [{"link": "http://we1s.ucsb.edu"}]})
+        self.assertIn(key, cache)
+        self.assertDictEqual(
+            cache.get(key), {"items": [{"link": "http://we1s.ucsb.edu"}]}
+        )
+
+        # Stale entries are treated as missing.
+        self.assertNotIn(key, Cache(self.dirpath / "cache", ttl=-0.001))
+
+        cache.delete(key)
+        self.assertIsNone(Cache(self.dirpath / "cache").get(key))
+
+    def test_cache_key(self):
+        key = google.get_cache_key(google.get_url("humanities", "we1s.ucsb.edu", 2))
+        self.assertIn(("start", "11"), key)
+        self.assertIn(("siteSearch", "we1s.ucsb.edu"), key)
+        self.assertNotIn("cx", [k for k, _ in key])
+
+    def test_quota(self):
+        filename = self.dirpath / "quota.json"
+        quota = google.Quota(filename, daily_limit=2, min_interval=0)
+        self.assertTrue(quota.acquire("humanities"))
+        self.assertTrue(quota.acquire("humanities"))
+        self.assertFalse(quota.acquire("science"))
+        self.assertDictEqual(quota.report(), {"humanities": 2})
+
+        # The count survives between instances.
+        quota = google.Quota(filename, daily_limit=3, min_interval=0)
+        self.assertTrue(quota.acquire("science"))
+        self.assertDictEqual(quota.report(), {"humanities": 2, "science": 1})
+
+    def test_quota_waits_unlocked(self):
+        quota = google.Quota(self.dirpath / "quota.json", min_interval=0.5)
+        self.assertTrue(quota.acquire("humanities"))
+        waiting = Thread(target=quota.acquire, args=["humanities"])
+        waiting.start()
+        sleep(0.1)
+
+        # Another thread can get at the quota while that one waits its turn.
+        time_start = perf_counter()
+        with quota.locked():
+            self.assertLess(perf_counter() - time_start, 0.1)
+        waiting.join()
+        self.assertDictEqual(quota.report(), {"humanities": 2})
+
+    def test_quota_reset(self):
+        hours = {
+            datetime(2024, 1, 15, 12, tzinfo=timezone.utc): 20,  # PST
+            datetime(2024, 7, 15, 12, tzinfo=timezone.utc): 19,  # PDT
+            datetime(2024, 3, 10, 8, tzinfo=timezone.utc): 23,  # Spring forward.
+        }
+        for now, num_hours in hours.items():
+            self.assertEqual(google.get_quota_reset(now), num_hours * 3600)
+        now = datetime(2024, 7, 15, 6, 30, tzinfo=timezone.utc)
+        self.assertEqual(google.get_quota_day(now), "2024-07-14")
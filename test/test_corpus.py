@@ -0,0 +1,145 @@
+import unittest
+from datetime import datetime
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from we1s_chomp import model
+from we1s_chomp.corpus import Corpus
+
+
+class TestCorpus(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+        self.dirpath = Path(self.tempdir.name)
+
+        # Build a small corpus: one source, one query, two responses and one
+        # article from the first response.
+        corpus = Corpus(self.dirpath)
+        corpus.save(model.Source(name="we1s", webpage="http://we1s.ucsb.edu", tags=[]))
+        query = model.Query(
+            source_name="we1s",
+            query_str="humanities",
+            start_date=datetime(year=2000, month=1, day=1),
+            end_date=datetime(year=2019, month=12, day=31),
+        )
+        corpus.save(query)
+        for i in range(2):
+            corpus.save(
+                model.Response(
+                    name=f"chomp-response_{query.name}_{i}",
+                    url=f"http://we1s.ucsb.edu/?page={i}",
+                    source_name="we1s",
+                    query_name=query.name,
+                )
+            )
+        corpus.save(
+            model.Article(
+                name=f"chomp_{query.name}_0",
+                url="http://we1s.ucsb.edu/hello",
+                pub_date=datetime(year=2019, month=12, day=31),
+                content_html="<p>Hello!</p>",
+                content="Hello!",
+                source_name="we1s",
+                query_name=query.name,
+                response_name=f"chomp-response_{query.name}_0",
+            )
+        )
+        self.query_name = query.name
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_load(self):
+        corpus = Corpus(self.dirpath).load()
+        self.assertEqual(len(corpus), 5)
+        self.assertListEqual(corpus.get_names(model.Source), ["we1s"])
+        header = corpus.get_header(f"chomp_{self.query_name}_0")
+        self.assertNotIn("content_html", header)
+
+    def test_links(self):
+        corpus = Corpus(self.dirpath).load()
+        self.assertSetEqual(
+            corpus.get_linked("we1s", model.Article), {f"chomp_{self.query_name}_0"}
+        )
+        self.assertSetEqual(
+            corpus.get_linked(self.query_name, model.Response),
+            {f"chomp-response_{self.query_name}_{i}" for i in range(2)},
+        )
+        self.assertListEqual(
+            corpus.get_responses_without_articles(),
+            [f"chomp-response_{self.query_name}_1"],
+        )
+
+    def test_back_references(self):
+
+        # Saving through the corpus updates the manifests on disk, too.
+        corpus = Corpus(self.dirpath).load()
+        source = corpus.get("we1s")
+        self.assertListEqual(source.query_names, [self.query_name])
+        self.assertIn(f"chomp_{self.query_name}_0", source.article_names)
+        query = corpus.get(self.query_name)
+        self.assertEqual(len(query.response_names), 2)
+
+        # Articles are loaded in full, HTML and all.
+        article = corpus.get(f"chomp_{self.query_name}_0")
+        self.assertEqual(article.content_html, "<p>Hello!</p>")
+
+    def test_load_skips_hidden(self):
+        cache_dirpath = self.dirpath / ".cache" / "google"
+        cache_dirpath.mkdir(parents=True)
+        (cache_dirpath / "entry.json").write_text('{"name": "cached", "value": 1}')
+        corpus = Corpus(self.dirpath).load()
+        self.assertNotIn("cached", corpus)
+
+    def test_save_in_place(self):
+        (self.dirpath / "sources" / "we1s.json").rename(self.dirpath / "we1s.json")
+        corpus = Corpus(self.dirpath).load()
+        corpus.save(corpus.get("we1s"))
+        self.assertEqual(corpus.filenames["we1s"], self.dirpath / "we1s.json")
+        self.assertFalse((self.dirpath / "sources" / "we1s.json").exists())
+
+    def test_deferred(self):
+        corpus = Corpus(self.dirpath, is_deferring=True).load()
+        article = model.Article(
+            name=f"chomp_{self.query_name}_1",
+            url="http://we1s.ucsb.edu/again",
+            source_name="we1s",
+            query_name=self.query_name,
+        )
+        corpus.save(article)
+
+        # Parents are only written on flush, but the links are there already.
+        self.assertIn(article.name, corpus.get_linked(self.query_name, model.Article))
+        query = Corpus(self.dirpath).load().get(self.query_name)
+        self.assertNotIn(article.name, query.article_names)
+        self.assertEqual(corpus.flush(), 2)
+        query = Corpus(self.dirpath).load().get(self.query_name)
+        self.assertIn(article.name, query.article_names)
+        self.assertEqual(corpus.flush(), 0)
+
+    def test_workers(self):
+        # Two processes working on the same query, each with its own copy.
+        corpora = [Corpus(self.dirpath, is_deferring=True).load() for _ in range(2)]
+        for i, corpus in enumerate(corpora, 1):
+            corpus.save(
+                model.Article(
+                    name=f"chomp_{self.query_name}_{i}",
+                    url=f"http://we1s.ucsb.edu/{i}",
+                    source_name="we1s",
+                    query_name=self.query_name,
+                )
+            )
+        for corpus in corpora:
+            corpus.flush()
+
+        # Nobody's articles are lost.
+        names = [f"chomp_{self.query_name}_{i}" for i in range(3)]
+        query = Corpus(self.dirpath).load().get(self.query_name)
+        self.assertListEqual(sorted(query.article_names), names)
+
+        # Ones we take out aren't merged back in from disk.
+        corpus = Corpus(self.dirpath, is_deferring=True).load()
+        corpus.remove(names[1])
+        corpus.flush()
+        query = Corpus(self.dirpath).load().get(self.query_name)
+        self.assertListEqual(sorted(query.article_names), [names[0], names[2]])
@@ -0,0 +1,75 @@
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from we1s_chomp.frontier import (
+    DONE,
+    FAILED,
+    FrontierSet,
+    MemoryFrontier,
+    SQLiteFrontier,
+)
+
+
+class TestFrontier(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+        self.dirpath = Path(self.tempdir.name)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def get_frontiers(self, **kwargs):
+        return [
+            MemoryFrontier(**kwargs),
+            SQLiteFrontier(self.dirpath / f"frontier{len(kwargs)}.db", **kwargs),
+        ]
+
+    def test_lease(self):
+        for frontier in self.get_frontiers():
+            self.assertTrue(frontier.put("page", "a", {"n": 1}))
+            self.assertFalse(frontier.put("page", "a", {"n": 2}))
+            frontier.put("query", "b")
+
+            # Kinds are taken in the order given.
+            task = frontier.lease(["query", "page"])
+            self.assertEqual(task.key, "b")
+            task = frontier.lease(["query", "page"])
+            self.assertEqual(task.data, {"n": 1})
+            self.assertIsNone(frontier.lease(["query", "page"]))
+
+            self.assertFalse(frontier.is_finished(["page"]))
+            frontier.ack(task)
+            self.assertTrue(frontier.is_finished(["page"]))
+            self.assertEqual(frontier.get_status("page", "a"), DONE)
+
+    def test_visibility_timeout(self):
+        for frontier in self.get_frontiers(lease_time=0.0, max_attempts=2):
+            frontier.put("page", "a")
+
+            # A crashed worker never acks, so the task comes back.
+            self.assertEqual(frontier.lease(["page"]).attempts, 1)
+            task = frontier.lease(["page"])
+            self.assertEqual(task.attempts, 2)
+            frontier.nack(task)
+            self.assertIsNone(frontier.lease(["page"]))
+            self.assertEqual(frontier.get_status("page", "a"), FAILED)
+
+    def test_claim(self):
+        for frontier in self.get_frontiers():
+            stops = FrontierSet(frontier, "url", "worker1", ["http://a"])
+            other_stops = FrontierSet(frontier, "url", "worker2")
+            self.assertIn("http://a", stops)
+
+            stops.add("http://b")
+            other_stops.add("http://b")
+            self.assertTrue(stops.is_claimed("http://b"))
+            self.assertFalse(other_stops.is_claimed("http://b"))
+            self.assertIn("http://b", other_stops)
+            stops.ack("http://b")
+            self.assertEqual(frontier.get_status("url", "http://b"), DONE)
+
+    def test_increment(self):
+        for frontier in self.get_frontiers():
+            self.assertEqual(frontier.increment("articles", 5), 5)
+            self.assertEqual(frontier.increment("articles", 0), 6)
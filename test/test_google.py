@@ -0,0 +1,81 @@
+import json
+import unittest
+from datetime import datetime
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import sleep
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+from we1s_chomp import google, web
+from we1s_chomp.cache import Cache
+
+
+def get_page(url: str, **kwargs) -> str:
+    """Stand in for web.get() with a search that has 3 pages of results in
+    range, and 10 pages without the date range."""
+    params = parse_qs(urlsplit(url).query)
+    page = (int(params["start"][0]) + 9) // 10
+    num_pages = 3 if "sort" in params else 10
+    res = {"searchInformation": {"totalResults": str(num_pages * 10)}}
+    if page <= num_pages:
+        res["items"] = [
+            {
+                "link": f"http://we1s.ucsb.edu/{page}/{i}",
+                "title": str(i),
+                "snippet": "Jan 1, 2019 ... humanities",
+            }
+            for i in range(10)
+        ]
+    return json.dumps(res)
+
+
+class TestGoogle(unittest.TestCase):
+    def get_responses(self, **kwargs):
+        return list(
+            google.get_responses(
+                query_str="humanities",
+                base_url="we1s.ucsb.edu",
+                google_cx="cx",
+                google_key="key",
+                url_stops=set(),
+                start_date=datetime(2019, 1, 1),
+                end_date=datetime(2019, 12, 31),
+                **kwargs,
+            )
+        )
+
+    def test_count_filtered(self):
+        with mock.patch.object(web, "get", side_effect=get_page) as get:
+            with self.assertLogs("we1s_chomp.google", "INFO") as logs:
+                self.assertEqual(len(self.get_responses(is_counting_filtered=True)), 3)
+        self.assertIn("filtered out 70 of 100", "\n".join(logs.output))
+        self.assertEqual(get.call_count, 5)
+
+    def test_stop_after_empty_page(self):
+        def get_slow_page(url: str, **kwargs) -> str:
+            res = get_page(url, **kwargs)
+            if "items" in res:
+                sleep(0.05)
+            return res
+
+        # Pages 5-7 go out once pages 1-3 come back, but page 4 already came
+        # back empty, so they're skipped without spending quota.
+        with mock.patch.object(web, "get", side_effect=get_slow_page) as get:
+            self.assertEqual(len(self.get_responses(num_workers=4)), 3)
+        self.assertEqual(get.call_count, 4)
+
+    def test_cache(self):
+        with TemporaryDirectory() as dirname:
+            cache = Cache(Path(dirname) / "google", ttl=60)
+            with mock.patch.object(web, "get", side_effect=get_page) as get:
+                self.assertEqual(len(self.get_responses(cache=cache)), 3)
+            self.assertEqual(get.call_count, 4)
+
+            # Pages with results come from the cache, and are left as they
+            # were so they go stale on time. The empty page is asked again.
+            with mock.patch.object(web, "get", side_effect=get_page) as get:
+                with mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+                    self.assertEqual(len(self.get_responses(cache=cache)), 3)
+            self.assertEqual(get.call_count, 1)
+            self.assertEqual(cache_set.call_count, 0)
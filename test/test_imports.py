@@ -0,0 +1,27 @@
+import subprocess
+import sys
+import unittest
+
+from benchmark import imports
+
+
+class TestImports(unittest.TestCase):
+    def test_no_heavy_imports(self):
+        # The pipeline imports every other module.
+        self.assertSetEqual(imports.get_heavy_imports("we1s_chomp.pipeline"), set())
+
+    def test_import_on_use(self):
+        code = (
+            "import sys\n"
+            "from we1s_chomp import clean\n"
+            "clean.get_content('<p>%s</p>' % ('The humanities. ' * 10))\n"
+            "clean.str_to_date('Mar 14, 2019')\n"
+            "print(' '.join(sys.modules))\n"
+        )
+        res = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        modules = set(res.stdout.split())
+        for module in ["bleach", "bs4", "dateparser", "unidecode"]:
+            self.assertIn(module, modules)
+        self.assertNotIn("requests", modules)
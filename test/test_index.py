@@ -0,0 +1,78 @@
+import unittest
+from datetime import datetime
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from we1s_chomp import model
+from we1s_chomp.corpus import Corpus
+from we1s_chomp.index import Index
+
+
+class TestIndex(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+        self.dirpath = Path(self.tempdir.name)
+        self.index = Index.in_dir(self.dirpath)
+        self.corpus = Corpus(self.dirpath, index=self.index)
+        for i, (source_name, content) in enumerate(
+            [
+                ("we1s", "The liberal arts are alive and well."),
+                ("we1s", "Arts funding is liberal, but the humanities suffer."),
+                ("we1s", "The Liberal Arts, in crisis again."),
+                ("other", "The liberal arts elsewhere."),
+            ]
+        ):
+            self.corpus.save(
+                model.Article(
+                    name=f"article_{i}",
+                    url=f"http://we1s.ucsb.edu/{i}",
+                    pub_date=datetime(year=2019, month=i + 1, day=1),
+                    content=content,
+                    source_name=source_name,
+                )
+            )
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_search(self):
+        self.assertEqual(len(self.index), 4)
+        self.assertListEqual(
+            self.index.search("liberal arts", source_name="we1s"),
+            ["article_0", "article_2"],
+        )
+        self.assertListEqual(
+            self.index.search(
+                "liberal arts",
+                start_date=datetime(year=2019, month=2, day=1),
+                end_date=datetime(year=2019, month=3, day=1),
+            ),
+            ["article_2"],
+        )
+        self.assertListEqual(
+            self.index.search("liberal NOT alive", is_phrase=False, limit=2),
+            ["article_1", "article_2"],
+        )
+
+    def test_update(self):
+
+        # Saving an article again replaces what's indexed.
+        article = self.corpus.get("article_0")
+        article.content = "Nothing to see here."
+        self.corpus.save(article)
+        self.assertNotIn("article_0", self.index.search("liberal arts"))
+        self.assertIn("article_0", self.index.search("nothing"))
+
+        # Articles saved without the index are picked up on load, and missing
+        # ones are dropped.
+        Corpus(self.dirpath).save(
+            model.Article(name="article_4", url="http://we1s.ucsb.edu/4")
+        )
+        self.index.remove(["article_1"])
+        (self.dirpath / "articles" / "article_3.json").unlink()
+        corpus = Corpus(self.dirpath, index=self.index).load()
+        self.assertSetEqual(
+            self.index.get_names(), set(corpus.get_names(model.Article))
+        )
+        self.assertIn("article_1", self.index)
+        self.assertNotIn("article_3", self.index)
@@ -0,0 +1,57 @@
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from we1s_chomp import metrics
+from we1s_chomp.cache import Cache
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        metrics.enable(False)
+        metrics.registry.reset()
+
+    def tearDown(self):
+        metrics.enable(False)
+        metrics.registry.reset()
+
+    def test_registry(self):
+        registry = metrics.Registry(is_enabled=True, buckets=(0.1, 1.0))
+        registry.inc("chomp_fetches_total", host="we1s.ucsb.edu")
+        registry.inc("chomp_fetches_total", 2, host="we1s.ucsb.edu")
+        registry.add_gauge("chomp_requests_in_flight", 1)
+        registry.observe("chomp_fetch_seconds", 0.5, host="we1s.ucsb.edu")
+        registry.observe("chomp_fetch_seconds", 5.0, host="we1s.ucsb.edu")
+
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot["chomp_fetches_total"][0]["value"], 3)
+        histogram = snapshot["chomp_fetch_seconds"][0]
+        self.assertEqual(histogram["count"], 2)
+        self.assertDictEqual(histogram["buckets"], {"0.1": 0, "1.0": 1, "inf": 2})
+
+        text = registry.to_prometheus()
+        self.assertIn("# TYPE chomp_fetches_total counter", text)
+        self.assertIn('chomp_fetches_total{host="we1s.ucsb.edu"} 3.0', text)
+        self.assertIn(
+            'chomp_fetch_seconds_bucket{host="we1s.ucsb.edu",le="+Inf"} 2', text
+        )
+        self.assertIn("chomp_requests_in_flight 1.0", text)
+
+    def test_disabled(self):
+        metrics.inc("chomp_fetches_total")
+        with metrics.timer("chomp_fetch_seconds"):
+            pass
+        self.assertDictEqual(metrics.registry.snapshot(), {})
+
+    def test_instrumentation(self):
+        metrics.enable()
+        with TemporaryDirectory() as tempdir:
+            cache = Cache(Path(tempdir) / "google")
+            cache.get("key")
+            cache.set("key", "value")
+            cache.get("key")
+        snapshot = metrics.registry.snapshot()
+        self.assertListEqual(
+            [s["labels"]["result"] for s in snapshot["chomp_cache_requests_total"]],
+            ["hit", "miss"],
+        )
@@ -1,4 +1,5 @@
 import unittest
+from copy import copy
 from datetime import datetime
 from pathlib import Path
 
@@ -104,3 +105,35 @@ def test_article(self):
             "chomp_we1s_humanities_2000-01-01_2019-12-31_0", self.dirpath
         )
         self.assertDictEqual(vars(article), vars(article2))
+
+    def test_payload(self):
+
+        # Payloads are raw JSON strings that carry their parsed data.
+        payload = model.Payload('{"items": []}', {"items": []})
+        self.assertEqual(payload, '{"items": []}')
+        self.assertEqual(payload.raw, b'{"items": []}')
+        self.assertIs(model.load_payload(payload), payload.data)
+
+        # Collectors take plain strings too.
+        self.assertDictEqual(model.load_payload('{"items": []}'), {"items": []})
+
+        # Payloads are saved like any other response content.
+        response = model.Response(
+            name="chomp-response_payload", url="http://we1s.ucsb.edu", content=payload
+        )
+        manifest = model.to_json(response)
+        self.assertEqual(manifest["content"], '{"items": []}')
+
+    def test_slots(self):
+
+        # Manifests are slotted, but still serialize through vars().
+        article = model.Article(name="chomp_slots", url="http://we1s.ucsb.edu")
+        with self.assertRaises(AttributeError):
+            article.unknown_field = "Hello!"
+        self.assertListEqual(list(vars(article)), list(model.Article._fields))
+
+        # Copies don't share fields with the original.
+        article2 = copy(article)
+        article2.content_html = "chomp_slots.html"
+        self.assertEqual(article.content_html, "")
+        self.assertEqual(article2.name, article.name)
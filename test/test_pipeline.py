@@ -0,0 +1,244 @@
+import json
+import unittest
+from datetime import datetime
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import sleep
+from zipfile import ZipFile
+
+from we1s_chomp import clean, lazy, model
+from we1s_chomp.corpus import Corpus
+from we1s_chomp.frontier import MemoryFrontier
+from we1s_chomp.index import Index
+from we1s_chomp.pipeline import Checkpoint, Pipeline
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+        self.dirpath = Path(self.tempdir.name)
+
+        corpus = Corpus(self.dirpath)
+        corpus.save(model.Source(name="we1s", webpage="http://we1s.ucsb.edu", tags=[]))
+        self.query = model.Query(
+            source_name="we1s",
+            query_str="humanities",
+            start_date=datetime(year=2000, month=1, day=1),
+            end_date=datetime(year=2019, month=12, day=31),
+        )
+        corpus.save(self.query)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_checkpoint(self):
+        filename = self.dirpath / "checkpoint.txt"
+        checkpoint = Checkpoint(filename)
+        checkpoint.add("http://we1s.ucsb.edu/hello")
+        checkpoint.add("http://we1s.ucsb.edu/hello")
+        checkpoint.add(f"query:{self.query.name}")
+
+        # Progress carries over to the next run.
+        checkpoint = Checkpoint(filename)
+        self.assertEqual(len(checkpoint), 2)
+        self.assertIn("http://we1s.ucsb.edu/hello", checkpoint)
+
+        pipeline = Pipeline(self.dirpath)
+        self.assertIn("http://we1s.ucsb.edu/hello", pipeline.url_stops)
+        self.assertNotIn(f"query:{self.query.name}", pipeline.url_stops)
+
+    def test_checkpoint_runs(self):
+        pipeline = Pipeline(self.dirpath, run_name="run1")
+        page_url = "http://we1s.ucsb.edu/wp-json/wp/v2/posts?page=1"
+        pipeline.set_done(page_url, f"page:run1:{page_url}")
+        pipeline.checkpoint.add(f"query:run1:{self.query.name}")
+
+        # Result pages and queries are only done for the run that did them.
+        pipeline = Pipeline(self.dirpath, run_name="run1")
+        self.assertIn(page_url, pipeline.url_stops)
+        self.assertListEqual(list(pipeline.iter_responses(self.query)), [])
+        pipeline = Pipeline(self.dirpath, run_name="run2")
+        self.assertNotIn(page_url, pipeline.url_stops)
+
+    def test_checkpoint_saved(self):
+
+        # A run died after saving these, but before checking them off.
+        pipeline = Pipeline(self.dirpath)
+        response = self.get_response()
+        pipeline.corpus.save(response)
+        pipeline.corpus.save(
+            model.Article(
+                name=f"chomp_{self.query.name}_0",
+                url="http://we1s.ucsb.edu/0",
+                source_name="we1s",
+                query_name=self.query.name,
+            )
+        )
+        pipeline.corpus.flush()
+        pipeline = Pipeline(self.dirpath)
+        self.assertIn(response.url, pipeline.url_stops)
+        self.assertIn("http://we1s.ucsb.edu/0", pipeline.url_stops)
+
+    def get_response(self):
+        posts = [
+            {
+                "link": f"http://we1s.ucsb.edu/{i}",
+                "date": "2019-01-0%iT00:00:00" % (i + 1),
+                "title": {"rendered": str(i)},
+                "content": {"rendered": f"<p>{text * 5}</p>"},
+            }
+            for i, text in enumerate(
+                ["The humanities are alive and well. ", "The Humanities are, too. "]
+            )
+        ]
+        response = model.Response(
+            name=f"chomp-response_{self.query.name}_0",
+            url="http://we1s.ucsb.edu/wp-json/wp/v2/posts",
+            content=json.dumps(posts),
+            api_data_provider="wordpress",
+            source_name="we1s",
+            query_name=self.query.name,
+        )
+        return response
+
+    def test_articles_and_export(self):
+        pipeline = Pipeline(self.dirpath, export_dirpath=self.dirpath / "export")
+        response = self.get_response()
+        pipeline.corpus.save(response)
+        pipeline.collect_articles(self.query, response)
+
+        self.assertSetEqual(
+            pipeline.corpus.get_linked(self.query.name, model.Article),
+            {
+                f"chomp_{self.query.name}_0",
+                f"chomp_{self.query.name}_0(no-exact-match)",
+            },
+        )
+        self.assertIn(f"response:{response.name}", pipeline.checkpoint)
+
+        # A second pass over the same response finds nothing new.
+        pipeline.collect_articles(self.query, response)
+        self.assertEqual(len(pipeline.corpus.get_names(model.Article)), 2)
+
+        pipeline.export([self.query])
+        with ZipFile(self.dirpath / "export" / f"{self.query.name}.zip") as zipfile:
+            self.assertListEqual(
+                zipfile.namelist(), [f"chomp_{self.query.name}_0.json"]
+            )
+
+    @unittest.skipUnless(lazy.import_optional("pyarrow"), "needs pyarrow")
+    def test_export_parquet(self):
+        from pyarrow import dataset
+
+        pipeline = Pipeline(
+            self.dirpath,
+            export_dirpath=self.dirpath / "export",
+            export_format="parquet",
+        )
+        response = self.get_response()
+        pipeline.corpus.save(response)
+        pipeline.collect_articles(self.query, response)
+        pipeline.export([self.query])
+        pipeline.export([self.query])  # Replaces the partition.
+
+        articles = dataset.dataset(
+            self.dirpath / "export" / "parquet", format="parquet", partitioning="hive"
+        )
+        self.assertNotIn("content_html", articles.schema.names)
+        table = articles.to_table(
+            columns=["name", "pub_date", "query_name"],
+            filter=dataset.field("pub_date") > datetime(year=2019, month=1, day=1),
+        )
+        self.assertListEqual(
+            table.to_pylist(),
+            [
+                {
+                    "name": f"chomp_{self.query.name}_0(no-exact-match)",
+                    "pub_date": datetime(year=2019, month=1, day=2),
+                    "query_name": self.query.name,
+                }
+            ],
+        )
+
+    def test_collect_local(self):
+        pipeline = Pipeline(self.dirpath, index=Index.in_dir(self.dirpath))
+        response = self.get_response()
+        pipeline.corpus.save(response)
+        pipeline.collect_articles(self.query, response)
+
+        # A new query over the same source picks up what we've already got.
+        query = model.Query(
+            source_name="we1s",
+            query_str="Humanities",
+            start_date=datetime(year=2019, month=1, day=2),
+            end_date=datetime(year=2019, month=12, day=31),
+        )
+        pipeline.corpus.save(query)
+        self.assertEqual(pipeline.collect_local(query), 1)
+        self.assertEqual(pipeline.collect_local(query), 0)
+        article = pipeline.corpus.get(f"chomp_{query.name}_0")
+        self.assertEqual(article.url, "http://we1s.ucsb.edu/1")
+        self.assertIn(f"local:{query.name}", pipeline.checkpoint)
+
+    def test_reclean(self):
+        pipeline = Pipeline(self.dirpath, index=Index.in_dir(self.dirpath))
+        response = self.get_response()
+        pipeline.corpus.save(response)
+        pipeline.collect_articles(self.query, response)
+        for article in pipeline.corpus.iter_linked(self.query.name, model.Article):
+            key = clean.get_cache_key(article.content_html)
+            self.assertEqual(pipeline.content_cache.get(key), article.content)
+        self.assertEqual(pipeline.reclean(), 0)
+
+        # Stale content is cleaned again, and an article that matches now
+        # loses its suffix.
+        article = pipeline.corpus.get(f"chomp_{self.query.name}_0")
+        article.content = "Stale."
+        pipeline.corpus.save(article)
+        name = f"chomp_{self.query.name}_0(no-exact-match)"
+        filename_html = pipeline.corpus.filenames[name].parent / f"{name}.html"
+        filename_html.write_text("<p>%s</p>" % ("The humanities, too. " * 5))
+        self.assertEqual(pipeline.reclean(), 2)
+        self.assertNotIn(name, pipeline.corpus)
+        self.assertFalse(filename_html.exists())
+        article = pipeline.corpus.get(f"chomp_{self.query.name}_1")
+        self.assertIn("humanities", article.content)
+        self.assertIn("<p>", article.content_html)
+        self.assertEqual(article.length, len(article.content.split(" ")))
+        self.assertIn(article.name, pipeline.corpus.get(self.query.name).article_names)
+        self.assertNotIn(name, pipeline.corpus.get(self.query.name).article_names)
+        self.assertEqual(pipeline.index.search("too"), [article.name])
+        self.assertEqual(pipeline.reclean(), 0)
+
+    def test_heartbeat(self):
+        frontier = MemoryFrontier(lease_time=0.3)
+        pipeline = Pipeline(self.dirpath, frontier=frontier, worker="worker1")
+        frontier.put("query", self.query.name)
+        task = frontier.lease(["query"], "worker1")
+
+        # Nobody else gets the task while we're still on it, however long.
+        with pipeline.heartbeat(task):
+            sleep(0.6)
+            self.assertIsNone(frontier.lease(["query"], "worker2"))
+        sleep(0.6)
+        self.assertIsNotNone(frontier.lease(["query"], "worker2"))
+
+    def test_work(self):
+        frontier = MemoryFrontier()
+        pipeline = Pipeline(self.dirpath, frontier=frontier, worker="worker1")
+        response = self.get_response()
+        pipeline.corpus.save(response)
+
+        # Another worker picks up the page and saves its articles.
+        filename = str(pipeline.corpus.filenames[response.name])
+        frontier.put("page", response.name, filename)
+        other_pipeline = Pipeline(self.dirpath, frontier=frontier, worker="worker2")
+        other_pipeline.work(["articles"])
+        self.assertTrue(frontier.is_finished(["page"]))
+        self.assertEqual(len(other_pipeline.corpus.get_names(model.Article)), 2)
+        self.assertIn("http://we1s.ucsb.edu/0", pipeline.url_stops)
+
+        # Names stay unique across workers.
+        self.assertEqual(
+            pipeline.get_article_name(self.query, False), f"chomp_{self.query.name}_1"
+        )
@@ -0,0 +1,70 @@
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import sleep
+
+from we1s_chomp import clean, profiling
+
+
+@profiling.profiled("get_metadata")
+def get_metadata(pages):
+    for page in pages:
+        yield clean.get_content(page)
+
+
+class TestProfiling(unittest.TestCase):
+    def tearDown(self):
+        profiling.configure(stages=())
+        profiling.set_budget()
+
+    def test_profile(self):
+        page = "<html><body>%s</body></html>" % ("<p>The humanities.</p>" * 50)
+        with TemporaryDirectory() as tempdir:
+            profiling.configure(
+                ["get_metadata", "get_content"], is_tracing_memory=True, dirpath=tempdir
+            )
+            self.assertEqual(len(list(get_metadata([page] * 3))), 3)
+            filenames = profiling.save()
+
+            names = {filename.name for filename in filenames}
+            for stage in ["get_metadata", "get_content"]:
+                self.assertIn(f"{stage}.prof", names)
+                self.assertIn(f"{stage}.txt", names)
+
+            # Cleaning shows up under get_content, not get_metadata.
+            text = (Path(tempdir) / "get_content.txt").read_text()
+            self.assertIn("get_content", text)
+            text = (Path(tempdir) / "get_metadata.txt").read_text()
+            self.assertNotIn("bleach", text)
+            text = (Path(tempdir) / "memory.txt").read_text()
+            self.assertIn("get_metadata\n    calls: 4", text)
+
+    def test_budget_warn(self):
+        budget = profiling.MemoryBudget(limit=100)
+        budget.acquire(60, "responses")
+        with self.assertLogs("we1s_chomp.profiling", "WARNING") as logs:
+            budget.acquire(60, "clean")
+        self.assertIn("responses: 60 B, clean: 60 B", logs.output[0])
+        budget.release(60, "clean")
+        self.assertEqual(budget.usage, 60)
+        self.assertEqual(budget.peak, 120)
+
+    def test_budget_block(self):
+        budget = profiling.MemoryBudget(limit=100, is_blocking=True)
+        budget.acquire(150, "responses")  # Too big, but nothing else is held.
+        self.assertTrue(budget.is_over())
+
+        thread = Thread(target=budget.acquire, args=(10, "responses"))
+        thread.start()
+        sleep(0.1)
+        self.assertTrue(thread.is_alive())
+        budget.release(150, "responses")
+        thread.join(1.0)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(budget.usage, 10)
+
+    def test_parse_size(self):
+        self.assertEqual(profiling.parse_size("512M"), 512 * 1024**2)
+        self.assertEqual(profiling.parse_size("1.5gb"), int(1.5 * 1024**3))
+        self.assertEqual(profiling.parse_size("1000"), 1000)
@@ -0,0 +1,152 @@
+import gzip
+import unittest
+from datetime import datetime
+from functools import partial
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+from unittest import mock
+
+from we1s_chomp import sitemap, web
+
+URLSET = """<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"
+    xmlns:news="http://www.google.com/schemas/sitemap-news/0.9"
+    xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">
+  <url>
+    <loc>{url}/2019/humanities</loc>
+    <news:news>
+      <news:publication_date>2019-05-01T12:00:00+00:00</news:publication_date>
+      <news:title>The Humanities</news:title>
+    </news:news>
+    <image:image><image:loc>{url}/humanities.jpg</image:loc></image:image>
+  </url>
+  <url><loc>{url}/2019/science</loc><lastmod>2019-06-01</lastmod></url>
+  <url><loc>{url}/2019/private</loc><lastmod>2019-06-01</lastmod></url>
+  <url><loc>{url}/2019/undated</loc></url>
+  <url><loc>{url}/2010/old</loc><lastmod>2010-01-01</lastmod></url>
+</urlset>"""
+
+INDEX = """<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>{url}/sitemap-2019.xml.gz</loc><lastmod>2019-06-01</lastmod></sitemap>
+  <sitemap><loc>{url}/sitemap-2010.xml</loc><lastmod>2010-01-01</lastmod></sitemap>
+</sitemapindex>"""
+
+ARTICLE = """<html><head><title>{title}</title>{meta}</head>
+<body><p>{text}</p></body></html>"""
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = "http://%s:%i" % self.server.server_address
+        content_type, body = "text/html", None
+        if self.path == "/robots.txt":
+            content_type = "text/plain"
+            body = "User-agent: *\nDisallow: /2019/private\nSitemap: %s/index.xml\n"
+            body = (body % url).encode("utf-8")
+        elif self.path == "/index.xml":
+            content_type, body = "application/xml", INDEX.format(url=url).encode()
+        elif self.path == "/sitemap-2019.xml.gz":
+            content_type = "application/gzip"
+            body = gzip.compress(URLSET.format(url=url).encode("utf-8"))
+        elif self.path.startswith("/2019/"):
+            name = self.path.split("/")[-1]
+            meta = ""
+            if name == "undated":
+                meta = '<meta property="article:published_time" content="2019-07-04">'
+            text = "The humanities at %s are alive and well. " % name
+            if name == "science":
+                text = "Science! " * 20
+            body = ARTICLE.format(title=name, meta=meta, text=text * 5).encode()
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSitemap(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(("127.0.0.1", 0), Handler)
+        cls.url = "http://127.0.0.1:%i" % cls.server.server_port
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        patcher = mock.patch.object(web, "get", partial(web.get, sleep_range=(0, 0)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_responses(self):
+        self.assertTrue(sitemap.is_available(self.url))
+        responses = list(
+            sitemap.get_responses(
+                "humanities",
+                self.url,
+                url_stops=set(),
+                start_date=datetime(year=2019, month=1, day=1),
+                end_date=datetime(year=2019, month=12, day=31),
+            )
+        )
+        self.assertEqual(len(responses), 1)
+        url, response = responses[0]
+        self.assertEqual(url, self.url + "/sitemap-2019.xml.gz")
+        names = ["humanities", "science", "undated"]
+        self.assertListEqual(
+            [entry["loc"] for entry in response.data],
+            [self.url + f"/2019/{name}" for name in names],
+        )
+        self.assertEqual(response.data[0]["title"], "The Humanities")
+
+    def test_get_metadata(self):
+        entries = [
+            {"loc": self.url + "/2019/humanities", "title": "The Humanities"},
+            {"loc": self.url + "/2019/science", "lastmod": "2019-06-01"},
+            {"loc": self.url + "/2019/undated"},
+        ]
+        articles = list(
+            sitemap.get_metadata(
+                sitemap.Payload("[]", entries),
+                "Humanities",
+                datetime(year=2019, month=1, day=1),
+                datetime(year=2019, month=12, day=31),
+                url_stops=set(),
+            )
+        )
+
+        # Only pages that are dated and mention the search term.
+        self.assertEqual(len(articles), 1)
+        self.assertEqual(articles[0]["url"], self.url + "/2019/undated")
+        self.assertEqual(articles[0]["pub_date"], datetime(year=2019, month=7, day=4))
+        self.assertTrue(articles[0]["no_exact_match"])
+
+    def test_get_date(self):
+        # Every W3C form comes back naive, at the time it says.
+        date = datetime(year=2019, month=5, day=1, hour=10)
+        for date_str in [
+            "2019-05-01T10:00Z",
+            "2019-05-01T10:00+00:00",
+            "2019-05-01T10:00:00+02:00",
+            "2019-05-01T10:00:00.5Z",
+            "2019-05-01T10:00:00",
+        ]:
+            self.assertEqual(sitemap.get_date(date_str).replace(microsecond=0), date)
+            self.assertIsNone(sitemap.get_date(date_str).tzinfo)
+        self.assertEqual(sitemap.get_date("2019-05-01"), date.replace(hour=0))
+        self.assertIsNone(sitemap.get_date("May 1, 2019"))
+
+        # So they compare with query dates.
+        entry = {"lastmod": "2019-05-01T10:00+00:00"}
+        self.assertTrue(sitemap.is_entry_in_range(entry, datetime(2019, 1, 1)))
@@ -0,0 +1,88 @@
+import json
+import os
+import unittest
+from datetime import datetime
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from we1s_chomp import db, lazy, model, spool, wordpress
+from we1s_chomp.spool import Spool
+
+
+class TestSpool(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+        self.dirpath = Path(self.tempdir.name)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_spool(self):
+        spool_dirpath = self.dirpath / "spool"
+        handles = [Spool(spool_dirpath).write("<p>%i</p>" % i) for i in range(2)]
+        self.assertEqual(spool.read(handles[0]), "<p>0</p>")
+        self.assertEqual(spool.read("<p>2</p>"), "<p>2</p>")
+
+        # Old files are cleared out when the next run starts.
+        os.utime(handles[0], (0, 0))
+        Spool(spool_dirpath)
+        self.assertFalse(handles[0].exists())
+        self.assertTrue(handles[1].exists())
+
+    def get_spooled_article(self) -> model.Article:
+        posts = [
+            {
+                "link": "http://we1s.ucsb.edu/0",
+                "date": "2019-01-01T00:00:00",
+                "title": {"rendered": "0"},
+                "content": {"rendered": "<p>%s</p>" % ("The humanities. " * 10)},
+            }
+        ]
+        docs = list(
+            wordpress.get_metadata(
+                json.dumps(posts),
+                "humanities",
+                datetime(year=2019, month=1, day=1),
+                datetime(year=2019, month=12, day=31),
+                url_stops=set(),
+                spool=Spool(self.dirpath / "spool"),
+            )
+        )
+        return model.Article(name="article", **docs[0])
+
+    def test_save(self):
+        article = self.get_spooled_article()
+        handle = article.content_html
+        self.assertIsInstance(handle, Path)
+        html = spool.read(handle)
+
+        # Saving moves the spool file into place.
+        db.save_manifest_file(article, self.dirpath / "articles")
+        self.assertFalse(handle.exists())
+        self.assertEqual(spool.read(article.content_html), html)
+        article = db.read_manifest_file(self.dirpath / "articles" / "article.json")
+        self.assertEqual(article.content_html, html)
+
+    def test_to_json(self):
+        article = self.get_spooled_article()
+        manifest = json.loads(json.dumps(article, default=model.to_json))
+        self.assertEqual(manifest["content_html"], str(article.content_html))
+
+    @unittest.skipUnless(lazy.import_optional("pyarrow"), "needs pyarrow")
+    def test_save_parquet(self):
+        from pyarrow import dataset
+
+        article = self.get_spooled_article()
+        html = spool.read(article.content_html)
+        db.save_manifest_file(article, self.dirpath / "articles")
+        self.assertEqual(
+            db.save_parquet(
+                [article], self.dirpath / "parquet", is_including_html=True
+            ),
+            1,
+        )
+        table = dataset.dataset(
+            self.dirpath / "parquet", format="parquet", partitioning="hive"
+        ).to_table()
+        self.assertEqual(table.column("content_html").to_pylist(), [html])
+        self.assertEqual(table.column("content").to_pylist(), [article.content])
@@ -0,0 +1,121 @@
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+
+from we1s_chomp import web
+
+
+class Handler(BaseHTTPRequestHandler):
+    pages = {
+        "/page": ("text/html; charset=utf-8", b"<p>Hello!</p>"),
+        "/big": ("text/html", b"x" * 4096),
+        "/file.pdf": ("application/pdf", b"%PDF-1.4"),
+        "/data.json": ("application/json", b'{"hello": "world"}'),
+        "/latin.xhtml": (
+            "application/xhtml+xml",
+            "<p>Café de la Gare, un café noir.</p>".encode("latin-1"),
+        ),
+    }
+
+    def do_GET(self):
+        content_type, body = self.pages.get(self.path, ("text/html", b""))
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        if self.path != "/big":  # Make the client find out the hard way.
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestWeb(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(("127.0.0.1", 0), Handler)
+        cls.url = "http://127.0.0.1:%i" % cls.server.server_port
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_get(self):
+        res = web.get(self.url + "/page", sleep_range=(0, 0))
+        self.assertEqual(res, "<p>Hello!</p>")
+        self.assertIsNone(web.get("http://127.0.0.1:1/", sleep_range=(0, 0)))
+
+        # Without a charset, the encoding is guessed from the body.
+        res = web.get(self.url + "/latin.xhtml", sleep_range=(0, 0))
+        self.assertEqual(res, "<p>Café de la Gare, un café noir.</p>")
+
+    def test_get_content_type(self):
+        res = web.get(self.url + "/file.pdf", sleep_range=(0, 0))
+        self.assertIsInstance(res, web.Skipped)
+        self.assertEqual(res.reason, web.SKIP_CONTENT_TYPE)
+        self.assertFalse(res)
+
+        res = web.get(self.url + "/data.json", sleep_range=(0, 0))
+        self.assertEqual(res.reason, web.SKIP_CONTENT_TYPE)
+        res = web.get(
+            self.url + "/data.json", sleep_range=(0, 0), is_expecting_json=True
+        )
+        self.assertEqual(res, '{"hello": "world"}')
+
+    def test_get_max_length(self):
+        res = web.get(self.url + "/big", sleep_range=(0, 0), max_length=1024)
+        self.assertIsInstance(res, web.Skipped)
+        self.assertEqual(res.reason, web.SKIP_CONTENT_LENGTH)
+        res = web.get(self.url + "/big", sleep_range=(0, 0), max_length=-1)
+        self.assertEqual(len(res), 4096)
+        res = web.get(self.url + "/page", sleep_range=(0, 0), max_length=4)
+        self.assertEqual(res.reason, web.SKIP_CONTENT_LENGTH)
+
+    def test_get_batch(self):
+        urls = [self.url + "/page", self.url + "/file.pdf", self.url + "/big"]
+        results = list(web.get_batch(urls, num_workers=3, sleep_range=(0, 0)))
+        self.assertListEqual([url for url, _ in results], urls)
+        self.assertListEqual(
+            [res for _, res in results], ["<p>Hello!</p>", "", "x" * 4096]
+        )
+
+    def test_get_batch_lazy(self):
+        requested = []
+
+        def collector(url):
+            requested.append(url)
+            return url
+
+        results = web.get_batch((str(i) for i in range(100)), collector, 4)
+        self.assertEqual(next(results), ("0", "0"))
+        results.close()
+        self.assertLessEqual(len(requested), 5)
+
+    def test_browser_blocking(self):
+        browser = web.Browser.lightweight("http://grid:4444")
+        options = browser.get_capabilities()["goog:chromeOptions"]
+        self.assertIn("--headless", options["args"])
+        self.assertIn("--blink-settings=imagesEnabled=false", options["args"])
+        self.assertEqual(
+            options["prefs"], {"profile.managed_default_content_settings.images": 2}
+        )
+
+        # Stylesheets and fonts have no content setting, so they're blocked by
+        # URL once the driver is up.
+        class Driver:
+            def __init__(self):
+                self.command_executor = type("Executor", (), {"_commands": {}})()
+                self.commands = []
+
+            def execute(self, command, params):
+                self.commands.append((command, params))
+
+        driver = Driver()
+        self.assertTrue(browser.block_urls(driver))
+        self.assertEqual(driver.commands[0][1]["cmd"], "Network.enable")
+        urls = driver.commands[1][1]["params"]["urls"]
+        self.assertIn("*.css", urls)
+        self.assertIn("*.woff2", urls)
+        self.assertFalse(web.Browser("http://grid:4444").block_urls(Driver()))
@@ -0,0 +1,266 @@
+import json
+import unittest
+from datetime import datetime
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+from we1s_chomp import lazy, web, wordpress
+from we1s_chomp.cache import Cache
+
+
+def get_page(url: str, **kwargs) -> str:
+    """Stand in for web.get() with a Wordpress site that has 3 pages of 2
+    posts each, modified a month apart."""
+    params = parse_qs(urlsplit(url).query, keep_blank_values=True)
+    page = int(params["page"][0])
+    posts = [
+        {
+            "link": f"http://we1s.ucsb.edu/{p}/{i}",
+            "date": f"2019-0{p}-0{i + 1}T00:00:00",
+            "modified": f"2019-0{p}-0{i + 1}T00:00:00",
+            "title": {"rendered": str(i)},
+            "content": {"rendered": "<p>The humanities.</p>"},
+        }
+        for p in range(1, 4)
+        for i in range(2)
+    ]
+    if "modified_after" in params:
+        posts = [p for p in posts if p["modified"] > params["modified_after"][0]]
+    num_pages = (len(posts) + 1) // 2
+    body = posts[(page - 1) * 2 : page * 2]
+    if not body and page > 1:
+        body = {"code": "rest_post_invalid_page_number", "data": {"status": 400}}
+    if "_envelope" not in params:
+        return json.dumps(body)
+    return json.dumps(
+        {"body": body, "status": 200, "headers": {"X-WP-TotalPages": num_pages}}
+    )
+
+
+class TestWordpress(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+        self.watermarks = Cache(Path(self.tempdir.name) / "watermarks")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def get_metadata(self, response):
+        return list(
+            wordpress.get_metadata(
+                response,
+                "humanities",
+                datetime(2019, 1, 1),
+                datetime(2019, 12, 31),
+                url_stops=set(),
+            )
+        )
+
+    def get_responses(self, year: int = 2019, **kwargs):
+        kwargs.setdefault("watermarks", self.watermarks)
+        return list(
+            wordpress.get_responses(
+                query_str="humanities",
+                base_url="http://we1s.ucsb.edu",
+                endpoints={"posts"},
+                url_stops=set(),
+                start_date=datetime(year, 1, 1),
+                end_date=datetime(year, 12, 31),
+                **kwargs,
+            )
+        )
+
+    def get_watermark_key(self, year: int = 2019):
+        return [
+            "wordpress",
+            "http://we1s.ucsb.edu",
+            "humanities",
+            f"{year}-01-01T00:00:00",
+            f"{year}-12-31T00:00:00",
+        ]
+
+    def test_envelope(self):
+        with mock.patch.object(web, "get", side_effect=get_page) as get:
+            responses = self.get_responses()
+
+        # The first page is saved as it came, envelope and all.
+        url, res = responses[0]
+        self.assertIn("_envelope", get.call_args_list[0].args[0])
+        self.assertEqual(res, get_page(get.call_args_list[0].args[0]))
+
+        # Once it's been saved and loaded again, the posts are still there.
+        for ijson in [lazy.import_optional("ijson"), None]:
+            with mock.patch.object(lazy, "import_optional", return_value=ijson):
+                docs = self.get_metadata(str(res))
+            self.assertEqual(len(docs), 2)
+            self.assertEqual(docs[0]["url"], "http://we1s.ucsb.edu/1/0")
+
+    def test_watermark(self):
+        with mock.patch.object(web, "get", side_effect=get_page):
+            self.assertEqual(len(self.get_responses()), 3)
+
+            # Nothing's changed since last time.
+            self.assertEqual(len(self.get_responses()), 0)
+
+        # The same search over other dates has its own watermark.
+        with mock.patch.object(web, "get", side_effect=get_page) as get:
+            self.get_responses(year=2018)
+        self.assertNotIn("modified_after", get.call_args_list[0].args[0])
+
+    def test_watermark_errors(self):
+        def get_bad_page(url: str, **kwargs) -> str:
+            return None if "page=2" in url else get_page(url, **kwargs)
+
+        # Page 2 is missing, so next time we have to start from scratch.
+        with mock.patch.object(web, "get", side_effect=get_bad_page):
+            with self.assertLogs("we1s_chomp.wordpress", "WARNING"):
+                self.assertEqual(len(self.get_responses()), 2)
+        with mock.patch.object(web, "get", side_effect=get_page):
+            self.assertEqual(len(self.get_responses()), 3)
+
+    def test_watermark_errors_unpaged(self):
+        def get_unpaged(url: str, **kwargs) -> str:
+            if "page=2" in url:
+                return json.dumps({"code": "internal_server_error"})
+            return get_page(url.replace("&_envelope", ""), **kwargs)
+
+        # A site that can't tell us the page count is paged through until it
+        # runs out, but an error isn't running out.
+        with mock.patch.object(web, "get", side_effect=get_unpaged):
+            with self.assertLogs("we1s_chomp.wordpress", "WARNING"):
+                self.assertEqual(len(self.get_responses()), 1)
+        with mock.patch.object(web, "get", side_effect=get_page):
+            self.assertEqual(len(self.get_responses()), 3)
+
+    def test_watermark_page_limit(self):
+        def get_unpaged(url: str, **kwargs) -> str:
+            return get_page(url.replace("&_envelope", ""), **kwargs)
+
+        # Pages past the limit might have older posts, so next time we have
+        # to start from scratch, whether or not we knew the page count.
+        for get_page_at_limit in [get_page, get_unpaged]:
+            with mock.patch.object(web, "get", side_effect=get_page_at_limit):
+                self.assertEqual(len(self.get_responses(page_limit=2)), 2)
+            self.assertIsNone(self.watermarks.get(self.get_watermark_key()))
+            with mock.patch.object(web, "get", side_effect=get_page) as get:
+                self.assertEqual(len(self.get_responses()), 3)
+            self.assertNotIn("modified_after", get.call_args_list[0].args[0])
+            self.watermarks.delete(self.get_watermark_key())
+
+    @unittest.skipUnless(lazy.import_optional("ijson"), "needs ijson")
+    def test_iter_posts(self):
+        posts = [
+            {"link": f"http://we1s.ucsb.edu/{i}", "content": {"rendered": "x" * 1000}}
+            for i in range(200)
+        ]
+        raw = json.dumps(posts)
+
+        # The first post is ready before the page has all been read.
+        positions = []
+        read = wordpress.TextReader.read
+
+        def read_chunk(reader, size=-1):
+            chunk = read(reader, size)
+            positions.append(reader.position)
+            return chunk
+
+        with mock.patch.object(wordpress.TextReader, "read", read_chunk):
+            parsed = wordpress.iter_posts(raw)
+            self.assertEqual(next(parsed), posts[0])
+            self.assertLess(positions[-1], len(raw))
+            self.assertEqual(list(parsed), posts[1:])
+
+        # Files, e.g. spooled responses, are read as we go, too.
+        filename = Path(self.tempdir.name) / "response.json"
+        filename.write_text(raw, encoding="utf-8")
+        self.assertEqual(list(wordpress.iter_posts(filename)), posts)
+
+        # Whatever we got before a bad bit is still good.
+        cut = raw.index(posts[100]["link"])
+        with self.assertLogs("we1s_chomp.wordpress", "WARNING"):
+            self.assertEqual(list(wordpress.iter_posts(raw[:cut])), posts[:100])
+
+    @unittest.skipUnless(lazy.import_optional("ijson"), "needs ijson")
+    def test_streaming(self):
+        posts = []
+        iter_posts = wordpress.iter_posts
+
+        def iter_posts_counted(response):
+            for post in iter_posts(response):
+                posts.append(post)
+                yield post
+
+        # Pages are only parsed as far as the first post, with a watermark
+        # store or without one. We still fan out from page 1.
+        for watermarks in [None, self.watermarks]:
+            posts.clear()
+            with mock.patch.object(web, "get", side_effect=get_page) as get:
+                with mock.patch.object(wordpress, "iter_posts", iter_posts_counted):
+                    responses = self.get_responses(
+                        watermarks=watermarks, is_streaming=True
+                    )
+            self.assertEqual(len(responses), 3)
+            self.assertEqual(len(posts), 3)
+            self.assertEqual(get.call_count, 3)
+            for _, res in responses:
+                self.assertIsNone(res.data)
+        docs = [doc for _, res in responses for doc in self.get_metadata(res)]
+        self.assertEqual(len(docs), 6)
+
+        # The watermark still comes out right.
+        with mock.patch.object(web, "get", side_effect=get_page):
+            self.assertEqual(len(self.get_responses(is_streaming=True)), 0)
+
+    def test_capabilities(self):
+        def get_route(methods, args):
+            endpoint = {"methods": methods, "args": args}
+            return {"methods": methods, "endpoints": [endpoint]}
+
+        routes = {
+            "/wp/v2/posts": get_route(["GET", "POST"], {"search": {}}),
+            "/wp/v2/pages": get_route(["GET"], {}),
+            "/wp/v2/posts/(?P<id>[\\d]+)": get_route(["GET"], {}),
+            "/wp/v2/broken": {"methods": ["GET"], "endpoints": []},
+            "/wp/v2/odd": {"methods": None},
+        }
+
+        # A route or two we can't make sense of don't sink the rest.
+        res = json.dumps({"routes": routes})
+        with mock.patch.object(web, "get", return_value=res):
+            capabilities = wordpress.get_capabilities("http://we1s.ucsb.edu")
+            self.assertTrue(capabilities["is_available"])
+            self.assertEqual(sorted(capabilities["endpoints"]), ["pages", "posts"])
+            self.assertEqual(capabilities["search_endpoints"], ["posts"])
+            self.assertTrue(
+                wordpress.is_api_available("http://we1s.ucsb.edu", endpoints={"posts"})
+            )
+
+        with mock.patch.object(web, "get", return_value="<html></html>"):
+            capabilities = wordpress.get_capabilities("http://we1s.ucsb.edu")
+        self.assertFalse(capabilities["is_available"])
+
+    def test_capabilities_cache(self):
+        base_url = "http://we1s.ucsb.edu"
+        cache = Cache(Path(self.tempdir.name) / "capabilities")
+        cache_key = ["wordpress-api", base_url]
+
+        # Pages we skipped or couldn't read might be a bot check or a hiccup,
+        # so we ask again next time.
+        for res in [web.Skipped(web.SKIP_CONTENT_TYPE), "{", None]:
+            with mock.patch.object(web, "get", return_value=res):
+                capabilities = wordpress.get_capabilities(base_url, cache=cache)
+            self.assertFalse(capabilities["is_available"])
+            self.assertIsNone(cache.get(cache_key))
+
+        # Wordpress telling us there's no API is worth keeping, though.
+        res = json.dumps({"code": "rest_no_route", "data": {"status": 404}})
+        with mock.patch.object(web, "get", return_value=res):
+            wordpress.get_capabilities(base_url, cache=cache)
+        self.assertFalse(cache.get(cache_key)["is_available"])
+
+        res = json.dumps({"routes": {}})
+        with mock.patch.object(web, "get", return_value=res):
+            wordpress.get_capabilities(base_url, cache=cache, is_refreshing=True)
+        self.assertTrue(cache.get(cache_key)["is_available"])
@@ -0,0 +1,97 @@
+"""Persistent key-value cache.
+
+Values are stored as JSON files in a directory, one file per key, so a cache
+can be shared between queries, runs and worker processes. Keys can be any
+JSON-serializable value (strings, lists, dicts...).
+"""
+import json
+import os
+from hashlib import sha1
+from logging import getLogger
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from time import time
+from typing import Any
+
+from we1s_chomp import metrics
+
+###############################################################################
+# Internal configuration parameters.                                          #
+###############################################################################
+
+
+_DEFAULT_TTL = -1.0
+"""Default time in seconds before an entry goes stale, or -1 for never."""
+
+
+###############################################################################
+# Cache class.                                                                #
+###############################################################################
+
+
+class Cache:
+    """Persistent key-value cache backed by a directory of JSON files."""
+
+    def __init__(self, dirpath: Path, ttl: float = _DEFAULT_TTL):
+        """Create a new Cache instance.
+
+        Args:
+            dirpath: Directory to store entries in. Created if necessary.
+            ttl: Time in seconds before an entry goes stale, or -1 for never.
+        """
+        self.dirpath = Path(dirpath)
+        self.name = self.dirpath.name
+        self.ttl = ttl
+
+    def __contains__(self, key: Any) -> bool:
+        return self.get(key) is not None
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        """Get a value from the cache, or default if missing or stale."""
+        log = getLogger(__name__)
+
+        filename = self.get_filename(key)
+        try:
+            with open(filename, encoding="utf-8") as jsonfile:
+                entry = json.load(jsonfile)
+        except FileNotFoundError:
+            metrics.inc("chomp_cache_requests_total", cache=self.name, result="miss")
+            return default
+        except json.JSONDecodeError:
+            log.warning("Corrupt cache entry: %s" % filename)
+            metrics.inc("chomp_cache_requests_total", cache=self.name, result="miss")
+            return default
+
+        if self.ttl != -1 and time() - entry.get("time", 0) > self.ttl:
+            log.debug("Stale cache entry: %s" % filename)
+            metrics.inc("chomp_cache_requests_total", cache=self.name, result="stale")
+            return default
+
+        metrics.inc("chomp_cache_requests_total", cache=self.name, result="hit")
+        return entry.get("value", default)
+
+    def set(self, key: Any, value: Any) -> None:
+        """Store a value in the cache."""
+        filename = self.get_filename(key)
+        filename.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write to a temp file and swap it in, so other readers never see a
+        # half-written entry.
+        with NamedTemporaryFile(
+            "w", encoding="utf-8", dir=filename.parent, delete=False
+        ) as jsonfile:
+            json.dump({"key": key, "time": time(), "value": value}, jsonfile)
+        os.replace(jsonfile.name, filename)
+
+    def delete(self, key: Any) -> None:
+        """Remove a value from the cache, if it's there."""
+        filename = self.get_filename(key)
+        if filename.exists():
+            filename.unlink()
+
+    def get_filename(self, key: Any) -> Path:
+        """Get the filename for a cache key."""
+        digest = sha1(
+            json.dumps(key, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+        return self.dirpath / digest[:2] / f"{digest}.json"
@@ -1,32 +1,46 @@
 """Tools to parse and organize raw web content.
 
+The HTML and date parsers take a good half second to import, so they're
+imported on first use, not with the module.
+
+Cleaning is the slow part of collecting an article, and the same page always
+cleans the same way, so cleaned content can be cached by a hash of the HTML and
+the cleaner settings. Bump CLEANER_VERSION whenever get_content() changes what
+it returns, so old entries go stale.
+
 Todo:
 - Merge with the tools in the preprocessor Article class.
 """
 import html
+import re
+from concurrent.futures import FIRST_COMPLETED, wait
 from contextlib import suppress
 from datetime import datetime
+from hashlib import sha1
 from logging import getLogger
-from typing import Iterable, Optional, Tuple
-
-import bleach
-import dateparser
-import regex as re
-from bs4 import BeautifulSoup
-from unidecode import unidecode
+from time import perf_counter
+from typing import Iterable, Iterator, List, Optional, Tuple
 
+from we1s_chomp import metrics, profiling
+from we1s_chomp.cache import Cache
 
 ###############################################################################
 # Internal configuration parameters.                                          #
 ###############################################################################
 
 
+CLEANER_VERSION = 1
+"""Version of get_content()'s output. Part of every content cache key."""
+
 _DEFAULT_CONTENT_LENGTH = 75
 """Default length of tag content to save."""
 
 _DEFAULT_CONTENT_TAGS = ["p", "div", "span"]
 """Default ordered list of tags to check for content."""
 
+_DEFAULT_NUM_WORKERS = 0
+"""Default number of worker processes for batch cleaning, or 0 for none."""
+
 _DEFAULT_STUB_LENGTH = 75
 """Number of characters to limit a stub to."""
 
@@ -39,12 +53,17 @@
 STRFTIME = "%Y-%m-%dT%H:%M:%SZ"
 """Datetime to string formatter."""
 
+_STRPTIME_ISO = "%Y-%m-%dt%H:%M:%S"
+"""Parser for cleaned-up ISO 8601 date strings, i.e. lowercase with no "z"."""
+
 
 ###############################################################################
 # Cleaning functions.                                                         #
 ###############################################################################
 
 
+@profiling.profiled("get_content")
+@metrics.timed("chomp_stage_seconds", stage="clean")
 def get_content(
     html_input: str,
     length: int = _DEFAULT_CONTENT_LENGTH,
@@ -62,6 +81,10 @@ def get_content(
     Returns:
         Cleaned content string; empty if no content.
     """
+    import bleach
+    from bs4 import BeautifulSoup
+    from unidecode import unidecode
+
     log = getLogger(__name__)
 
     if not html_input or html_input == "":
@@ -113,11 +136,127 @@ def get_content(
     return ""
 
 
+def get_cached_content(html_input: str, cache: Optional[Cache] = None, **kwargs) -> str:
+    """Clean HTML with get_content(), unless it's been cleaned before.
+
+    Args:
+        html_input: HTML content to process.
+        cache: Cache of cleaned content. Set None to always clean.
+        kwargs: Passed on to get_content().
+
+    Returns:
+        Cleaned content string; empty if no content.
+    """
+    if cache is None or not html_input:
+        return get_content(html_input, **kwargs)
+    key = get_cache_key(html_input, **kwargs)
+    content = cache.get(key)
+    if content is None:
+        content = get_content(html_input, **kwargs)
+        cache.set(key, content)
+    return content
+
+
+def get_content_batch(
+    pages: Iterable[Tuple[str, str]],
+    num_workers: int = _DEFAULT_NUM_WORKERS,
+    cache: Optional[Cache] = None,
+    **kwargs,
+) -> Iterator[Tuple[str, str, str]]:
+    """Clean several HTML pages in a pool of worker processes.
+
+    Pages are pulled lazily, and no more than two per worker are held waiting
+    at once, so a slow cleaner pushes back on whatever is feeding it. Pages
+    waiting count against the memory budget; over a blocking budget, no more
+    are pulled until one is done (see profiling.MemoryBudget).
+
+    Args:
+        pages: Tuples of (key, HTML content), e.g. from web.get_batch().
+        num_workers: Number of worker processes. Set 0 to clean in this
+            process, one page at a time.
+        cache: Cache of cleaned content. Pages found here are handed back
+            straight away, without going to a worker.
+        kwargs: Passed on to get_content().
+
+    Returns:
+        Generator of (key, HTML content, cleaned content) tuples, as soon as
+        each is ready. Empty pages are passed through without cleaning.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    if num_workers < 1:
+        for key, html_input in pages:
+            content = ""
+            if html_input:
+                content = get_cached_content(html_input, cache, **kwargs)
+            yield key, html_input, content
+        return
+
+    # Metrics recorded in the worker processes would stay there, so time the
+    # cleaning in the worker and record it here.
+    def get_result(future) -> str:
+        if not metrics.registry.is_enabled:
+            return future.result()
+        content, time_elapsed = future.result()
+        metrics.observe("chomp_stage_seconds", time_elapsed, stage="clean")
+        return content
+
+    def pop_result(future) -> Tuple[str, str, str]:
+        key, html_input = pending.pop(future)
+        profiling.budget.release(len(html_input), "clean")
+        content = get_result(future)
+        if cache is not None:
+            cache.set(get_cache_key(html_input, **kwargs), content)
+        return key, html_input, content
+
+    cleaner = get_timed_content if metrics.registry.is_enabled else get_content
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        pending = {}
+        try:
+            for key, html_input in pages:
+                if not html_input:
+                    yield key, html_input, ""
+                    continue
+                if cache is not None:
+                    content = cache.get(get_cache_key(html_input, **kwargs))
+                    if content is not None:
+                        yield key, html_input, content
+                        continue
+                future = executor.submit(cleaner, html_input, **kwargs)
+                pending[future] = key, html_input
+                metrics.set_gauge("chomp_queue_depth", len(pending), queue="clean")
+                profiling.budget.acquire(len(html_input), "clean", is_waiting=False)
+
+                # Hand back whatever is done; block if we're backed up, or if
+                # we're holding more than the memory budget allows.
+                is_backed_up = (
+                    len(pending) >= num_workers * 2 or profiling.budget.is_over()
+                )
+                done, _ = wait(
+                    pending,
+                    timeout=None if is_backed_up else 0,
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in done:
+                    yield pop_result(future)
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pop_result(future)
+        finally:
+            for future in pending:
+                future.cancel()
+                profiling.budget.release(len(pending[future][1]), "clean")
+            metrics.set_gauge("chomp_queue_depth", 0, queue="clean")
+
+
 ###############################################################################
 # Helper functions.                                                           #
 ###############################################################################
 
 
+@metrics.timed("chomp_stage_seconds", stage="date_parse")
 def str_to_date(
     date_str: str, date_range: Optional[Tuple[datetime, datetime]] = None
 ) -> datetime:
@@ -136,12 +275,18 @@ def str_to_date(
     # Do minor clean-up on date string.
     date_str = date_str.lower().strip().rstrip("z")
 
-    # Get date from string.
+    # Get date from string. Most of the dates we see are our own (or the
+    # Wordpress API's) ISO 8601 strings, which don't need dateparser.
     try:
-        date = dateparser.parse(date_str)
-    except KeyError or TypeError:
-        log.warning('Error parsing date from string "%s"' % date_str)
-        return None
+        date = datetime.strptime(date_str, _STRPTIME_ISO)
+    except ValueError:
+        import dateparser
+
+        try:
+            date = dateparser.parse(date_str)
+        except KeyError or TypeError:
+            log.warning('Error parsing date from string "%s"' % date_str)
+            return None
     if not date:
         log.warning('Error parsing date from string "%s"' % date_str)
         return None
@@ -154,11 +299,33 @@ def str_to_date(
     return date.replace(microsecond=0)
 
 
+def get_cache_key(
+    html_input: str,
+    length: int = _DEFAULT_CONTENT_LENGTH,
+    tags: Iterable[str] = _DEFAULT_CONTENT_TAGS,
+) -> List:
+    """Get the content cache key for a page: a hash of its HTML, the cleaner
+    version and the settings it's cleaned with."""
+    digest = sha1(html_input.encode("utf-8", errors="replace")).hexdigest()
+    return [digest, CLEANER_VERSION, length, list(tags)]
+
+
 def date_to_str(date_obj: datetime) -> str:
     """Print datetime as string using WE1S STRFTIME format."""
     return date_obj.replace(microsecond=0).strftime(STRFTIME)
 
 
+def get_timed_content(html_input: str, **kwargs) -> Tuple[str, float]:
+    """Clean HTML with get_content(), and time it.
+
+    Returns:
+        Tuple of cleaned content string and time taken, in seconds.
+    """
+    start = perf_counter()
+    content = get_content(html_input, **kwargs)
+    return content, perf_counter() - start
+
+
 def get_stub(text: str, stub_length: int = _DEFAULT_STUB_LENGTH) -> str:
     """Get a stub version of a long string for logging."""
     return text[:stub_length] + "..." if len(text) > stub_length else text
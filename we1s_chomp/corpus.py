@@ -0,0 +1,373 @@
+"""In-memory index of manifests and the links between them.
+
+Manifests refer to each other by name: a Source lists its queries, a Query its
+responses and articles, and so on. Following those links one db.load_* call at
+a time means scanning the disk over and over. A Corpus reads every manifest's
+header once, builds a graph of the links, and only loads full objects when
+they're asked for.
+
+Give a Corpus an Index to keep a full-text index of its articles up to date as
+they're saved; see index.py.
+
+Saving an article also adds it to its source, query and response, whose lists
+of names grow with every article. Rewriting them each time is quadratic in the
+size of the corpus, so with is_deferring set they're only marked dirty, and
+written out on flush(). The links themselves come from both sides, so nothing
+is lost if a run dies before flushing.
+
+Several processes can work on the same directory (see frontier.py). Each has
+its own copy of the manifests, so when one of those lists is written out, it's
+merged with the copy on disk under a file lock, so nobody's names are lost.
+"""
+import json
+import os
+from collections import defaultdict
+from contextlib import contextmanager, suppress
+from logging import getLogger
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Iterator, List, Optional, Set, Union
+
+from we1s_chomp import db, lazy, model
+from we1s_chomp.index import Index
+from we1s_chomp.model import Article, Manifest, Query, Response, Source
+
+###############################################################################
+# Internal configuration parameters.                                          #
+###############################################################################
+
+
+_DEFAULT_DIRS = {
+    Source: "sources",
+    Query: "queries",
+    Response: "responses",
+    Article: "articles",
+}
+"""Default subdirectory for each kind of manifest."""
+
+_HEADER_SKIP_FIELDS = {"content", "content_html", "notes"}
+"""Fields left out of manifest headers. They can be big, and we don't need them
+to find our way around."""
+
+_LINK_FIELDS = {
+    "source_name": Source,
+    "query_name": Query,
+    "query_names": Query,
+    "response_name": Response,
+    "response_names": Response,
+    "article_names": Article,
+}
+"""Fields that link one manifest to another, and the kind they link to."""
+
+_NAMES_FIELDS = {
+    Query: "query_names",
+    Response: "response_names",
+    Article: "article_names",
+}
+"""Field that lists each kind of manifest in the manifests that own them."""
+
+_LOCK_FILENAME = ".corpus.lock"
+"""File to lock while merging lists of names with other processes."""
+
+
+###############################################################################
+# Corpus class.                                                               #
+###############################################################################
+
+
+class Corpus:
+    """In-memory index of manifests and the links between them."""
+
+    def __init__(
+        self,
+        dirpath: Path,
+        dirs: Dict[type, str] = _DEFAULT_DIRS,
+        index: Optional[Index] = None,
+        is_deferring: bool = False,
+    ):
+        """Create a new Corpus instance. Use Corpus.load() to fill it.
+
+        Args:
+            dirpath: Root directory of the manifests. Everything under it is
+                indexed, except hidden directories (like .cache).
+            dirs: Subdirectory to save each kind of manifest to.
+            index: Full-text index to keep articles in. It's brought up to
+                date on load().
+            is_deferring: Hold back writes to the manifests a saved manifest
+                belongs to until flush().
+        """
+        self.dirpath = Path(dirpath)
+        self.dirs = dirs
+        self.index = index
+        self.headers = {}
+        self.filenames = {}
+        self.types = {}
+        self.links = defaultdict(lambda: defaultdict(set))
+        self.objects = {}
+        self.is_deferring = is_deferring
+        self.dirty = {}
+        self.removed = set()
+        self.lock = Lock()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.headers
+
+    def __len__(self) -> int:
+        return len(self.headers)
+
+    def load(self) -> "Corpus":
+        """Index every manifest under the root directory."""
+        log = getLogger(__name__)
+
+        for filename in self.iter_filenames():
+            try:
+                with open(filename, encoding="utf-8") as jsonfile:
+                    manifest_dict = json.load(jsonfile)
+            except json.JSONDecodeError:
+                log.warning("Could not decode JSON manifest: %s" % filename)
+                continue
+            if not isinstance(manifest_dict, dict) or "name" not in manifest_dict:
+                continue
+            self.add(manifest_dict, filename)
+
+        log.info("Indexed %i manifests: %s" % (len(self), self.dirpath))
+        if self.index is not None:
+            self.index.sync(self)
+        return self
+
+    def iter_filenames(self) -> Iterator[Path]:
+        """Find the JSON files under the root directory, without going into
+        hidden directories. Caches keep thousands of JSON files there."""
+        for dirpath, dirnames, filenames in os.walk(self.dirpath):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+            for filename in sorted(filenames):
+                if filename.endswith(".json"):
+                    yield Path(dirpath) / filename
+
+    def add(self, manifest_dict: Dict, filename: Path) -> None:
+        """Index a manifest from its JSON dict."""
+        name = manifest_dict["name"]
+        manifest_type = model.get_manifest_type(manifest_dict)
+        self.headers[name] = {
+            k: v for k, v in manifest_dict.items() if k not in _HEADER_SKIP_FIELDS
+        }
+        self.filenames[name] = Path(filename)
+        self.types[name] = manifest_type
+        self.objects.pop(name, None)
+
+        # Link both ways, so we can get around whichever side we start from.
+        for field, link_type in _LINK_FIELDS.items():
+            link_names = manifest_dict.get(field, [])
+            if isinstance(link_names, str):
+                link_names = [link_names]
+            for link_name in link_names:
+                if link_name:
+                    self.links[name][link_type].add(link_name)
+                    self.links[link_name][manifest_type].add(name)
+
+    def get(self, name: str) -> Union[Source, Query, Response, Article]:
+        """Get the full manifest object by name, loading it if necessary.
+
+        Articles aren't kept in memory after loading, since they carry their
+        full content; everything else is.
+        """
+        if name in self.objects:
+            return self.objects[name]
+        if name not in self.filenames:
+            return None
+
+        manifest = db.read_manifest_file(self.filenames[name])
+        if manifest is not None and not isinstance(manifest, Article):
+            self.objects[name] = manifest
+        return manifest
+
+    def get_header(self, name: str) -> Dict:
+        """Get a manifest's header fields (everything but its content)."""
+        return self.headers.get(name)
+
+    def get_names(self, manifest_type: type = Manifest, **fields) -> List[str]:
+        """Get the names of manifests by kind and header fields.
+
+        Args:
+            manifest_type: Kind of manifest, e.g. Article.
+            fields: Only include manifests whose headers match these values.
+        """
+        return [
+            name
+            for name, header in self.headers.items()
+            if issubclass(self.types[name], manifest_type)
+            and all(header.get(k) == v for k, v in fields.items())
+        ]
+
+    def get_linked(self, name: str, manifest_type: type) -> Set[str]:
+        """Get the names of manifests of one kind linked to a manifest.
+
+        E.g. get_linked("we1s", Article) for all articles from a source.
+        """
+        return set(self.links[name][manifest_type]) if name in self.links else set()
+
+    def get_responses_without_articles(self) -> List[str]:
+        """Get the names of responses we haven't got any articles from."""
+        return [
+            name
+            for name in self.get_names(Response)
+            if not self.get_linked(name, Article)
+        ]
+
+    def iter_linked(
+        self, name: str, manifest_type: type
+    ) -> Iterator[Union[Source, Query, Response, Article]]:
+        """Load the manifests of one kind linked to a manifest."""
+        for link_name in sorted(self.get_linked(name, manifest_type)):
+            manifest = self.get(link_name)
+            if manifest is not None:
+                yield manifest
+
+    def remove(self, name: str) -> None:
+        """Delete a manifest, with its raw HTML, unindex it and take it out of
+        the manifests it belongs to."""
+        log = getLogger(__name__)
+
+        filename = self.filenames.pop(name, None)
+        if filename is None:
+            return
+        header = self.headers.pop(name)
+        manifest_type = self.types.pop(name)
+        self.objects.pop(name, None)
+        self.removed.add(name)
+        for suffix in [".html", ".json"]:
+            with suppress(FileNotFoundError):
+                (filename.parent / f"{name}{suffix}").unlink()
+        log.info('Deleted manifest "%s": %s' % (name, filename))
+
+        for link_names in self.links.pop(name, {}).values():
+            for link_name in link_names:
+                for names in self.links[link_name].values():
+                    names.discard(name)
+        if manifest_type is Article and self.index is not None:
+            self.index.remove([name])
+
+        names_field = _NAMES_FIELDS.get(manifest_type)
+        if not names_field:
+            return
+        for field in ["source_name", "query_name", "response_name"]:
+            parent = self.get(header.get(field, ""))
+            if parent is None or name not in getattr(parent, names_field, []):
+                continue
+            getattr(parent, names_field).remove(name)
+            self.save_parent(parent)
+
+    def flush(self) -> int:
+        """Write out the manifests held back since the last flush.
+
+        Returns:
+            Number of manifests written.
+        """
+        count = 0
+        while self.dirty:
+            _, manifest = self.dirty.popitem()
+            self.save_merged(manifest)
+            count += 1
+        return count
+
+    def save(self, manifest: Union[Source, Query, Response, Article]) -> None:
+        """Save a manifest, index it and update the manifests it belongs to.
+
+        Manifests already in the corpus are saved over, wherever they are.
+        """
+        self.write(manifest)
+        self.update_parents(manifest)
+
+    def write(self, manifest: Union[Source, Query, Response, Article]) -> None:
+        """Save a manifest and index it, leaving the manifests it belongs to
+        be."""
+        manifest_type = type(manifest)
+        if manifest.name in self.filenames:
+            dirpath = self.filenames[manifest.name].parent
+        else:
+            dirpath = self.dirpath / self.dirs.get(manifest_type, "")
+        db.save_manifest_file(manifest, dirpath)
+        self.dirty.pop(manifest.name, None)
+
+        # Index it the way it was saved, so headers all look the same.
+        self.add(model.to_json(manifest), dirpath / f"{manifest.name}.json")
+        if manifest_type is not Article:
+            self.objects[manifest.name] = manifest
+        elif self.index is not None:
+            self.index.add([manifest])
+
+    def update_parents(
+        self, manifest: Union[Source, Query, Response, Article]
+    ) -> None:
+        """Add a manifest to the manifests it belongs to, if it isn't there."""
+        manifest_type = type(manifest)
+
+        # Keep back-references up to date: an article belongs to a source, a
+        # query and a response; a response to a source and a query; etc.
+        names_field = _NAMES_FIELDS.get(manifest_type)
+        if not names_field:
+            return
+        for field in ["source_name", "query_name", "response_name"]:
+            parent = self.get(getattr(manifest, field, ""))
+            if parent is None or not hasattr(parent, names_field):
+                continue
+            names = getattr(parent, names_field)
+            if manifest.name in names:
+                continue
+            if isinstance(names, set):
+                names.add(manifest.name)
+            else:
+                names.append(manifest.name)
+            self.save_parent(parent)
+
+    def save_parent(self, parent: Union[Source, Query, Response]) -> None:
+        """Save a manifest whose list of names changed, or hold it back for
+        flush() if we're deferring."""
+        if self.is_deferring:
+            self.dirty[parent.name] = parent
+        else:
+            self.save_merged(parent)
+
+    def save_merged(self, parent: Union[Source, Query, Response]) -> None:
+        """Save a manifest whose list of names changed, along with any names
+        other processes have added to it on disk since we loaded it."""
+        log = getLogger(__name__)
+
+        filename = self.filenames.get(parent.name)
+        with self.locked():
+            on_disk = None
+            if filename is not None and filename.exists():
+                try:
+                    on_disk = db.read_manifest_file(filename)
+                except json.JSONDecodeError:
+                    log.warning("Could not decode JSON manifest: %s" % filename)
+            for names_field in _NAMES_FIELDS.values():
+                if not hasattr(parent, names_field):
+                    continue
+                names = getattr(parent, names_field)
+                for name in getattr(on_disk, names_field, []):
+                    if name in names or name in self.removed:
+                        continue
+                    if isinstance(names, set):
+                        names.add(name)
+                    else:
+                        names.append(name)
+            self.write(parent)
+        self.update_parents(parent)
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Hold the corpus against other threads and, where there's fcntl,
+        other processes."""
+        fcntl = lazy.import_optional("fcntl")
+        with self.lock:
+            if fcntl is None:
+                yield
+                return
+            self.dirpath.mkdir(parents=True, exist_ok=True)
+            with open(self.dirpath / _LOCK_FILENAME, "a") as lockfile:
+                fcntl.flock(lockfile, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lockfile, fcntl.LOCK_UN)
@@ -1,17 +1,47 @@
 """File handling and data management tools.
 
+Articles can also be exported to Parquet, partitioned by source and query, if
+pyarrow is installed. See save_parquet().
+
 Todo:
     Write handlers for Mongo DB.
 """
 import json
+import shutil
 from copy import copy
 from logging import getLogger
 from pathlib import Path
-from typing import Iterator, Union
+from typing import Iterable, Iterator, Union
+from zipfile import ZIP_DEFLATED, ZipFile
 
-from we1s_chomp import model
+from we1s_chomp import clean, lazy, metrics, model, profiling, spool
 from we1s_chomp.model import Article, Query, Response, Source
 
+###############################################################################
+# Internal configuration parameters.                                          #
+###############################################################################
+
+
+_DEFAULT_ROW_GROUP_BYTES = 64 * 1024 * 1024
+"""Default max. size in bytes of the text in one Parquet row group."""
+
+_DEFAULT_ROW_GROUP_SIZE = 10000
+"""Default max. number of articles in one Parquet row group."""
+
+_PARQUET_PARTITIONS = ["source_name", "query_name"]
+"""Article fields to partition Parquet exports by, in directory order."""
+
+_PARQUET_TYPES = {
+    "created_date": "timestamp",
+    "updated_date": "timestamp",
+    "pub_date": "timestamp",
+    "length": "int64",
+    "notes": "list",
+    "keywords": "list",
+}
+"""Parquet column type for each Article field that isn't a string."""
+
+
 ###############################################################################
 # Load/import functions.                                                      #
 ###############################################################################
@@ -58,7 +88,7 @@ def load_manifest_file(
     # In theory we could assume that the filename is the name field, since it
     # usually is--but this is probably a safer way to do it. It may need some
     # performance testing, especially with larger data sets, to make sure it's
-    # not bogging us down.
+    # not bogging us down. (If it is, try corpus.Corpus.)
     manifest = None
     for filename in dirpath.glob("**/*.json"):
         with open(filename, encoding="utf-8") as jsonfile:
@@ -69,6 +99,34 @@ def load_manifest_file(
         log.error('JSON manifest "%s" not found in path: %s' % (name, dirpath))
 
     # Load raw HTML content if necessary.
+    load_manifest_html(manifest, filename.parent)
+
+    log.info("Loaded manifest: %s" % filename)
+    return manifest
+
+
+def read_manifest_file(filename: Path) -> Union[Source, Query, Response, Article]:
+    """Load a JSON manifest from a file by its filename."""
+    log = getLogger(__name__)
+
+    try:
+        with open(filename, encoding="utf-8") as jsonfile:
+            manifest = json.load(jsonfile, object_hook=model.from_json)
+    except FileNotFoundError:
+        log.error("JSON manifest not found: %s" % filename)
+        return None
+
+    # Load raw HTML content if necessary.
+    load_manifest_html(manifest, filename.parent)
+
+    log.info("Loaded manifest: %s" % filename)
+    return manifest
+
+
+def load_manifest_html(manifest: Article, dirpath: Path) -> None:
+    """Swap the HTML filename in a manifest for the HTML itself."""
+    log = getLogger(__name__)
+
     if hasattr(manifest, "content_html") and manifest.content_html != "":
         filename_html = Path(dirpath) / manifest.content_html
         if filename_html.exists():
@@ -76,12 +134,10 @@ def load_manifest_file(
                 manifest.content_html = htmlfile.read()
         else:
             log.warning(
-                'Raw HTML specified in "%s" but not found: %s' % (name, filename_html)
+                'Raw HTML specified in "%s" but not found: %s'
+                % (manifest.name, filename_html)
             )
 
-    log.info("Loaded manifest: %s" % filename)
-    return manifest
-
 
 ###############################################################################
 # Save/export functions.                                                      #
@@ -101,6 +157,104 @@ def check_path(dirpath: Path, create: bool = False) -> bool:
     return path_exists
 
 
+def save_archive(filenames: Iterable[Path], archive_filename: Path) -> int:
+    """Save files to a zip archive, flattening their paths.
+
+    Returns:
+        Number of files archived.
+    """
+    log = getLogger(__name__)
+
+    count = 0
+    check_path(archive_filename.parent, create=True)
+    with ZipFile(archive_filename, "w", compression=ZIP_DEFLATED) as zipfile:
+        for filename in filenames:
+            zipfile.write(filename, filename.name)
+            count += 1
+    log.info("Saved %i files to archive: %s" % (count, archive_filename))
+    return count
+
+
+def save_parquet(
+    articles: Iterable[Article],
+    dirpath: Path,
+    is_including_html: bool = False,
+    row_group_size: int = _DEFAULT_ROW_GROUP_SIZE,
+    row_group_bytes: int = _DEFAULT_ROW_GROUP_BYTES,
+) -> int:
+    """Save articles to a Parquet dataset, partitioned by source and query.
+
+    Files go in Hive-style directories, e.g.
+    dirpath/source_name=we1s/query_name=.../part-0.parquet, so readers can
+    skip straight to the partitions they want. Partitions we write to are
+    replaced; the rest are left alone. Articles are written as they come, in
+    row groups of bounded size, so only one row group is held in memory.
+
+    Args:
+        articles: Articles to save.
+        dirpath: Root directory of the dataset.
+        is_including_html: Save raw HTML in a content_html column. It's left
+            out by default, since it's most of the size. Spooled HTML (see
+            spool.py) is read in.
+        row_group_size: Max. number of articles per row group.
+        row_group_bytes: Max. size in bytes of the content (and HTML) in a
+            row group.
+
+    Returns:
+        Number of articles saved.
+    """
+    log = getLogger(__name__)
+
+    pa = lazy.import_optional("pyarrow")
+    if pa is None:
+        log.error("pyarrow isn't installed; can't save Parquet: %s" % dirpath)
+        return 0
+    from pyarrow import dataset
+
+    schema = get_parquet_schema(is_including_html)
+    count = 0
+
+    def get_batches() -> Iterator:
+        nonlocal count
+        rows = []
+        size = 0
+        for article in articles:
+            row = {field: getattr(article, field) for field in schema.names}
+            if "content_html" in row:
+                row["content_html"] = spool.read(row["content_html"])
+            for field, value in row.items():
+                if _PARQUET_TYPES.get(field) == "timestamp" and isinstance(value, str):
+                    row[field] = clean.str_to_date(value)
+                elif isinstance(value, set):
+                    row[field] = sorted(value)
+            rows.append(row)
+            size += len(article.content) + len(row.get("content_html", ""))
+            if len(rows) >= row_group_size or size >= row_group_bytes:
+                count += len(rows)
+                yield pa.RecordBatch.from_pylist(rows, schema=schema)
+                rows = []
+                size = 0
+        if rows:
+            count += len(rows)
+            yield pa.RecordBatch.from_pylist(rows, schema=schema)
+
+    partitioning = dataset.partitioning(
+        pa.schema([schema.field(name) for name in _PARQUET_PARTITIONS]),
+        flavor="hive",
+    )
+    dataset.write_dataset(
+        pa.RecordBatchReader.from_batches(schema, get_batches()),
+        str(dirpath),
+        format="parquet",
+        partitioning=partitioning,
+        basename_template="part-{i}.parquet",
+        existing_data_behavior="delete_matching",
+        max_rows_per_group=row_group_size,
+    )
+    log.info("Saved %i articles to Parquet: %s" % (count, dirpath))
+    return count
+
+
 def save_html_file(content: str, filename: Path) -> None:
     """Save an HTML file."""
     log = getLogger(__name__)
@@ -111,10 +265,29 @@ def save_html_file(content: str, filename: Path) -> None:
         log.info("Saved HTML to: %s" % filename)
 
 
+def move_html_file(filename: Path, new_filename: Path) -> None:
+    """Move an HTML file, e.g. from the spool. A rename, if it's on the same
+    filesystem."""
+    log = getLogger(__name__)
+
+    if Path(filename) == Path(new_filename):
+        return
+    check_path(new_filename.parent, create=True)
+    shutil.move(str(filename), str(new_filename))
+    log.info("Moved HTML to: %s" % new_filename)
+
+
+@profiling.profiled("save_manifest_file")
+@metrics.timed("chomp_stage_seconds", stage="save")
 def save_manifest_file(
     data: Union[Source, Query, Response, Article], dirpath: Path
 ) -> None:
-    """Save a manifest to JSON file."""
+    """Save a manifest to JSON file.
+
+    Raw HTML spooled to a file (see spool.py) is moved into place, not copied.
+    The spool file is gone after that, so the manifest passed in is pointed
+    at where it went; spool.read() gets the HTML either way.
+    """
     log = getLogger(__name__)
 
     # Use a copy so we don't mess with the original object's contents.
@@ -123,7 +296,11 @@ def save_manifest_file(
     # Save raw HTML content if necessary.
     if hasattr(manifest, "content_html") and manifest.content_html != "":
         filename_html = dirpath / f"{manifest.name}.html"
-        save_html_file(manifest.content_html, filename_html)
+        if isinstance(manifest.content_html, Path):
+            move_html_file(manifest.content_html, filename_html)
+            data.content_html = filename_html
+        else:
+            save_html_file(manifest.content_html, filename_html)
         manifest.content_html = f"{manifest.name}.html"
 
     check_path(dirpath, create=True)
@@ -133,3 +310,30 @@ def save_manifest_file(
             manifest, jsonfile, default=model.to_json, indent=4, ensure_ascii=False
         )
     log.info('Saved manifest "%s" to: %s' % (manifest.name, filename))
+
+
+###############################################################################
+# Helper functions.                                                           #
+###############################################################################
+
+
+def get_parquet_schema(is_including_html: bool = False):
+    """Get the Parquet schema for articles, from the Article fields.
+
+    Raises:
+        ImportError: If pyarrow isn't installed.
+    """
+    import pyarrow as pa
+
+    types = {
+        "int64": pa.int64(),
+        "list": pa.list_(pa.string()),
+        "timestamp": pa.timestamp("s"),
+    }
+    return pa.schema(
+        [
+            (field, types.get(_PARQUET_TYPES.get(field), pa.string()))
+            for field in Article._fields
+            if is_including_html or field != "content_html"
+        ]
+    )
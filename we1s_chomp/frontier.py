@@ -0,0 +1,512 @@
+"""Shared crawl frontier.
+
+A Frontier is a work queue that several collectors--threads, processes or
+whole machines--can pull from at once. Each task is identified by its kind
+(e.g. "query" or "page") and a key, and is only ever enqueued once. Workers
+lease a task, do the work, then ack it. If a worker dies mid-task, its lease
+runs out and the task goes back in line for somebody else.
+
+SQLiteFrontier keeps everything in a SQLite database in WAL mode, so workers on
+one box can coordinate through a single file. WAL needs shared memory, so the
+file must be on a local disk, not a network drive. MemoryFrontier does the same
+in-process, for tests and one-off runs. Anything else can stand in by
+implementing the abstract methods of Frontier.
+
+Frontiers can also stand in for the url_stops sets the collectors use to avoid
+dupes. See FrontierSet.
+"""
+import json
+import sqlite3
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from logging import getLogger
+from pathlib import Path
+from threading import Lock, local
+from time import time
+from typing import Any, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+###############################################################################
+# Internal configuration parameters.                                          #
+###############################################################################
+
+
+_DEFAULT_LEASE_TIME = 300.0
+"""Default time in seconds a worker has to finish a task before it's retried."""
+
+_DEFAULT_MAX_ATTEMPTS = 3
+"""Default number of times to try a task before giving up on it."""
+
+_SQLITE_TIMEOUT = 60.0
+"""Time in seconds to wait for another worker to unlock the database."""
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+###############################################################################
+# Frontier classes.                                                           #
+###############################################################################
+
+
+class Task(NamedTuple):
+    """Unit of work leased from a frontier."""
+
+    kind: str
+    key: str
+    data: Any = None
+    attempts: int = 0
+
+
+class Frontier(ABC):
+    """Work queue with lease/ack semantics. Subclass this for new backends."""
+
+    def __init__(
+        self,
+        lease_time: float = _DEFAULT_LEASE_TIME,
+        max_attempts: int = _DEFAULT_MAX_ATTEMPTS,
+    ):
+        """Create a new Frontier instance.
+
+        Args:
+            lease_time: Time in seconds a worker has to finish (or extend) a
+                task before it goes back in line.
+            max_attempts: Number of times to lease a task before giving up on
+                it and marking it failed.
+        """
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+
+    def __contains__(self, item: Tuple[str, str]) -> bool:
+        """Check if a (kind, key) task has ever been enqueued."""
+        return self.get_status(*item) is not None
+
+    @abstractmethod
+    def put(self, kind: str, key: str, data: Any = None) -> bool:
+        """Enqueue a task, unless one with the same kind and key exists.
+
+        Args:
+            kind: Kind of task, e.g. "page".
+            key: Unique key for the task within its kind, e.g. a URL.
+            data: JSON-serializable data the worker will need.
+
+        Returns:
+            True if the task was enqueued, False if it's a dupe.
+        """
+
+    @abstractmethod
+    def claim(self, kind: str, key: str, worker: str = "") -> bool:
+        """Lease a key directly, enqueuing it if necessary.
+
+        Used to make sure only one worker handles a key (e.g. an article URL)
+        found in the course of another task. Ack it once it's done.
+
+        Returns:
+            True if the key is ours, False if it's done or somebody else has
+            it.
+        """
+
+    @abstractmethod
+    def lease(self, kinds: Iterable[str], worker: str = "") -> Optional[Task]:
+        """Lease the next available task.
+
+        Tasks whose leases have run out count as available. Tasks are taken
+        first by kind, in the order given, then in the order they were
+        enqueued.
+
+        Args:
+            kinds: Kinds of task to lease.
+            worker: Name of the worker, for the record.
+
+        Returns:
+            Task, or None if nothing is available right now.
+        """
+
+    @abstractmethod
+    def extend(self, task: Task) -> None:
+        """Renew a task's lease, for work that takes a while."""
+
+    @abstractmethod
+    def ack(self, task: Task) -> None:
+        """Mark a task done."""
+
+    @abstractmethod
+    def nack(self, task: Task, delay: float = 0.0) -> None:
+        """Put a task back in line, or mark it failed if out of attempts.
+
+        Args:
+            task: Task to give up.
+            delay: Time in seconds before the task can be leased again.
+        """
+
+    @abstractmethod
+    def count(self, kinds: Iterable[str], statuses: Iterable[str]) -> int:
+        """Count tasks by kind and status."""
+
+    @abstractmethod
+    def get_status(self, kind: str, key: str) -> Optional[str]:
+        """Get a task's status, or None if it's never been enqueued.
+
+        Tasks whose leases have run out count as pending.
+        """
+
+    @abstractmethod
+    def increment(self, name: str, initial: int = 0) -> int:
+        """Get the next value of a shared counter, e.g. for naming manifests.
+
+        Args:
+            name: Name of the counter.
+            initial: First value, if the counter doesn't exist yet.
+        """
+
+    def is_finished(self, kinds: Iterable[str]) -> bool:
+        """Check if there's no more work of these kinds, leased or otherwise."""
+        return self.count(kinds, [PENDING, LEASED]) == 0
+
+
+class MemoryFrontier(Frontier):
+    """Frontier kept in memory. Can only be shared between threads."""
+
+    def __init__(self, **kwargs):
+        """Create a new MemoryFrontier instance. See Frontier for arguments."""
+        super().__init__(**kwargs)
+        self.tasks = {}
+        self.counters = {}
+        self.lock = Lock()
+
+    def put(self, kind: str, key: str, data: Any = None) -> bool:
+        with self.lock:
+            if (kind, key) in self.tasks:
+                return False
+            self.tasks[(kind, key)] = {
+                "status": PENDING,
+                "data": data,
+                "attempts": 0,
+                "visible_at": 0.0,
+                "worker": None,
+            }
+            return True
+
+    def claim(self, kind: str, key: str, worker: str = "") -> bool:
+        with self.lock:
+            now = time()
+            task = self.tasks.get((kind, key))
+            if task and (task["status"] in (DONE, FAILED) or task["visible_at"] > now):
+                return False
+            self.tasks[(kind, key)] = {
+                "status": LEASED,
+                "data": task["data"] if task else None,
+                "attempts": task["attempts"] + 1 if task else 1,
+                "visible_at": now + self.lease_time,
+                "worker": worker,
+            }
+            return True
+
+    def lease(self, kinds: Iterable[str], worker: str = "") -> Optional[Task]:
+        with self.lock:
+            now = time()
+            for kind in kinds:
+                for (task_kind, key), task in self.tasks.items():
+                    if (
+                        task_kind != kind
+                        or task["status"] not in (PENDING, LEASED)
+                        or task["visible_at"] > now
+                    ):
+                        continue
+                    if task["attempts"] >= self.max_attempts:
+                        task["status"] = FAILED
+                        continue
+                    task["status"] = LEASED
+                    task["attempts"] += 1
+                    task["visible_at"] = now + self.lease_time
+                    task["worker"] = worker
+                    return Task(kind, key, task["data"], task["attempts"])
+            return None
+
+    def extend(self, task: Task) -> None:
+        with self.lock:
+            self.tasks[(task.kind, task.key)]["visible_at"] = time() + self.lease_time
+
+    def ack(self, task: Task) -> None:
+        with self.lock:
+            self.tasks[(task.kind, task.key)]["status"] = DONE
+
+    def nack(self, task: Task, delay: float = 0.0) -> None:
+        with self.lock:
+            state = self.tasks[(task.kind, task.key)]
+            is_failed = state["attempts"] >= self.max_attempts
+            state["status"] = FAILED if is_failed else PENDING
+            state["visible_at"] = time() + delay
+
+    def count(self, kinds: Iterable[str], statuses: Iterable[str]) -> int:
+        kinds, statuses = set(kinds), set(statuses)
+        with self.lock:
+            return sum(
+                1
+                for (kind, _), task in self.tasks.items()
+                if kind in kinds and task["status"] in statuses
+            )
+
+    def get_status(self, kind: str, key: str) -> Optional[str]:
+        task = self.tasks.get((kind, key))
+        if not task:
+            return None
+        if task["status"] == LEASED and task["visible_at"] <= time():
+            return PENDING
+        return task["status"]
+
+    def increment(self, name: str, initial: int = 0) -> int:
+        with self.lock:
+            value = self.counters.get(name, initial)
+            self.counters[name] = value + 1
+            return value
+
+
+class SQLiteFrontier(Frontier):
+    """Frontier kept in a SQLite database, shared by any number of workers."""
+
+    def __init__(self, filename: Path, **kwargs):
+        """Create a new SQLiteFrontier instance. See Frontier for arguments.
+
+        Args:
+            filename: Database file. Created if necessary.
+        """
+        super().__init__(**kwargs)
+        self.filename = Path(filename)
+        self.local = local()
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        with self.transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " kind TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " data TEXT,"
+                " status TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " visible_at REAL NOT NULL DEFAULT 0,"
+                " worker TEXT,"
+                " UNIQUE (kind, key))"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS tasks_status"
+                " ON tasks (kind, status, visible_at)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS counters ("
+                " name TEXT PRIMARY KEY,"
+                " value INTEGER NOT NULL)"
+            )
+
+    def get_connection(self) -> sqlite3.Connection:
+        """Get this thread's database connection, connecting if necessary."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                str(self.filename), timeout=_SQLITE_TIMEOUT, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run statements in a write transaction, one worker at a time."""
+        conn = self.get_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def put(self, kind: str, key: str, data: Any = None) -> bool:
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO tasks (kind, key, data, status)"
+                " VALUES (?, ?, ?, ?)",
+                (kind, key, json.dumps(data), PENDING),
+            )
+            return cursor.rowcount > 0
+
+    def claim(self, kind: str, key: str, worker: str = "") -> bool:
+        now = time()
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO tasks (kind, key, data, status)"
+                " VALUES (?, ?, ?, ?)",
+                (kind, key, json.dumps(None), PENDING),
+            )
+            cursor = conn.execute(
+                "UPDATE tasks SET status = ?, attempts = attempts + 1,"
+                " visible_at = ?, worker = ?"
+                " WHERE kind = ? AND key = ? AND status IN (?, ?)"
+                " AND visible_at <= ?",
+                (
+                    LEASED,
+                    now + self.lease_time,
+                    worker,
+                    kind,
+                    key,
+                    PENDING,
+                    LEASED,
+                    now,
+                ),
+            )
+            return cursor.rowcount > 0
+
+    def lease(self, kinds: Iterable[str], worker: str = "") -> Optional[Task]:
+        log = getLogger(__name__)
+
+        now = time()
+        with self.transaction() as conn:
+            for kind in kinds:
+
+                # Give up on tasks that keep failing.
+                cursor = conn.execute(
+                    "UPDATE tasks SET status = ?"
+                    " WHERE kind = ? AND status IN (?, ?) AND visible_at <= ?"
+                    " AND attempts >= ?",
+                    (FAILED, kind, PENDING, LEASED, now, self.max_attempts),
+                )
+                if cursor.rowcount:
+                    log.warning("Gave up on %i %s tasks." % (cursor.rowcount, kind))
+
+                row = conn.execute(
+                    "SELECT id, key, data, attempts FROM tasks"
+                    " WHERE kind = ? AND status IN (?, ?) AND visible_at <= ?"
+                    " ORDER BY id LIMIT 1",
+                    (kind, PENDING, LEASED, now),
+                ).fetchone()
+                if row is None:
+                    continue
+                task_id, key, data, attempts = row
+                conn.execute(
+                    "UPDATE tasks SET status = ?, attempts = ?, visible_at = ?,"
+                    " worker = ? WHERE id = ?",
+                    (LEASED, attempts + 1, now + self.lease_time, worker, task_id),
+                )
+                return Task(kind, key, json.loads(data), attempts + 1)
+        return None
+
+    def extend(self, task: Task) -> None:
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE tasks SET visible_at = ? WHERE kind = ? AND key = ?",
+                (time() + self.lease_time, task.kind, task.key),
+            )
+
+    def ack(self, task: Task) -> None:
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE tasks SET status = ? WHERE kind = ? AND key = ?",
+                (DONE, task.kind, task.key),
+            )
+
+    def nack(self, task: Task, delay: float = 0.0) -> None:
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END,"
+                " visible_at = ? WHERE kind = ? AND key = ?",
+                (
+                    self.max_attempts,
+                    FAILED,
+                    PENDING,
+                    time() + delay,
+                    task.kind,
+                    task.key,
+                ),
+            )
+
+    def count(self, kinds: Iterable[str], statuses: Iterable[str]) -> int:
+        kinds, statuses = list(kinds), list(statuses)
+        row = (
+            self.get_connection()
+            .execute(
+                "SELECT COUNT(*) FROM tasks WHERE kind IN (%s) AND status IN (%s)"
+                % (",".join("?" * len(kinds)), ",".join("?" * len(statuses))),
+                kinds + statuses,
+            )
+            .fetchone()
+        )
+        return row[0]
+
+    def get_status(self, kind: str, key: str) -> Optional[str]:
+        row = (
+            self.get_connection()
+            .execute(
+                "SELECT CASE WHEN status = ? AND visible_at <= ? THEN ? ELSE status END"
+                " FROM tasks WHERE kind = ? AND key = ?",
+                (LEASED, time(), PENDING, kind, key),
+            )
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def increment(self, name: str, initial: int = 0) -> int:
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO counters (name, value) VALUES (?, ?)",
+                (name, initial),
+            )
+            conn.execute(
+                "UPDATE counters SET value = value + 1 WHERE name = ?", (name,)
+            )
+            return conn.execute(
+                "SELECT value - 1 FROM counters WHERE name = ?", (name,)
+            ).fetchone()[0]
+
+
+###############################################################################
+# Helper classes.                                                             #
+###############################################################################
+
+
+class FrontierSet:
+    """Set-like view of one kind of key in a frontier, to use as url_stops.
+
+    The collectors check url_stops for URLs they shouldn't touch and add the
+    ones they collect. With a FrontierSet, adding a URL claims it for this
+    worker; other workers will skip it until it's acked (for good) or the
+    claim runs out (if we die before we can save it).
+    """
+
+    def __init__(
+        self, frontier: Frontier, kind: str, worker: str = "", keys: Iterable[str] = ()
+    ):
+        """Create a new FrontierSet instance.
+
+        Args:
+            frontier: Frontier to keep keys in.
+            kind: Kind of task to file keys under, e.g. "url".
+            worker: Name of this worker.
+            keys: Keys known to be done already, e.g. from a checkpoint. These
+                are only kept locally.
+        """
+        self.frontier = frontier
+        self.kind = kind
+        self.worker = worker
+        self.claimed = set()
+        self.keys = set(keys)
+
+    def __contains__(self, key: str) -> bool:
+        if key in self.claimed or key in self.keys:
+            return True
+        return self.frontier.get_status(self.kind, key) in (LEASED, DONE, FAILED)
+
+    def add(self, key: str) -> None:
+        """Claim a key for this worker, if nobody else has it."""
+        if self.frontier.claim(self.kind, key, self.worker):
+            self.claimed.add(key)
+
+    def is_claimed(self, key: str) -> bool:
+        """Check if a key is claimed by this worker."""
+        return key in self.claimed
+
+    def ack(self, key: str) -> None:
+        """Mark a claimed key done for good."""
+        self.frontier.ack(Task(self.kind, key))
+        self.claimed.discard(key)
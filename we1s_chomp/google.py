@@ -1,11 +1,21 @@
 """Scraping tools for the Google API.
 """
 import json
-from datetime import datetime
+from contextlib import contextmanager, suppress
+from datetime import datetime, timedelta
+from itertools import count
 from logging import getLogger
-from typing import Dict, Iterator, Optional, Set, Tuple
-
-from we1s_chomp import clean, web
+from pathlib import Path
+from threading import Lock
+from time import sleep, time
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
+from urllib.parse import parse_qsl, urlsplit
+from zoneinfo import ZoneInfo
+
+from we1s_chomp import clean, lazy, metrics, profiling, web
+from we1s_chomp.cache import Cache
+from we1s_chomp.model import Payload, load_payload
+from we1s_chomp.spool import Spool
 
 ###############################################################################
 # Internal configuration parameters.                                          #
@@ -15,9 +25,142 @@
 _API_URL = "https://www.googleapis.com/customsearch/v1"
 """Base URL of Google CSE API."""
 
+_DEFAULT_DAILY_QUOTA = 100
+"""Default number of Google CSE queries allowed per day."""
+
+_DEFAULT_NUM_CLEAN_WORKERS = 0
+"""Default number of processes to clean articles with, or 0 for none."""
+
+_DEFAULT_NUM_WORKERS = 1
+"""Default number of result pages or articles to request at once."""
+
 _DEFAULT_PAGE_LIMIT = 10
 """Stop after this # of pages, or -1 for no limit."""
 
+_DEFAULT_QUOTA_INTERVAL = 1.0
+"""Default minimum time in seconds between Google CSE queries."""
+
+_QUOTA_TIMEZONE = "America/Los_Angeles"
+"""Google resets CSE quotas at midnight Pacific time, daylight saving and
+all."""
+
+
+###############################################################################
+# Quota management.                                                           #
+###############################################################################
+
+
+class Quota:
+    """Daily Google CSE quota counter.
+
+    The count is kept in a JSON file, so it carries over between runs. It can
+    be shared by several threads, and on POSIX systems by several processes,
+    which take turns with a lock file next to it. Queries are spaced out by a
+    minimum interval to stay clear of the per-minute limit, and once the daily
+    quota is spent we either wait for it to reset or refuse further queries.
+    Nobody holds the lock while they wait.
+    """
+
+    def __init__(
+        self,
+        filename: Path,
+        daily_limit: int = _DEFAULT_DAILY_QUOTA,
+        min_interval: float = _DEFAULT_QUOTA_INTERVAL,
+        is_waiting: bool = False,
+    ):
+        """Create a new Quota instance.
+
+        Args:
+            filename: JSON file to keep the count in. Created if necessary.
+            daily_limit: Number of queries allowed per day.
+            min_interval: Minimum time in seconds between queries.
+            is_waiting: Wait for the quota to reset when it runs out. Set
+                False to refuse queries instead.
+        """
+        self.filename = Path(filename)
+        self.daily_limit = daily_limit
+        self.min_interval = min_interval
+        self.is_waiting = is_waiting
+        self.lock = Lock()
+
+    def acquire(self, query_str: str) -> bool:
+        """Spend one query, waiting our turn if necessary.
+
+        Args:
+            query_str: Search term to charge the query to.
+
+        Returns:
+            True if we may go ahead, False if the quota is spent.
+        """
+        log = getLogger(__name__)
+
+        while True:
+            with self.locked():
+                state = self.load()
+                if state["count"] >= self.daily_limit:
+                    if not self.is_waiting:
+                        log.warning("Google CSE daily quota spent: %s" % self.filename)
+                        return False
+                    time_to_wait = get_quota_reset()
+                    log.warning(
+                        "Google CSE daily quota spent, waiting %i seconds for reset."
+                        % time_to_wait
+                    )
+                else:
+                    # Space out our queries, whoever made them.
+                    time_to_wait = self.min_interval - (
+                        time() - state.get("last_query", 0.0)
+                    )
+                    if time_to_wait <= 0:
+                        state["count"] += 1
+                        state["last_query"] = time()
+                        queries = state["queries"]
+                        queries[query_str] = queries.get(query_str, 0) + 1
+                        self.save(state)
+                        return True
+
+            # Someone else may get in first, so check again after.
+            sleep(time_to_wait)
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Hold the quota file against other threads and, where there's
+        fcntl, other processes."""
+        fcntl = lazy.import_optional("fcntl")
+        with self.lock:
+            if fcntl is None:
+                yield
+                return
+            self.filename.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.filename.with_suffix(".lock"), "a") as lockfile:
+                fcntl.flock(lockfile, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+    def report(self) -> Dict[str, int]:
+        """Get the number of queries spent today, per search term."""
+        return self.load()["queries"]
+
+    def load(self) -> Dict:
+        """Load today's quota state, starting fresh on a new day."""
+        day = get_quota_day()
+        try:
+            with open(self.filename, encoding="utf-8") as jsonfile:
+                state = json.load(jsonfile)
+        except (FileNotFoundError, json.JSONDecodeError):
+            state = {}
+        if state.get("day") != day:
+            state = {"day": day, "count": 0, "queries": {}}
+        return state
+
+    def save(self, state: Dict) -> None:
+        """Save quota state."""
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.filename, "w", encoding="utf-8") as jsonfile:
+            json.dump(state, jsonfile, indent=4)
+
 
 ###############################################################################
 # Collector functions.                                                        #
@@ -25,6 +168,7 @@
 
 
 # Step 1: Get search responses.
+@profiling.profiled("get_responses")
 def get_responses(
     query_str: str,
     base_url: str,
@@ -34,6 +178,12 @@ def get_responses(
     url_stopwords: Set[str] = set(),
     page_limit: int = _DEFAULT_PAGE_LIMIT,
     browser: Optional[web.Browser] = None,
+    num_workers: int = _DEFAULT_NUM_WORKERS,
+    cache: Optional[Cache] = None,
+    quota: Optional[Quota] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    is_counting_filtered: bool = False,
 ) -> Iterator[Tuple[str, str]]:
     """Collect raw JSON search responses from Google CSE API.
 
@@ -48,9 +198,24 @@ def get_responses(
         page_limit: Stop after this # of pages, or -1 for no limit.
         browser: Selenium configuration information. Set None to use Requests
             module.
+        num_workers: Number of result pages to request at once. Every page URL
+            is known up front, so pages can be fetched concurrently; results
+            are still returned in page order.
+        cache: Cache for API responses. Pages found here don't cost quota.
+            Only pages with results are kept.
+        quota: Daily quota counter. Collection stops (or waits, depending on
+            how it's set up) when the quota is spent.
+        start_date: Start date of query. If set along with end_date, results
+            outside the date range are filtered out by Google before we ever
+            see them.
+        end_date: End date of query.
+        is_counting_filtered: Also get the first page without the date range
+            (from the cache, or for one more query) and report how many
+            results the date range filtered out.
 
     Returns:
-        Generator continaing formatted JSON strings with response data.
+        Generator continaing raw JSON strings with response data, as Payloads
+        carrying the parsed data along with them.
     """
     log = getLogger(__name__)
 
@@ -58,69 +223,155 @@ def get_responses(
     # the requests module.
     collector = web.get_interface(browser)
 
-    # Check for collected pages and URL stop words.
+    # Check for collected pages and URL stop words. Every page URL is known up
+    # front, so we can skip straight past the ones we already have.
     skipped = 0
-    page = 1
-    url = get_url(query_str, base_url, page)
-    while not web.is_url_ok(url, url_stops, url_stopwords):
-        log.info("Skipping %s." % url)
-        page += 1
-        skipped += 1
-        url = get_url(query_str, base_url, page)
-
-    # Stop after page limit, if set.
-    count = 0
-    while page_limit == -1 or page <= page_limit:
-
-        # Collect the result.
-        res = collector(
-            url.format(cx=google_cx, key=google_key), is_expecting_json=True
-        )
+    pages = {}
+
+    def get_urls() -> Iterator[str]:
+        nonlocal skipped
+        for page in range(1, page_limit + 1) if page_limit != -1 else count(1):
+            url = get_url(query_str, base_url, page, start_date, end_date)
+            if not web.is_url_ok(url, url_stops, url_stopwords):
+                log.info("Skipping %s." % url)
+                metrics.inc("chomp_skips_total", reason=web.SKIP_URL_STOP)
+                skipped += 1
+                continue
+            pages[url] = page
+            yield url
+
+    # With several workers, later pages are requested before earlier ones come
+    # back. Once a page comes back empty, the ones after it aren't worth any
+    # quota.
+    last_page = None
+    last_page_lock = Lock()
+
+    def set_last_page(url: str) -> None:
+        nonlocal last_page
+        page = pages.get(url)
+        with last_page_lock:
+            if page is not None and (last_page is None or page < last_page):
+                last_page = page
+
+    # Check the cache before spending any quota.
+    cached = spent = 0
+    count_lock = Lock()
+
+    def fetch(url: str) -> Optional[Payload]:
+        nonlocal cached, spent
+        key = get_cache_key(url)
+        res = cache.get(key) if cache is not None else None
+        is_cached = res is not None
+        if is_cached:
+            log.info("Found %s in cache." % url)
+            with count_lock:
+                cached += 1
+        else:
+            page = pages.get(url)
+            if page is not None and last_page is not None and page > last_page:
+                log.info("Skipping %s (past the last page)." % url)
+                return None
+            if quota is not None and not quota.acquire(query_str):
+                set_last_page(url)
+                return None
+            with count_lock:
+                spent += 1
+            res = collector(
+                url.format(cx=google_cx, key=google_key), is_expecting_json=True
+            )
+
         try:
-            res = json.loads(res)
-        except json.JSONDecodeError:
+            data = json.loads(res)
+        except (json.JSONDecodeError, TypeError):
             log.warning("Could not decode JSON response from %s." % url)
-            break
+            set_last_page(url)
+            return None
+        if not is_page_ok(data):
+            set_last_page(url)
+
+        # Keep the raw response, so we don't have to encode it again. Only
+        # pages with results, though: the ones after them may fill up later.
+        # Setting a hit again would keep it from ever going stale.
+        elif cache is not None and not is_cached:
+            cache.set(key, res)
+        return Payload(res, data)
+
+    # Collect results one at a time or fan out over a batch of workers.
+    if num_workers > 1:
+        results = web.get_batch(get_urls(), fetch, num_workers)
+    else:
+        results = ((url, fetch(url)) for url in get_urls())
+
+    num_collected = 0
+    for url, payload in results:
 
         # Break when we run out of stuff to collect or if we hit an error.
-        if (
-            not res  # Did we get a response?
-            or not isinstance(res, dict)  # Is it a dict?
-            or res.get("error", False)  # Is there an error?
-            or not res.get("items", False)  # Did we get any content?
-        ):
+        res = payload.data if payload is not None else None
+        if not is_page_ok(res):
             print("Out of pages or no content at %s." % url)
             break
 
+        # Let the user know how much the date range narrowed things down.
+        if not num_collected and start_date and end_date:
+            num_in_range = get_total_results(res)
+            num_total = None
+            if is_counting_filtered:
+                payload_all = fetch(get_url(query_str, base_url))
+                if payload_all is not None:
+                    num_total = get_total_results(payload_all.data)
+            if num_in_range is not None and num_total is not None:
+                log.info(
+                    'Date range filtered out %i of %i Google CSE results for "%s".'
+                    % (max(num_total - num_in_range, 0), num_total, query_str)
+                )
+            else:
+                log.info(
+                    "Google CSE found %s results for %s in date range."
+                    % ("?" if num_in_range is None else num_in_range, url)
+                )
+
         # Save response.
-        count += 1
+        num_collected += 1
         url_stops.add(url)
-        yield url, json.dumps(res)
+        yield url, payload
 
-        # Get a new URL.
-        page += 1
-        url = get_url(query_str, base_url, page)
+    # Stop any pages still in flight.
+    results.close()
 
     log.info(
         "Collected %i responses (%i skipped) from %s with Google CSE API."
-        % (count, skipped, base_url)
+        % (num_collected, skipped, base_url)
+    )
+    log.info(
+        'Spent %i Google CSE queries on "%s" (%i found in cache).'
+        % (spent, query_str, cached)
     )
 
 
 # Step 2: Get metadata & content from responses.
+@profiling.profiled("get_metadata")
 def get_metadata(
-    response: str,
+    response: Union[Payload, str],
     query_str: str,
     start_date: datetime,
     end_date: datetime,
     url_stops: Set[str] = set(),
     url_stopwords: Set[str] = set(),
     browser: Optional[web.Browser] = None,
+    num_workers: int = _DEFAULT_NUM_WORKERS,
+    num_clean_workers: int = _DEFAULT_NUM_CLEAN_WORKERS,
+    spool: Optional[Spool] = None,
+    content_cache: Optional[Cache] = None,
 ) -> Iterator[Dict]:
     """Collect metadata from raw Google CSE API JSON response.
 
+    Collection runs as a pipeline: every result is checked against the URL
+    stops and date range first, then the survivors are fetched and cleaned
+    concurrently.
+
     Args:
-        response: Raw JSON string of response data.
+        response: Raw JSON string of response data, or a Payload straight
+            from get_responses().
         query_str: Term to search for. Articles that do not contain this str
             in their content field will be flagged as no_exact_match.
         start_date: Start date of query. Articles dated before this, and those
@@ -132,10 +383,18 @@ def get_metadata(
         url_stopwords: Skip all URLs that contain a word from this set.
         browser: Selenium configuration wrapper for scraping content. Set None
             to use Requests module.
+        num_workers: Number of articles to fetch at once.
+        num_clean_workers: Number of processes to clean article content with,
+            or 0 to clean it in this process.
+        spool: Write raw HTML here and return the spool file's Path as
+            content_html, instead of the HTML itself.
+        content_cache: Cache of cleaned content, so pages that haven't
+            changed aren't cleaned again. Set None to always clean.
 
     Returns:
         Generator containing article metadata as a dict (or None if error).
-        This can be used as-is or passed to the Article constructor.
+        This can be used as-is or passed to the Article constructor. With
+        more than one worker, articles are returned in the order they finish.
 
     Todo:
         Error checking for keys in response JSON.
@@ -146,21 +405,23 @@ def get_metadata(
     # the Requests module.
     collector = web.get_interface(browser)
 
-    # Parse JSON response.
+    # Parse JSON response, unless it's been done already.
     try:
-        response = json.loads(response)
+        response = load_payload(response)
     except json.JSONDecodeError:
         log.warning('Could not decode JSON response "%s".' % clean.get_stub(response))
         return None
 
-    # Loop over items in the response and parse metadata.
-    count = skipped = 0
+    # Check all the items in the response before we fetch anything.
+    count = skipped = skipped_date = 0
+    results = {}
     for result in response["items"]:
 
         # Skip if we hit one of the URL stops.
         url = result["link"]
-        if not web.is_url_ok(url, url_stops, url_stopwords):
+        if url in results or not web.is_url_ok(url, url_stops, url_stopwords):
             log.info("Skipping %s (URL in stop list)." % url)
+            metrics.inc("chomp_skips_total", reason=web.SKIP_URL_STOP)
             skipped += 1
             continue
 
@@ -170,18 +431,34 @@ def get_metadata(
         )
         if not date:
             log.info("Skipping %s (No date or out of date range)." % url)
+            metrics.inc("chomp_skips_total", reason=web.SKIP_DATE)
             skipped += 1
+            skipped_date += 1
             continue
 
-        # Scrape content.
-        content_html = collector(url)
+        results[url] = result, date
+
+    # Scrape and clean content.
+    if num_workers > 1:
+        pages = web.get_batch(results, collector, num_workers, ordered=False)
+    else:
+        pages = ((url, collector(url)) for url in results)
+    for url, content_html, content in clean.get_content_batch(
+        pages, num_clean_workers, cache=content_cache
+    ):
+        if isinstance(content_html, web.Skipped):
+            skipped += 1
+            continue
         if not content_html or content_html == "":
             log.info("Skipping %s (No content)." % url)
+            metrics.inc("chomp_skips_total", reason=web.SKIP_NO_CONTENT)
             skipped += 1
             continue
 
-        content = clean.get_content(content_html)
+        result, date = results[url]
         no_exact_match = query_str not in content
+        if spool is not None:
+            content_html = spool.write(content_html)
 
         # Save metadata and return.
         count += 1
@@ -196,7 +473,10 @@ def get_metadata(
         }
         log.info("Got %s." % url)
 
-    log.info("Collected %i articles (%i skipped)." % (count, skipped))
+    log.info(
+        "Collected %i articles (%i skipped, %i with no date or out of date range)."
+        % (count, skipped, skipped_date)
+    )
 
 
 ###############################################################################
@@ -204,29 +484,85 @@ def get_metadata(
 ###############################################################################
 
 
-def get_url(query_str: str, base_url: str, page: int = 1) -> str:
+def get_cache_key(url: str) -> List[Tuple[str, str]]:
+    """Get cache key for a query URL: its parameters, minus credentials."""
+    return sorted(
+        (k, v)
+        for k, v in parse_qsl(urlsplit(url).query, keep_blank_values=True)
+        if k not in {"cx", "key"}
+    )
+
+
+def get_quota_day(now: Optional[datetime] = None) -> str:
+    """Get the current Google CSE quota day as a string."""
+    tz = ZoneInfo(_QUOTA_TIMEZONE)
+    return (now or datetime.now(tz)).astimezone(tz).strftime("%Y-%m-%d")
+
+
+def get_quota_reset(now: Optional[datetime] = None) -> float:
+    """Get time in seconds until the Google CSE quota resets."""
+    tz = ZoneInfo(_QUOTA_TIMEZONE)
+    now = (now or datetime.now(tz)).astimezone(tz)
+    tomorrow = datetime.combine(
+        now.date() + timedelta(days=1), datetime.min.time(), tzinfo=tz
+    )
+
+    # Timestamps, since datetimes in the same zone subtract as wall time.
+    return tomorrow.timestamp() - now.timestamp()
+
+
+def get_total_results(data: Dict) -> Optional[int]:
+    """Get Google's estimate of the total number of results for a search, or
+    None if it didn't give one."""
+    with suppress(AttributeError, TypeError, ValueError):
+        return int(data.get("searchInformation", {}).get("totalResults"))
+    return None
+
+
+def get_url(
+    query_str: str,
+    base_url: str,
+    page: int = 1,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+) -> str:
     """Create query URL for Google CSE API search.
 
     Args:
         query_str: Search term to use.
         base_url: Site URL.
         page: Result page to start at.
+        start_date: Start of date range to restrict results to, if any.
+        end_date: End of date range to restrict results to, if any.
 
     Returns:
         Completed URL.
     """
-    return (
-        _API_URL
-        + "?"
-        + "&".join(
-            [
-                "cx={cx}",  # API ID. Sub at runtime to avoid storing in JSON.
-                "key={key}",  # API key; ditto.
-                "items(title,link,snippet)",  # Limit metadata to applicable info.
-                "filter=1",  # Use Google's dupe filter.
-                "siteSearch=" + base_url,
-                "q=" + query_str,
-                f"start={(page * 10) - 9}",
-            ]
+    params = [
+        "cx={cx}",  # API ID. Sub at runtime to avoid storing in JSON.
+        "key={key}",  # API key; ditto.
+        "items(title,link,snippet)",  # Limit metadata to applicable info.
+        "filter=1",  # Use Google's dupe filter.
+        "siteSearch=" + base_url,
+        "q=" + query_str,
+        f"start={(page * 10) - 9}",
+    ]
+
+    # Restrict to date range on Google's end.
+    if start_date and end_date:
+        params.append(
+            "sort=date:r:%s:%s"
+            % (start_date.strftime("%Y%m%d"), end_date.strftime("%Y%m%d"))
         )
+
+    return _API_URL + "?" + "&".join(params)
+
+
+def is_page_ok(res: Optional[Dict]) -> bool:
+    """Check if a page of search results has any results on it."""
+    return bool(
+        res  # Did we get a response?
+        and isinstance(res, dict)  # Is it a dict?
+        and not res.get("error", False)  # Is there an error?
+        and res.get("items", False)  # Did we get any content?
     )
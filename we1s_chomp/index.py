@@ -0,0 +1,310 @@
+"""Full-text index of collected articles.
+
+Finding out which articles we already have mention a term used to mean a new
+crawl. An Index keeps every article's title and content in a SQLite FTS5 table,
+alongside its source and publication date, so the corpus can be searched
+offline by phrase and date range. A Corpus with an Index keeps it up to date
+as articles are saved, and the pipeline fills new queries from it before going
+online.
+
+Usage:
+    chomp-search ./data/json "liberal arts" --start 2019-01-01 --end 2019-12-31
+"""
+import argparse
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from logging import getLogger
+from pathlib import Path
+from threading import local
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, Set, Union
+
+from we1s_chomp import clean
+from we1s_chomp.model import Article
+
+if TYPE_CHECKING:
+    from we1s_chomp.corpus import Corpus
+
+###############################################################################
+# Internal configuration parameters.                                          #
+###############################################################################
+
+
+_DEFAULT_FILENAME = Path(".cache") / "index.sqlite"
+"""Default index file, relative to the root directory of the manifests."""
+
+_SQLITE_TIMEOUT = 60.0
+"""Time in seconds to wait for another process to unlock the database."""
+
+_TOKENIZER = "unicode61 remove_diacritics 2"
+"""FTS5 tokenizer. Matches ignore case and accents, like a search engine."""
+
+
+###############################################################################
+# Index class.                                                                #
+###############################################################################
+
+
+class Index:
+    """Full-text index of articles, kept in a SQLite database."""
+
+    def __init__(self, filename: Path):
+        """Create a new Index instance.
+
+        Args:
+            filename: Database file. Created if necessary.
+        """
+        self.filename = Path(filename)
+        self.local = local()
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        with self.transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS articles ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " name TEXT NOT NULL UNIQUE,"
+                " url TEXT,"
+                " source_name TEXT,"
+                " pub_date TEXT)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS articles_pub_date"
+                " ON articles (source_name, pub_date)"
+            )
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts"
+                " USING fts5 (title, content, tokenize = '%s')" % _TOKENIZER
+            )
+
+    def __contains__(self, name: str) -> bool:
+        row = (
+            self.get_connection()
+            .execute("SELECT 1 FROM articles WHERE name = ?", (name,))
+            .fetchone()
+        )
+        return row is not None
+
+    def __len__(self) -> int:
+        conn = self.get_connection()
+        return conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+    @classmethod
+    def in_dir(cls, dirpath: Path) -> "Index":
+        """Get the default Index for a root directory of manifests."""
+        return cls(Path(dirpath) / _DEFAULT_FILENAME)
+
+    def get_connection(self) -> sqlite3.Connection:
+        """Get this thread's database connection, connecting if necessary."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                str(self.filename), timeout=_SQLITE_TIMEOUT, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run statements in a write transaction."""
+        conn = self.get_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def add(self, articles: Iterable[Article]) -> int:
+        """Index articles, replacing any already indexed under the same names.
+
+        Returns:
+            Number of articles indexed.
+        """
+        count = 0
+        with self.transaction() as conn:
+            for article in articles:
+                row = conn.execute(
+                    "SELECT id FROM articles WHERE name = ?", (article.name,)
+                ).fetchone()
+                values = (
+                    article.url,
+                    article.source_name,
+                    get_date_str(article.pub_date),
+                    article.name,
+                )
+                if row is None:
+                    article_id = conn.execute(
+                        "INSERT INTO articles (url, source_name, pub_date, name)"
+                        " VALUES (?, ?, ?, ?)",
+                        values,
+                    ).lastrowid
+                else:
+                    article_id = row[0]
+                    conn.execute(
+                        "UPDATE articles SET url = ?, source_name = ?, pub_date = ?"
+                        " WHERE name = ?",
+                        values,
+                    )
+                    conn.execute(
+                        "DELETE FROM articles_fts WHERE rowid = ?", (article_id,)
+                    )
+                conn.execute(
+                    "INSERT INTO articles_fts (rowid, title, content) VALUES (?, ?, ?)",
+                    (article_id, article.title, article.content),
+                )
+                count += 1
+        return count
+
+    def remove(self, names: Iterable[str]) -> int:
+        """Take articles out of the index by name.
+
+        Returns:
+            Number of articles removed.
+        """
+        count = 0
+        with self.transaction() as conn:
+            for name in names:
+                row = conn.execute(
+                    "SELECT id FROM articles WHERE name = ?", (name,)
+                ).fetchone()
+                if row is None:
+                    continue
+                conn.execute("DELETE FROM articles_fts WHERE rowid = ?", row)
+                conn.execute("DELETE FROM articles WHERE id = ?", row)
+                count += 1
+        return count
+
+    def get_names(self) -> Set[str]:
+        """Get the names of every indexed article."""
+        return {
+            name
+            for (name,) in self.get_connection().execute("SELECT name FROM articles")
+        }
+
+    def search(
+        self,
+        text: str,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        source_name: Optional[str] = None,
+        is_phrase: bool = True,
+        limit: int = -1,
+    ) -> List[str]:
+        """Find articles by their title and content.
+
+        Args:
+            text: Phrase to search for. Matches ignore case, accents and
+                punctuation, so check the content for an exact match if it
+                matters.
+            start_date: Only include articles published on or after this date.
+            end_date: Only include articles published on or before this date.
+            source_name: Only include articles from this source.
+            is_phrase: Set False to pass text through as an FTS5 query, e.g.
+                'humanities NOT "digital humanities"'.
+            limit: Max. number of articles to find, or -1 for all of them.
+
+        Returns:
+            Names of the articles found, oldest first.
+        """
+        if is_phrase:
+            text = '"%s"' % text.replace('"', '""')
+        sql = (
+            "SELECT articles.name FROM articles_fts"
+            " JOIN articles ON articles.id = articles_fts.rowid"
+            " WHERE articles_fts MATCH ?"
+        )
+        params = [text]
+        if start_date is not None:
+            sql += " AND articles.pub_date >= ?"
+            params.append(clean.date_to_str(start_date))
+        if end_date is not None:
+            sql += " AND articles.pub_date <= ?"
+            params.append(clean.date_to_str(end_date))
+        if source_name is not None:
+            sql += " AND articles.source_name = ?"
+            params.append(source_name)
+        sql += " ORDER BY articles.pub_date, articles.name LIMIT ?"
+        params.append(limit)
+        return [name for (name,) in self.get_connection().execute(sql, params)]
+
+    def sync(self, corpus: "Corpus") -> None:
+        """Bring the index in line with a corpus, e.g. after articles were
+        saved without it. Only articles missing from one side or the other are
+        touched."""
+        log = getLogger(__name__)
+
+        names = set(corpus.get_names(Article))
+        indexed_names = self.get_names()
+        removed = self.remove(indexed_names - names)
+        added = self.add(
+            article
+            for article in map(corpus.get, sorted(names - indexed_names))
+            if article is not None
+        )
+        if added or removed:
+            log.info(
+                "Indexed %i articles and removed %i: %s"
+                % (added, removed, self.filename)
+            )
+
+
+###############################################################################
+# Helper functions.                                                           #
+###############################################################################
+
+
+def get_date_str(date: Union[datetime, str, None]) -> Optional[str]:
+    """Get a publication date as a sortable string, or None if unknown."""
+    if isinstance(date, str):
+        date = clean.str_to_date(date)
+    return clean.date_to_str(date) if date else None
+
+
+###############################################################################
+# Command line interface.                                                     #
+###############################################################################
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    """Search collected articles from the command line."""
+    from we1s_chomp.corpus import Corpus
+
+    parser = argparse.ArgumentParser(
+        prog="chomp-search", description="Search articles already collected."
+    )
+    parser.add_argument("dirpath", type=Path, help="root directory of JSON manifests")
+    parser.add_argument("text", help="phrase to search for")
+    parser.add_argument(
+        "--start", type=clean.str_to_date, help="published on or after this date"
+    )
+    parser.add_argument(
+        "--end", type=clean.str_to_date, help="published on or before this date"
+    )
+    parser.add_argument("--source", help="name of a source to search")
+    parser.add_argument(
+        "--fts", action="store_true", help="treat text as an FTS5 query, not a phrase"
+    )
+    parser.add_argument(
+        "--index", type=Path, help="index file (default: DIRPATH/.cache/index.sqlite)"
+    )
+    parser.add_argument("-n", "--limit", type=int, default=-1, help="max. results")
+    args = parser.parse_args(args)
+
+    index = Index(args.index) if args.index else Index.in_dir(args.dirpath)
+    corpus = Corpus(args.dirpath, index=index).load()
+    for name in index.search(
+        args.text,
+        start_date=args.start,
+        end_date=args.end,
+        source_name=args.source,
+        is_phrase=not args.fts,
+        limit=args.limit,
+    ):
+        header = corpus.get_header(name)
+        print("%s\t%s\t%s" % (header["pub_date"], name, header["url"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+"""Import optional dependencies on first use.
+
+Optional packages (ijson, pyinstrument) are only imported by the code that
+needs them, the first time it runs, so importing Chomp stays cheap whether
+they're installed or not.
+"""
+from functools import lru_cache
+from importlib import import_module
+from types import ModuleType
+from typing import Optional
+
+
+@lru_cache(maxsize=None)
+def import_optional(name: str) -> Optional[ModuleType]:
+    """Import an optional module, or get None if it isn't installed.
+
+    A failed import searches the whole path again every time, so the answer is
+    remembered either way.
+    """
+    try:
+        return import_module(name)
+    except ImportError:
+        return None
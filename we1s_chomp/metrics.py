@@ -0,0 +1,282 @@
+"""Metrics for collection runs.
+
+The collectors report into a process-wide registry of counters (fetches, bytes,
+skips, cache hits), histograms (time spent fetching per host, and cleaning,
+parsing dates and saving) and gauges (requests in flight, queue depth). Take a
+snapshot at any point as a dict, or export it in Prometheus text format.
+
+Metrics are off by default. Set the CHOMP_METRICS environment variable (or call
+enable()) to turn them on. While they're off, the reporting functions return
+straight away, so they're safe to leave in hot paths.
+
+Usage:
+    with metrics.timer("chomp_fetch_seconds", host=metrics.get_host(url)):
+        res = requests.get(url)
+    metrics.inc("chomp_skips_total", reason="No content")
+"""
+import json
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from os import getenv
+from pathlib import Path
+from threading import Lock
+from time import perf_counter
+from typing import Callable, ContextManager, Dict, Iterator, List, Tuple
+from urllib.parse import urlsplit
+
+###############################################################################
+# Internal configuration parameters.                                          #
+###############################################################################
+
+
+_DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+"""Default histogram bucket upper bounds, in seconds."""
+
+_ENV_VAR = "CHOMP_METRICS"
+"""Environment variable that turns metrics on."""
+
+_NULL_CONTEXT = nullcontext()
+"""Stand-in for timers and trackers while metrics are off."""
+
+
+###############################################################################
+# Registry class.                                                             #
+###############################################################################
+
+
+class Registry:
+    """Thread-safe store of counters, gauges and histograms.
+
+    Each metric is identified by its name and labels, e.g.
+    chomp_fetches_total{host="we1s.ucsb.edu"}.
+    """
+
+    def __init__(self, is_enabled: bool = False, buckets: Tuple = _DEFAULT_BUCKETS):
+        """Create a new Registry instance.
+
+        Args:
+            is_enabled: Record metrics. Set False to ignore everything.
+            buckets: Histogram bucket upper bounds.
+        """
+        self.is_enabled = is_enabled
+        self.buckets = tuple(buckets)
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Clear all metrics."""
+        self.counters = defaultdict(float)
+        self.gauges = defaultdict(float)
+        self.histograms = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        """Add to a counter."""
+        with self.lock:
+            self.counters[get_key(name, labels)] += value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        """Set a gauge."""
+        with self.lock:
+            self.gauges[get_key(name, labels)] = value
+
+    def add_gauge(self, name: str, value: float, **labels) -> None:
+        """Add to (or subtract from) a gauge."""
+        with self.lock:
+            self.gauges[get_key(name, labels)] += value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """Record a value in a histogram."""
+        key = get_key(name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = {
+                    "buckets": [0] * (len(self.buckets) + 1),
+                    "sum": 0.0,
+                    "count": 0,
+                }
+            histogram = self.histograms[key]
+            histogram["buckets"][bisect_left(self.buckets, value)] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """Time a block of code into a histogram."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - start, **labels)
+
+    @contextmanager
+    def track(self, name: str, **labels) -> Iterator[None]:
+        """Count a block of code in a gauge while it runs, e.g. requests in
+        flight."""
+        self.add_gauge(name, 1, **labels)
+        try:
+            yield
+        finally:
+            self.add_gauge(name, -1, **labels)
+
+    def snapshot(self) -> Dict[str, List[Dict]]:
+        """Get the current value of every metric.
+
+        Returns:
+            Dict of metric name to list of {labels, value} dicts. Histograms
+            have count, sum and cumulative bucket counts instead of a value.
+        """
+        snapshot = defaultdict(list)
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                snapshot[name].append({"labels": dict(labels), "value": value})
+            for (name, labels), value in sorted(self.gauges.items()):
+                snapshot[name].append({"labels": dict(labels), "value": value})
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                cumulative, buckets = 0, {}
+                for bound, count in zip(
+                    self.buckets + (float("inf"),), histogram["buckets"]
+                ):
+                    cumulative += count
+                    buckets[str(bound)] = cumulative
+                snapshot[name].append(
+                    {
+                        "labels": dict(labels),
+                        "count": histogram["count"],
+                        "sum": histogram["sum"],
+                        "buckets": buckets,
+                    }
+                )
+        return dict(snapshot)
+
+    def to_prometheus(self) -> str:
+        """Export every metric in Prometheus text format."""
+        with self.lock:
+            types = {name: "counter" for name, _ in self.counters}
+            types.update({name: "gauge" for name, _ in self.gauges})
+            types.update({name: "histogram" for name, _ in self.histograms})
+
+        lines = []
+        for name, samples in sorted(self.snapshot().items()):
+            lines.append(f"# TYPE {name} {types[name]}")
+            for sample in samples:
+                labels = sample["labels"]
+                if "buckets" not in sample:
+                    lines.append(format_sample(name, labels, sample["value"]))
+                    continue
+                for bound, count in sample["buckets"].items():
+                    le = "+Inf" if bound == "inf" else bound
+                    lines.append(
+                        format_sample(f"{name}_bucket", {**labels, "le": le}, count)
+                    )
+                lines.append(format_sample(f"{name}_sum", labels, sample["sum"]))
+                lines.append(format_sample(f"{name}_count", labels, sample["count"]))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry(is_enabled=getenv(_ENV_VAR, "") not in ("", "0"))
+"""Process-wide registry the collectors report into."""
+
+
+###############################################################################
+# Reporting functions.                                                        #
+###############################################################################
+
+
+def enable(is_enabled: bool = True) -> None:
+    """Turn metrics on (or off)."""
+    registry.is_enabled = is_enabled
+
+
+def inc(name: str, value: float = 1.0, **labels) -> None:
+    """Add to a counter, if metrics are on."""
+    if registry.is_enabled:
+        registry.inc(name, value, **labels)
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    """Set a gauge, if metrics are on."""
+    if registry.is_enabled:
+        registry.set_gauge(name, value, **labels)
+
+
+def add_gauge(name: str, value: float, **labels) -> None:
+    """Add to (or subtract from) a gauge, if metrics are on."""
+    if registry.is_enabled:
+        registry.add_gauge(name, value, **labels)
+
+
+def observe(name: str, value: float, **labels) -> None:
+    """Record a value in a histogram, if metrics are on."""
+    if registry.is_enabled:
+        registry.observe(name, value, **labels)
+
+
+def timer(name: str, **labels) -> ContextManager:
+    """Time a block of code into a histogram, if metrics are on."""
+    if registry.is_enabled:
+        return registry.timer(name, **labels)
+    return _NULL_CONTEXT
+
+
+def timed(name: str, **labels) -> Callable:
+    """Decorator to time every call of a function into a histogram, if metrics
+    are on."""
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not registry.is_enabled:
+                return func(*args, **kwargs)
+            with registry.timer(name, **labels):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def track(name: str, **labels) -> ContextManager:
+    """Count a block of code in a gauge while it runs, if metrics are on."""
+    if registry.is_enabled:
+        return registry.track(name, **labels)
+    return _NULL_CONTEXT
+
+
+def save(filename: Path) -> None:
+    """Save a snapshot of every metric: JSON for .json files, otherwise
+    Prometheus text."""
+    filename = Path(filename)
+    filename.parent.mkdir(parents=True, exist_ok=True)
+    with open(filename, "w", encoding="utf-8") as outfile:
+        if filename.suffix == ".json":
+            json.dump(registry.snapshot(), outfile, indent=4)
+        else:
+            outfile.write(registry.to_prometheus())
+
+
+###############################################################################
+# Helper functions.                                                           #
+###############################################################################
+
+
+def format_sample(name: str, labels: Dict[str, str], value: float) -> str:
+    """Format one sample in Prometheus text format."""
+    if not labels:
+        return f"{name} {value}"
+    label_str = ",".join(
+        '%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in sorted(labels.items())
+    )
+    return f"{name}{{{label_str}}} {value}"
+
+
+def get_host(url: str) -> str:
+    """Get the host from a URL, for labels."""
+    return urlsplit(url if "//" in url else "//" + url).hostname or ""
+
+
+def get_key(name: str, labels: Dict) -> Tuple[str, Tuple]:
+    """Get the registry key for a metric."""
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
@@ -1,29 +1,76 @@
 """Schema for data handling and import/export.
 See https://github.com/whatevery1says/manifest for more information.
 """
+import json
 from datetime import datetime
 from logging import getLogger
-from typing import Dict, Iterable, Union
+from pathlib import Path
+from typing import Any, Dict, Iterable, Union
 from uuid import uuid4
 
 from we1s_chomp.clean import date_to_str, str_to_date
 
 
 class Manifest:
-    """Basic manifest schema."""
+    """Basic manifest schema.
+
+    Manifests keep their fields in __slots__, since we tend to hold a lot of
+    them at once. The fields listed in _fields are the ones we serialize, in
+    order; vars() still works, and returns them as a new dict.
+    """
+
+    __slots__ = (
+        "name",
+        "chomp_id",
+        "api_software",
+        "created_date",
+        "updated_date",
+        "notes",
+    )
+    _fields = __slots__
 
     def __init__(self, name: str, **kwargs):
         self.name = name
-        self.chomp_id = kwargs.get("chomp_id", str(uuid4().hex))
+        self.chomp_id = kwargs["chomp_id"] if "chomp_id" in kwargs else uuid4().hex
         self.api_software = kwargs.get("api_software", "chomp2")
-        self.created_date = kwargs.get("created_date", str_to_date("now"))
-        self.updated_date = kwargs.get("updated_date", str_to_date("now"))
+        if "created_date" in kwargs and "updated_date" in kwargs:
+            self.created_date = kwargs["created_date"]
+            self.updated_date = kwargs["updated_date"]
+        else:
+            now = datetime.now().replace(microsecond=0)
+            self.created_date = kwargs.get("created_date", now)
+            self.updated_date = kwargs.get("updated_date", now)
         self.notes = kwargs.get("notes", [])
 
+    @property
+    def __dict__(self) -> Dict:
+        return self.__getstate__()
+
+    def __getstate__(self) -> Dict:
+        return {field: getattr(self, field) for field in self._fields}
+
+    def __setstate__(self, state: Dict) -> None:
+        for field, value in state.items():
+            setattr(self, field, value)
+
 
 class Source(Manifest):
     """Source manifest schema."""
 
+    __slots__ = (
+        "webpage",
+        "content_type",
+        "country",
+        "language",
+        "copyright",
+        "tags",
+        "collection_identifiers",
+        "query_names",
+        "response_names",
+        "article_names",
+    )
+    _fields = __slots__ + Manifest._fields
+
     def __init__(self, name: str, webpage: str, tags: Iterable[str], **kwargs):
         self.webpage = webpage
         self.content_type = kwargs.get("content_type", "website")
@@ -44,6 +91,16 @@ class Query(Manifest):
     # query. Can we simplify it?
     """
 
+    __slots__ = (
+        "query_str",
+        "start_date",
+        "end_date",
+        "source_name",
+        "response_names",
+        "article_names",
+    )
+    _fields = __slots__ + Manifest._fields
+
     def __init__(
         self,
         source_name: str,
@@ -72,6 +129,16 @@ def __init__(
 class Response(Manifest):
     """Search response manifest schema."""
 
+    __slots__ = (
+        "url",
+        "content",
+        "api_data_provider",
+        "source_name",
+        "query_name",
+        "article_names",
+    )
+    _fields = Manifest._fields + __slots__
+
     def __init__(self, name: str, url: str, **kwargs):
         Manifest.__init__(self, name, **kwargs)
         self.url = url
@@ -85,6 +152,23 @@ def __init__(self, name: str, url: str, **kwargs):
 class Article(Manifest):
     """Raw article data manifest schema."""
 
+    __slots__ = (
+        "url",
+        "title",
+        "pub",
+        "pub_date",
+        "content_html",
+        "content",
+        "length",
+        "copyright",
+        "api_data_provider",
+        "keywords",
+        "source_name",
+        "query_name",
+        "response_name",
+    )
+    _fields = Manifest._fields + __slots__
+
     def __init__(self, name: str, url: str, **kwargs):
         Manifest.__init__(self, name, **kwargs)
         self.url = url
@@ -93,7 +177,9 @@ def __init__(self, name: str, url: str, **kwargs):
         self.pub_date = kwargs.get("pub_date", "01-01-1900")
         self.content_html = kwargs.get("content_html", "")
         self.content = kwargs.get("content", "")
-        self.length = kwargs.get("length", len(self.content.split(" ")))
+        self.length = (
+            kwargs["length"] if "length" in kwargs else len(self.content.split(" "))
+        )
         self.copyright = kwargs.get("copyright", "")
         self.api_data_provider = kwargs.get("api_data_provider", "google")
         self.keywords = kwargs.get("keywords", [])
@@ -102,9 +188,41 @@ def __init__(self, name: str, url: str, **kwargs):
         self.response_name = kwargs.get("response_name", "")
 
 
+class Payload(str):
+    """Raw JSON API response that remembers its parsed data.
+
+    Collectors pass these from one stage to the next so each response is only
+    decoded once. A Payload is still the raw JSON string, so it can be stored
+    in Response.content and saved like any other.
+    """
+
+    def __new__(cls, raw: str, data: Any = None):
+        payload = super().__new__(cls, raw)
+        payload.data = data
+        return payload
+
+    @property
+    def raw(self) -> bytes:
+        """Raw JSON response as UTF-8 bytes, for storage."""
+        return self.encode("utf-8")
+
+
+def load_payload(response: Union[Payload, str, bytes, Dict, list]) -> Any:
+    """Get parsed data from an API response in whatever form it comes in.
+
+    Raises:
+        json.JSONDecodeError: If a raw response isn't valid JSON.
+    """
+    if isinstance(response, (dict, list)):
+        return response
+    if isinstance(response, Payload) and response.data is not None:
+        return response.data
+    return json.loads(response)
+
+
 def to_json(manifest: Union[Source, Query, Response, Article]) -> Dict:
     """JSON serialization hook."""
-    manifest_dict = vars(manifest)
+    manifest_dict = vars(manifest)  # A new dict, so we can change it.
 
     # Parse date metadata.
     for date_field in [
@@ -116,6 +234,10 @@ def to_json(manifest: Union[Source, Query, Response, Article]) -> Dict:
     for set_field in [f for f in manifest_dict if isinstance(manifest_dict[f], set)]:
         manifest_dict[set_field] = list(manifest_dict[set_field])
 
+    # Spooled HTML (see spool.py) is referred to by its path.
+    for path_field in [f for f in manifest_dict if isinstance(manifest_dict[f], Path)]:
+        manifest_dict[path_field] = str(manifest_dict[path_field])
+
     return manifest_dict
 
 
@@ -135,13 +257,18 @@ def from_json(manifest_dict: Dict):
             )
             return None
 
+    return get_manifest_type(manifest_dict)(**manifest_dict)
+
+
+def get_manifest_type(manifest_dict: Dict) -> type:
+    """Guess which kind of manifest a dict holds from its fields."""
     if "url" in manifest_dict.keys() and "pub_date" in manifest_dict.keys():
-        return Article(**manifest_dict)
+        return Article
     if "url" in manifest_dict.keys():
-        return Response(**manifest_dict)
+        return Response
     if "start_date" in manifest_dict.keys() and "end_date" in manifest_dict.keys():
-        return Query(**manifest_dict)
+        return Query
     if "webpage" in manifest_dict.keys() and "tags" in manifest_dict.keys():
-        return Source(**manifest_dict)
+        return Source
     else:
-        return Manifest(**manifest_dict)
+        return Manifest
@@ -0,0 +1,1099 @@
+"""Resumable collection pipeline.
+
+Runs the same stages as the notebooks--responses, articles, export--with nobody
+at the wheel. The stages are connected by a bounded queue, so articles start
+coming in while responses are still being collected. Every unit of work (query
+page, article URL) is checkpointed as soon as it's saved: if a run dies, run it
+again and it will pick up where it left off. Saved manifests count as done even
+if a run died before checking them off.
+
+Articles are only ever collected once, but queries and result pages are
+checked off per run, named for the day it started unless given a --run-name.
+Run a query again on another day to pick up what's new since.
+
+Usage:
+    chomp ./data/json --export-dir ./data/export --stopwords url_stopwords.txt
+
+See chomp --help for everything else. Selenium and Google CSE settings default
+to the same environment variables the notebooks use.
+
+To split a collection between several processes or machines, give each of them
+the same --frontier database. Each worker takes queries and result pages from
+it as they come up; see frontier.py.
+
+With --index, every article saved is also added to a full-text index, and new
+queries are filled from articles we already have before anything is fetched.
+See index.py.
+
+Cleaned content is cached by a hash of the raw HTML, so a page that hasn't
+changed is only cleaned once. After a change to the cleaner, bump
+clean.CLEANER_VERSION and run chomp --reclean to bring stored articles up to
+date from their saved HTML.
+"""
+import argparse
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from logging import getLogger
+from os import getenv, getpid
+from pathlib import Path
+from queue import Queue
+from socket import gethostname
+from threading import Event, Lock, Thread
+from time import sleep
+from typing import Callable, Iterable, Iterator, List, Optional, Set
+
+from we1s_chomp import (
+    clean,
+    db,
+    google,
+    lazy,
+    metrics,
+    model,
+    profiling,
+    sitemap,
+    web,
+    wordpress,
+)
+from we1s_chomp.cache import Cache
+from we1s_chomp.corpus import Corpus
+from we1s_chomp.frontier import Frontier, FrontierSet, SQLiteFrontier, Task
+from we1s_chomp.index import Index
+from we1s_chomp.model import Article, Query, Response
+from we1s_chomp.spool import Spool
+
+###############################################################################
+# Internal configuration parameters.                                          #
+###############################################################################
+
+
+_CACHE_DIRNAME = ".cache"
+"""Directory under the data directory for caches and quota counts."""
+
+_CHECKPOINT_FILENAME = "checkpoint.txt"
+"""File under the data directory to record finished work in."""
+
+_CHECKPOINT_PREFIXES = ("local:", "page:", "query:", "response:")
+"""Prefixes of checkpoint keys that aren't article URLs."""
+
+_DEFAULT_DAILY_QUOTA = 100
+"""Default number of Google CSE queries allowed per day."""
+
+_DEFAULT_NUM_CLEAN_WORKERS = 0
+"""Default number of processes to clean articles with, or 0 for none."""
+
+_DEFAULT_NUM_WORKERS = 1
+"""Default number of pages or articles to request at once."""
+
+_DEFAULT_POLL_INTERVAL = 5.0
+"""Default time in seconds to wait for more work from a shared frontier."""
+
+_DEFAULT_QUEUE_SIZE = 16
+"""Default max. number of responses waiting for the article stage."""
+
+EXPORT_FORMATS = ["zip", "parquet"]
+"""Export formats: zip archives of JSON manifests, or a Parquet dataset."""
+
+_NO_EXACT_MATCH_SUFFIX = "(no-exact-match)"
+"""Name suffix for articles that don't contain the search term verbatim."""
+
+_PARQUET_DIRNAME = "parquet"
+"""Directory under the export directory for the Parquet dataset."""
+
+STAGES = ["responses", "articles", "export"]
+"""Pipeline stages, in order."""
+
+_TASK_KINDS = {"articles": "page", "responses": "query"}
+"""Frontier task kind for each stage, in the order workers should take them."""
+
+
+###############################################################################
+# Checkpoint class.                                                           #
+###############################################################################
+
+
+class Checkpoint:
+    """Append-only record of finished units of work.
+
+    Keys are article URLs, "page:<run>:<url>" for result pages and
+    "query:<run>:<name>" once everything under a query is done in a run,
+    "response:<name>" once a response's articles are done, and "local:<name>"
+    once a query's been filled from the index. Each key is written to disk as
+    soon as it's added.
+    """
+
+    def __init__(self, filename: Path):
+        """Create a new Checkpoint instance, loading any previous progress.
+
+        Args:
+            filename: Text file to record keys in, one per line.
+        """
+        self.filename = Path(filename)
+        self.keys = set()
+        self.lock = Lock()
+        if self.filename.exists():
+            with open(self.filename, encoding="utf-8") as txtfile:
+                self.keys = {line.rstrip("\n") for line in txtfile if line.strip()}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.keys
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, key: str) -> None:
+        """Record a unit of work as finished."""
+        with self.lock:
+            if key in self.keys:
+                return
+            self.keys.add(key)
+            db.check_path(self.filename.parent, create=True)
+            with open(self.filename, "a", encoding="utf-8") as txtfile:
+                txtfile.write(key + "\n")
+
+
+###############################################################################
+# Pipeline class.                                                             #
+###############################################################################
+
+
+class Pipeline:
+    """Collection pipeline over a directory of manifests."""
+
+    def __init__(
+        self,
+        dirpath: Path,
+        export_dirpath: Optional[Path] = None,
+        url_stopwords: Set[str] = set(),
+        google_cx: Optional[str] = None,
+        google_key: Optional[str] = None,
+        google_quota: int = _DEFAULT_DAILY_QUOTA,
+        browser: Optional[web.Browser] = None,
+        num_workers: int = _DEFAULT_NUM_WORKERS,
+        queue_size: int = _DEFAULT_QUEUE_SIZE,
+        frontier: Optional[Frontier] = None,
+        worker: str = "",
+        index: Optional[Index] = None,
+        is_using_sitemaps: bool = False,
+        export_format: str = "zip",
+        is_exporting_html: bool = False,
+        is_spooling: bool = False,
+        num_clean_workers: int = _DEFAULT_NUM_CLEAN_WORKERS,
+        is_counting_google_filtered: bool = False,
+        run_name: Optional[str] = None,
+        is_streaming_wordpress: bool = False,
+    ):
+        """Create a new Pipeline instance.
+
+        Args:
+            dirpath: Root directory of the JSON manifests. Sources and queries
+                should already be in here; responses and articles are saved
+                here, too.
+            export_dirpath: Directory to save zip archives to.
+            url_stopwords: Skip all URLs that contain a word from this set.
+            google_cx: Google search engine ID.
+            google_key: Google API key.
+            google_quota: Number of Google CSE queries allowed per day. When
+                it runs out, we wait for it to reset.
+            browser: Selenium configuration information. Set None to use
+                Requests module.
+            num_workers: Number of pages or articles to request at once.
+            queue_size: Max. number of responses waiting for the article
+                stage. The response stage waits when the queue is full.
+            frontier: Work queue shared with other workers. See work().
+            worker: Name of this worker in the frontier.
+            index: Full-text index of articles. Queries are filled from it
+                before anything is collected online. See collect_local().
+            is_using_sitemaps: Collect from sitemaps, where a site has them,
+                instead of Google CSE. Wordpress API still comes first.
+            export_format: "zip" for zip archives of JSON manifests, or
+                "parquet" for a Parquet dataset (needs pyarrow).
+            is_exporting_html: Include raw HTML in Parquet exports.
+            is_spooling: Spool raw HTML to disk as soon as it's cleaned, and
+                move it into place when the article is saved, instead of
+                holding it in memory. See spool.py.
+            num_clean_workers: Number of processes to clean articles with, or
+                0 to clean them in this process.
+            is_counting_google_filtered: Report how many Google CSE results
+                each query's date range filters out, for one more query each.
+            run_name: Name of this run. Queries and result pages finished in
+                a run with the same name are skipped. Set None to name it for
+                today's date.
+            is_streaming_wordpress: Parse Wordpress API pages one post at a
+                time, instead of whole (needs ijson). See
+                wordpress.get_responses().
+        """
+        self.dirpath = Path(dirpath)
+        self.export_dirpath = export_dirpath
+        self.url_stopwords = url_stopwords
+        self.google_cx = google_cx
+        self.google_key = google_key
+        self.browser = browser
+        self.num_workers = num_workers
+        self.queue_size = queue_size
+        self.frontier = frontier
+        self.worker = worker
+        self.index = index
+        self.is_using_sitemaps = is_using_sitemaps
+        self.export_format = export_format
+        self.is_exporting_html = is_exporting_html
+        self.num_clean_workers = num_clean_workers
+        self.is_counting_google_filtered = is_counting_google_filtered
+        self.run_name = run_name or datetime.now().strftime("%Y-%m-%d")
+        self.is_streaming_wordpress = is_streaming_wordpress
+
+        self.corpus = Corpus(self.dirpath, index=index, is_deferring=True).load()
+        self.checkpoint = Checkpoint(self.dirpath / _CHECKPOINT_FILENAME)
+        if frontier:
+            self.url_stops = FrontierSet(frontier, "url", worker, self.get_done_urls())
+        else:
+            self.url_stops = self.get_done_urls()
+        self.lock = Lock()
+        self.counts = {}
+
+        cache_dirpath = self.dirpath / _CACHE_DIRNAME
+        self.spool = Spool(cache_dirpath / "spool") if is_spooling else None
+        self.content_cache = Cache(cache_dirpath / "content")
+        self.google_cache = Cache(cache_dirpath / "google", ttl=24 * 60 * 60)
+        self.google_quota = google.Quota(
+            cache_dirpath / "google_quota.json", google_quota, is_waiting=True
+        )
+        self.wordpress_capabilities = Cache(
+            cache_dirpath / "wordpress_capabilities", ttl=7 * 24 * 60 * 60
+        )
+        self.wordpress_watermarks = Cache(cache_dirpath / "wordpress_watermarks")
+        self.sitemap_capabilities = Cache(
+            cache_dirpath / "sitemap_capabilities", ttl=7 * 24 * 60 * 60
+        )
+
+    def run(
+        self, query_names: Optional[Iterable[str]] = None, stages: List[str] = STAGES
+    ) -> None:
+        """Run the pipeline.
+
+        Args:
+            query_names: Names of queries to collect. Set None for all of them.
+            stages: Stages to run.
+        """
+        log = getLogger(__name__)
+
+        queries = self.get_queries(query_names)
+        log.info("Running %s for %i queries." % (", ".join(stages), len(queries)))
+        if "articles" in stages:
+            for query in queries:
+                self.collect_local(query)
+
+        # Responses go into the queue as they're collected, and the article
+        # stage takes them out as fast as it can. They count against the
+        # memory budget while they wait.
+        queue = Queue(maxsize=self.queue_size)
+        errors = []
+
+        def put_responses() -> None:
+            try:
+                for query in queries:
+                    for response in self.iter_responses(query, "responses" in stages):
+                        profiling.budget.acquire(len(response.content), "responses")
+                        queue.put((query, response))
+                        metrics.set_gauge(
+                            "chomp_queue_depth", queue.qsize(), queue="responses"
+                        )
+            except Exception as e:
+                errors.append(e)
+                raise
+            finally:
+                queue.put(None)
+
+        producer = Thread(target=put_responses, name="chomp-responses", daemon=True)
+        producer.start()
+        while True:
+            item = queue.get()
+            if item is None:
+                break
+            query, response = item
+            try:
+                if "articles" in stages and not errors:
+                    self.collect_articles(query, response)
+            finally:
+                profiling.budget.release(len(response.content), "responses")
+        producer.join()
+        self.flush()
+        if errors:
+            raise errors[0]
+
+        if "export" in stages:
+            self.export(queries)
+
+    def seed(self, query_names: Optional[Iterable[str]] = None) -> int:
+        """Add queries to the shared frontier, unless they're there already.
+
+        Returns:
+            Number of queries added.
+        """
+        log = getLogger(__name__)
+
+        count = 0
+        for query in self.get_queries(query_names):
+            count += self.frontier.put(_TASK_KINDS["responses"], query.name)
+        log.info("Added %i queries to frontier." % count)
+        return count
+
+    def work(
+        self,
+        stages: List[str] = STAGES,
+        poll_interval: float = _DEFAULT_POLL_INTERVAL,
+    ) -> None:
+        """Run the response and article stages off the shared frontier.
+
+        Works until no queries or pages are left, either waiting or in the
+        hands of another worker. Run seed() first (in any worker) and export()
+        once everybody's finished.
+
+        Result pages within a query are collected in order by whoever has the
+        query, but each page's articles can go to any worker. Article URLs are
+        claimed through the frontier, so no two workers save the same one.
+
+        Args:
+            stages: Stages to take work for. E.g. ["articles"] for a worker
+                that only collects articles.
+            poll_interval: Time in seconds to wait when there's no work
+                available, but another worker may still add some.
+        """
+        log = getLogger(__name__)
+
+        kinds = [kind for stage, kind in _TASK_KINDS.items() if stage in stages]
+        while True:
+            task = self.frontier.lease(kinds, self.worker)
+            if task is None:
+                if self.frontier.is_finished(_TASK_KINDS.values()):
+                    break
+                sleep(poll_interval)
+                continue
+
+            # Keep the lease up the whole time, even while we wait a long while
+            # between pages, e.g. for the Google quota to reset.
+            try:
+                with self.heartbeat(task):
+                    if task.kind == _TASK_KINDS["responses"]:
+                        query = self.corpus.get(task.key)
+                        self.collect_local(query)
+                        for response in self.iter_responses(query):
+                            self.frontier.put(
+                                _TASK_KINDS["articles"],
+                                response.name,
+                                str(self.corpus.filenames[response.name]),
+                            )
+                    else:
+                        response = self.load_response(task.data)
+                        query = self.corpus.get(response.query_name)
+                        self.collect_articles(query, response, task)
+            except Exception:
+                log.exception("Worker failed %s task: %s" % (task.kind, task.key))
+                self.frontier.nack(task)
+                continue
+            self.frontier.ack(task)
+
+        self.flush()
+        log.info("No more work in frontier, stopping.")
+
+    def iter_responses(
+        self, query: Query, is_collecting: bool = True
+    ) -> Iterator[Response]:
+        """Response stage: collect and save responses for a query.
+
+        Responses saved on a previous run, but whose articles we never
+        finished, come first.
+
+        Args:
+            query: Query to collect.
+            is_collecting: Set False to only get unfinished responses.
+        """
+        log = getLogger(__name__)
+
+        for response_name in sorted(self.corpus.get_linked(query.name, Response)):
+            if f"response:{response_name}" not in self.checkpoint:
+                yield self.corpus.get(response_name)
+        query_key = f"query:{self.run_name}:{query.name}"
+        if not is_collecting or query_key in self.checkpoint:
+            return
+
+        # Select scraping API.
+        source = self.corpus.get(query.source_name)
+        base_url = source.webpage
+        if wordpress.is_api_available(
+            base_url, self.browser, cache=self.wordpress_capabilities
+        ):
+            api = "wordpress"
+            log.info('Collecting "%s" via Wordpress API.' % query.name)
+            responses = wordpress.get_responses(
+                query_str=query.query_str,
+                base_url=base_url,
+                url_stops=self.url_stops,
+                url_stopwords=self.url_stopwords,
+                browser=self.browser,
+                num_workers=self.num_workers,
+                start_date=query.start_date,
+                end_date=query.end_date,
+                watermarks=self.wordpress_watermarks,
+                is_streaming=self.is_streaming_wordpress,
+            )
+        elif self.is_using_sitemaps and sitemap.is_available(
+            base_url, cache=self.sitemap_capabilities
+        ):
+            api = "sitemap"
+            log.info('Collecting "%s" via sitemaps.' % query.name)
+            responses = sitemap.get_responses(
+                query_str=query.query_str,
+                base_url=base_url,
+                url_stops=self.url_stops,
+                url_stopwords=self.url_stopwords,
+                num_workers=self.num_workers,
+                start_date=query.start_date,
+                end_date=query.end_date,
+                cache=self.sitemap_capabilities,
+            )
+        else:
+            api = "google"
+            log.info('Collecting "%s" via Google API.' % query.name)
+            responses = google.get_responses(
+                query_str=query.query_str,
+                base_url=base_url,
+                google_cx=self.google_cx,
+                google_key=self.google_key,
+                url_stops=self.url_stops,
+                url_stopwords=self.url_stopwords,
+                browser=self.browser,
+                num_workers=self.num_workers,
+                cache=self.google_cache,
+                quota=self.google_quota,
+                start_date=query.start_date,
+                end_date=query.end_date,
+                is_counting_filtered=self.is_counting_google_filtered,
+            )
+
+        # Save each response before we check it off.
+        for url, content in responses:
+            count = self.increment(
+                f"responses:{query.name}",
+                lambda: len(self.corpus.get_linked(query.name, Response)),
+            )
+            response = Response(
+                name=f"chomp-response_{query.name}_{count}",
+                url=url,
+                content=content,
+                api_data_provider=api,
+                source_name=source.name,
+                query_name=query.name,
+            )
+            with self.lock:
+                self.corpus.save(response)
+            self.set_done(url, f"page:{self.run_name}:{url}")
+            yield response
+
+        self.flush()
+        self.checkpoint.add(query_key)
+
+    def collect_articles(
+        self, query: Query, response: Response, task: Optional[Task] = None
+    ) -> None:
+        """Article stage: collect and save the articles in a response.
+
+        Args:
+            query: Query the response belongs to.
+            response: Response to collect articles from.
+            task: Frontier task to keep the lease up on while we work, if any.
+        """
+        log = getLogger(__name__)
+
+        source = self.corpus.get(query.source_name)
+        if response.api_data_provider == "wordpress":
+            articles = wordpress.get_metadata(
+                response=response.content,
+                query_str=query.query_str,
+                start_date=query.start_date,
+                end_date=query.end_date,
+                url_stops=self.url_stops,
+                url_stopwords=self.url_stopwords,
+                spool=self.spool,
+                content_cache=self.content_cache,
+            )
+        elif response.api_data_provider == "sitemap":
+            articles = sitemap.get_metadata(
+                response=response.content,
+                query_str=query.query_str,
+                start_date=query.start_date,
+                end_date=query.end_date,
+                url_stops=self.url_stops,
+                url_stopwords=self.url_stopwords,
+                browser=self.browser,
+                num_workers=self.num_workers,
+                num_clean_workers=self.num_clean_workers,
+                spool=self.spool,
+                content_cache=self.content_cache,
+            )
+        else:
+            articles = google.get_metadata(
+                response=response.content,
+                query_str=query.query_str,
+                start_date=query.start_date,
+                end_date=query.end_date,
+                url_stops=self.url_stops,
+                url_stopwords=self.url_stopwords,
+                browser=self.browser,
+                num_workers=self.num_workers,
+                num_clean_workers=self.num_clean_workers,
+                spool=self.spool,
+                content_cache=self.content_cache,
+            )
+
+        count = 0
+        for doc in articles or []:
+            if not self.is_claimed(doc["url"]):
+                log.info("Skipping (Claimed by another worker): %s" % doc["url"])
+                if self.spool is not None:
+                    self.spool.discard(doc["content_html"])
+                continue
+            article = Article(
+                name=self.get_article_name(query, doc["no_exact_match"]),
+                url=doc["url"],
+                title=doc["title"],
+                pub=source.name,
+                pub_date=doc["pub_date"],
+                content_html=doc["content_html"],
+                content=doc["content"],
+                copyright=source.copyright,
+                api_data_provider=response.api_data_provider,
+                source_name=source.name,
+                query_name=query.name,
+                response_name=response.name,
+            )
+            with self.lock:
+                self.corpus.save(article)
+            self.set_done(article.url)
+            count += 1
+            if task:
+                self.frontier.extend(task)
+
+        self.flush()
+        self.checkpoint.add(f"response:{response.name}")
+        log.info('Got %i articles from "%s".' % (count, response.name))
+
+    def collect_local(self, query: Query) -> int:
+        """Local stage: fill a query from articles we already have.
+
+        Articles from the query's source that match its search term within its
+        date range are copied to the query, once per URL, before anything is
+        fetched. Their URLs are checked off as usual, so collection doesn't go
+        online for them. Does nothing without an index.
+
+        Returns:
+            Number of articles copied.
+        """
+        log = getLogger(__name__)
+
+        if self.index is None or f"local:{query.name}" in self.checkpoint:
+            return 0
+
+        urls = {
+            self.corpus.get_header(name).get("url")
+            for name in self.corpus.get_linked(query.name, Article)
+            if name in self.corpus
+        }
+        count = 0
+        for name in self.index.search(
+            query.query_str,
+            start_date=query.start_date,
+            end_date=query.end_date,
+            source_name=query.source_name,
+        ):
+            header = self.corpus.get_header(name)
+            if header is None or header["url"] in urls:
+                continue
+            found = self.corpus.get(name)
+            no_exact_match = query.query_str not in found.content
+            article = Article(
+                name=self.get_article_name(query, no_exact_match),
+                url=found.url,
+                title=found.title,
+                pub=found.pub,
+                pub_date=found.pub_date,
+                content_html=found.content_html,
+                content=found.content,
+                copyright=found.copyright,
+                api_data_provider=found.api_data_provider,
+                keywords=found.keywords,
+                source_name=query.source_name,
+                query_name=query.name,
+                notes=[f"Copied from {found.name}."],
+            )
+            self.url_stops.add(article.url)
+            with self.lock:
+                self.corpus.save(article)
+            self.set_done(article.url)
+            urls.add(article.url)
+            count += 1
+
+        self.flush()
+        self.checkpoint.add(f"local:{query.name}")
+        log.info('Got %i articles for "%s" from the index.' % (count, query.name))
+        return count
+
+    def export(self, queries: Iterable[Query]) -> None:
+        """Export stage: save each query's articles to zip archives.
+
+        Articles that don't contain the search term verbatim go in their own
+        archive. In Parquet, every query gets its own partition instead; see
+        db.save_parquet().
+        """
+        log = getLogger(__name__)
+
+        if not self.export_dirpath:
+            log.warning("No export directory set, skipping export.")
+            return
+
+        for query in queries:
+            if self.export_format == "parquet":
+                db.save_parquet(
+                    self.corpus.iter_linked(query.name, Article),
+                    self.export_dirpath / _PARQUET_DIRNAME,
+                    is_including_html=self.is_exporting_html,
+                )
+                continue
+
+            archives = {}
+            for name in sorted(self.corpus.get_linked(query.name, Article)):
+                archive_name = query.name
+                if name.endswith(_NO_EXACT_MATCH_SUFFIX):
+                    archive_name += _NO_EXACT_MATCH_SUFFIX
+                archives.setdefault(archive_name, []).append(
+                    self.corpus.filenames[name]
+                )
+            for archive_name, filenames in archives.items():
+                db.save_archive(filenames, self.export_dirpath / f"{archive_name}.zip")
+
+    def reclean(self, query_names: Optional[Iterable[str]] = None) -> int:
+        """Clean stored articles again from their saved HTML.
+
+        Content and length are brought up to date, and articles whose match
+        status changes are renamed to match. Pages go to the clean workers in
+        parallel, except those the content cache already has for this
+        version of the cleaner. Articles without saved HTML are left alone.
+
+        Args:
+            query_names: Names of queries to clean. Set None for all of them.
+
+        Returns:
+            Number of articles changed.
+        """
+        log = getLogger(__name__)
+
+        queries = self.get_queries(query_names)
+
+        def get_pages() -> Iterator:
+            for query in queries:
+                for name in sorted(self.corpus.get_linked(query.name, Article)):
+                    filename_html = self.get_html_filename(name)
+                    if filename_html is None:
+                        log.debug("Skipping (No raw HTML): %s" % name)
+                        continue
+                    article = self.corpus.get(name)
+                    yield (query, article, filename_html), article.content_html
+
+        count = total = 0
+        for (query, article, filename_html), _, content in clean.get_content_batch(
+            get_pages(), self.num_clean_workers, cache=self.content_cache
+        ):
+            total += 1
+            if content == article.content:
+                continue
+
+            # Move the HTML along with the manifest, rather than write it out
+            # again.
+            article.content = content
+            article.length = len(content.split(" "))
+            article.content_html = filename_html
+            name = article.name
+            no_exact_match = query.query_str not in content
+            if name.endswith(_NO_EXACT_MATCH_SUFFIX) != no_exact_match:
+                article.name = self.get_article_name(query, no_exact_match)
+                log.info('Renaming "%s" to "%s".' % (name, article.name))
+            self.corpus.save(article)
+            if article.name != name:
+                self.corpus.remove(name)
+            count += 1
+
+        self.flush()
+        log.info("Cleaned %i articles again (%i changed)." % (total, count))
+        return count
+
+    @contextmanager
+    def heartbeat(self, task: Task) -> Iterator[None]:
+        """Renew a frontier task's lease from another thread, a few times per
+        lease, for as long as we're working on it."""
+        log = getLogger(__name__)
+
+        stopped = Event()
+
+        def beat() -> None:
+            while not stopped.wait(self.frontier.lease_time / 3):
+                try:
+                    self.frontier.extend(task)
+                except Exception:
+                    log.exception("Could not extend lease on task: %s" % task.key)
+
+        thread = Thread(target=beat, name="chomp-heartbeat", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            thread.join()
+
+    def flush(self) -> None:
+        """Write out the sources, queries and responses whose lists of names
+        changed since the last flush. See Corpus.flush()."""
+        with self.lock:
+            self.corpus.flush()
+
+    def get_article_name(self, query: Query, no_exact_match: bool) -> str:
+        """Get the next article name for a query."""
+        suffix = _NO_EXACT_MATCH_SUFFIX if no_exact_match else ""
+        count = self.increment(
+            f"articles:{query.name}{suffix}",
+            lambda: sum(
+                name.endswith(_NO_EXACT_MATCH_SUFFIX) == no_exact_match
+                for name in self.corpus.get_linked(query.name, Article)
+            ),
+        )
+        return f"chomp_{query.name}_{count}{suffix}"
+
+    def get_done_urls(self) -> Set[str]:
+        """Get the URLs we're done with: articles from any run, and result
+        pages from this one.
+
+        Saved manifests count, whether or not they were checked off, so work
+        saved just before a run died isn't done twice: every article in the
+        corpus, and every response whose articles we haven't finished.
+        """
+        prefix = f"page:{self.run_name}:"
+        urls = set()
+        for key in self.checkpoint.keys:
+            if key.startswith(prefix):
+                urls.add(key[len(prefix) :])
+            elif not key.startswith(_CHECKPOINT_PREFIXES):
+                urls.add(key)
+        for name in self.corpus.get_names(Article):
+            urls.add(self.corpus.get_header(name).get("url"))
+        for name in self.corpus.get_names(Response):
+            if f"response:{name}" not in self.checkpoint:
+                urls.add(self.corpus.get_header(name).get("url"))
+        urls.discard(None)
+        return urls
+
+    def get_html_filename(self, name: str) -> Optional[Path]:
+        """Get the saved raw HTML file of an article, or None if it has none."""
+        filename = self.corpus.filenames[name]
+        filename_html = filename.parent / f"{name}.html"
+        return filename_html if filename_html.exists() else None
+
+    def get_queries(self, query_names: Optional[Iterable[str]] = None) -> List[Query]:
+        """Get queries by name, skipping any we can't collect.
+
+        Args:
+            query_names: Names of queries. Set None for all of them.
+        """
+        log = getLogger(__name__)
+
+        if query_names is None:
+            query_names = sorted(self.corpus.get_names(Query))
+        queries = []
+        for query_name in query_names:
+            query = self.corpus.get(query_name)
+            if not isinstance(query, Query):
+                log.error('Query "%s" not found, skipping.' % query_name)
+                continue
+            if query.source_name not in self.corpus:
+                log.error(
+                    'Source "%s" not found, skipping "%s".'
+                    % (query.source_name, query.name)
+                )
+                continue
+            queries.append(query)
+        return queries
+
+    def increment(self, name: str, initial: Callable[[], int]) -> int:
+        """Get the next value of a naming counter.
+
+        Counters are shared with the other workers if we have a frontier, so
+        everybody's manifest names stay unique.
+
+        Args:
+            name: Name of the counter.
+            initial: Function to get the first value, if the counter is new.
+        """
+        if name not in self.counts:
+            self.counts[name] = initial()
+        if self.frontier:
+            return self.frontier.increment(name, self.counts[name])
+        count = self.counts[name]
+        self.counts[name] += 1
+        return count
+
+    def is_claimed(self, url: str) -> bool:
+        """Check if a URL is ours to save (always, without a frontier)."""
+        return not isinstance(self.url_stops, FrontierSet) or (
+            self.url_stops.is_claimed(url)
+        )
+
+    def load_response(self, filename: str) -> Response:
+        """Load a response saved by another worker and index it."""
+        response = db.read_manifest_file(Path(filename))
+        with self.lock:
+            self.corpus.add(model.to_json(response), filename)
+        return response
+
+    def set_done(self, url: str, key: Optional[str] = None) -> None:
+        """Check off a page or article URL once it's saved.
+
+        Args:
+            url: URL of the page or article.
+            key: Checkpoint key, if not the URL itself.
+        """
+        self.checkpoint.add(key or url)
+        if isinstance(self.url_stops, FrontierSet):
+            self.url_stops.ack(url)
+
+
+###############################################################################
+# Command line interface.                                                     #
+###############################################################################
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    """Run the pipeline from the command line."""
+    parser = argparse.ArgumentParser(
+        prog="chomp", description="Collect articles for WE1S queries."
+    )
+    parser.add_argument("dirpath", type=Path, help="root directory of JSON manifests")
+    parser.add_argument(
+        "-q",
+        "--query",
+        action="append",
+        dest="query_names",
+        help="name of a query to collect (default: all of them)",
+    )
+    parser.add_argument(
+        "-s",
+        "--stages",
+        nargs="+",
+        choices=STAGES,
+        default=STAGES,
+        help="stages to run (default: all of them)",
+    )
+    parser.add_argument("-e", "--export-dir", type=Path, help="save zip archives here")
+    parser.add_argument(
+        "--export-format",
+        choices=EXPORT_FORMATS,
+        default="zip",
+        help="zip archives of JSON, or a Parquet dataset (default: zip)",
+    )
+    parser.add_argument(
+        "--export-html",
+        action="store_true",
+        help="include raw HTML in Parquet exports",
+    )
+    parser.add_argument("--stopwords", type=Path, help="file of URL stopwords")
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=_DEFAULT_NUM_WORKERS,
+        help="pages or articles to request at once",
+    )
+    parser.add_argument(
+        "--clean-workers",
+        type=int,
+        default=_DEFAULT_NUM_CLEAN_WORKERS,
+        help="processes to clean articles with (default: clean them in this one)",
+    )
+    parser.add_argument(
+        "--reclean",
+        action="store_true",
+        help="clean stored articles again from their saved HTML, instead of running",
+    )
+    parser.add_argument(
+        "--grid-url",
+        default=getenv("CHOMP_SELENIUM_GRID_URL"),
+        help="Selenium grid URL (default: $CHOMP_SELENIUM_GRID_URL)",
+    )
+    parser.add_argument(
+        "--google-cx",
+        default=getenv("CHOMP_GOOGLE_CX"),
+        help="Google CSE ID (default: $CHOMP_GOOGLE_CX)",
+    )
+    parser.add_argument(
+        "--google-key",
+        default=getenv("CHOMP_GOOGLE_KEY"),
+        help="Google CSE API key (default: $CHOMP_GOOGLE_KEY)",
+    )
+    parser.add_argument(
+        "--google-quota",
+        type=int,
+        default=_DEFAULT_DAILY_QUOTA,
+        help="Google CSE queries allowed per day",
+    )
+    parser.add_argument(
+        "--google-count-filtered",
+        action="store_true",
+        help="report how many results the date range filters out (1 query each)",
+    )
+    parser.add_argument(
+        "--frontier",
+        type=Path,
+        help="share work with other chomp processes through this SQLite file",
+    )
+    parser.add_argument(
+        "--worker-name",
+        default=f"{gethostname()}:{getpid()}",
+        help="name of this worker in the frontier (default: host:pid)",
+    )
+    parser.add_argument(
+        "--run-name",
+        help="name of this run, to resume it on another day (default: today's date)",
+    )
+    parser.add_argument(
+        "--sitemaps",
+        action="store_true",
+        help="collect from sitemaps instead of Google CSE where sites have them",
+    )
+    parser.add_argument(
+        "--wordpress-streaming",
+        action="store_true",
+        help="parse Wordpress API pages one post at a time (needs ijson)",
+    )
+    parser.add_argument(
+        "--spool",
+        action="store_true",
+        help="keep raw HTML on disk between fetching and saving, not in memory",
+    )
+    parser.add_argument(
+        "--index",
+        action="store_true",
+        help="index articles for chomp-search, and fill new queries from them first",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=Path,
+        help="save metrics here when done (.json for JSON, else Prometheus text)",
+    )
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        help="profile every stage and save profiles here (or see $CHOMP_PROFILE)",
+    )
+    parser.add_argument(
+        "--profiler",
+        choices=profiling.PROFILERS,
+        default="cprofile",
+        help="profiler to use with --profile (default: cprofile)",
+    )
+    parser.add_argument(
+        "--tracemalloc",
+        action="store_true",
+        help="report memory growth and top allocators per stage with --profile",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=profiling.parse_size,
+        help='soft limit on responses and pages held between stages, e.g. "512M"',
+    )
+    parser.add_argument(
+        "--memory-budget-mode",
+        choices=["warn", "block"],
+        default="warn",
+        help="warn when over the memory budget, or block until there's room",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="log more")
+    args = parser.parse_args(args)
+    log = getLogger(__name__)
+    if args.export_format == "parquet" and not lazy.import_optional("pyarrow"):
+        parser.error("--export-format parquet needs pyarrow installed")
+    if args.wordpress_streaming and not lazy.import_optional("ijson"):
+        parser.error("--wordpress-streaming needs ijson installed")
+
+    logging.basicConfig(
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        level=logging.DEBUG if args.verbose else logging.INFO,
+    )
+
+    url_stopwords = set()
+    if args.stopwords:
+        url_stopwords = {w.strip() for w in db.load_list_file(args.stopwords)}
+
+    pipeline = Pipeline(
+        dirpath=args.dirpath,
+        export_dirpath=args.export_dir,
+        url_stopwords=url_stopwords,
+        google_cx=args.google_cx,
+        google_key=args.google_key,
+        google_quota=args.google_quota,
+        browser=web.Browser.lightweight(args.grid_url) if args.grid_url else None,
+        num_workers=args.workers,
+        frontier=SQLiteFrontier(args.frontier) if args.frontier else None,
+        worker=args.worker_name,
+        index=Index.in_dir(args.dirpath) if args.index else None,
+        is_using_sitemaps=args.sitemaps,
+        export_format=args.export_format,
+        is_exporting_html=args.export_html,
+        is_spooling=args.spool,
+        num_clean_workers=args.clean_workers,
+        is_counting_google_filtered=args.google_count_filtered,
+        run_name=args.run_name,
+        is_streaming_wordpress=args.wordpress_streaming,
+    )
+    if args.metrics:
+        metrics.enable()
+    if args.profile:
+        profiling.configure(
+            profiler_name=args.profiler,
+            is_tracing_memory=args.tracemalloc,
+            dirpath=args.profile,
+        )
+    if args.memory_budget:
+        profiling.set_budget(args.memory_budget, args.memory_budget_mode == "block")
+    try:
+        if args.reclean:
+            pipeline.reclean(args.query_names)
+        elif not args.frontier:
+            pipeline.run(args.query_names, args.stages)
+        else:
+            run_worker(pipeline, args.query_names, args.stages)
+    finally:
+        if args.metrics:
+            metrics.save(args.metrics)
+            log.info("Saved metrics: %s" % args.metrics)
+        if args.profile:
+            profiling.save()
+
+
+def run_worker(
+    pipeline: Pipeline, query_names: Optional[List[str]], stages: List[str]
+) -> None:
+    """Run the pipeline as one of several workers sharing a frontier."""
+    log = getLogger(__name__)
+
+    # Any worker might finish last, so the export stage gets a run of its own.
+    work_stages = [stage for stage in stages if stage != "export"]
+    if "responses" in work_stages:
+        pipeline.seed(query_names)
+    if work_stages:
+        pipeline.work(work_stages)
+    if "export" in stages:
+        if work_stages:
+            log.warning("Run the export stage by itself once all workers finish.")
+        else:
+            pipeline.export(pipeline.get_queries(query_names))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,586 @@
+"""Opt-in profiling and a memory budget for collection runs.
+
+Profiling wraps the pipeline stages (get_responses, get_metadata, get_content
+and save_manifest_file) and keeps a separate profile for each one, with
+cProfile or, if it's installed, pyinstrument. Each stage's profile only covers
+its own time: while one stage calls another (get_metadata cleaning content, for
+instance), the time goes to the inner stage. With memory tracing on, tracemalloc
+records how far memory grows over each stage and the top allocators at each
+stage's high-water mark. Profiles and the memory report are saved to a
+directory at exit, or whenever save() is called.
+
+Profiling is off by default. Set CHOMP_PROFILE to a comma-separated list of
+stages (or "all") to turn it on, CHOMP_PROFILER to "pyinstrument" to use that
+instead of cProfile (or "none" to trace memory without profiling), and
+CHOMP_TRACEMALLOC to trace memory. Profiles go in CHOMP_PROFILE_DIR. Or call
+configure().
+
+Content cleaned in worker processes (num_clean_workers > 0) isn't profiled. Use
+0 workers while profiling get_content.
+
+The memory budget is a soft limit on the article pages and API responses held
+in buffers between stages. Over budget, it either logs a warning, with a
+breakdown of which buffer holds what, or blocks whoever is filling the buffer
+until there's room again. Set CHOMP_MEMORY_BUDGET to a size ("512M", "2G") and
+CHOMP_MEMORY_BUDGET_MODE to "block" (or "warn", the default). Or call
+set_budget().
+
+Usage:
+    CHOMP_PROFILE=get_metadata,get_content CHOMP_TRACEMALLOC=1 chomp corpus/
+"""
+import atexit
+import inspect
+from collections import defaultdict
+from contextlib import contextmanager, suppress
+from functools import wraps
+from logging import getLogger
+from os import getenv
+from pathlib import Path
+from threading import Condition, Lock, get_ident, local
+from time import monotonic
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+from we1s_chomp import lazy, metrics
+
+###############################################################################
+# Internal configuration parameters.                                          #
+###############################################################################
+
+
+_DEFAULT_DIRPATH = "chomp-profile"
+"""Default directory to save profiles in."""
+
+_DEFAULT_NUM_ALLOCATORS = 10
+"""Default number of top allocators to report for each stage."""
+
+_DEFAULT_NUM_FUNCTIONS = 40
+"""Number of functions to list in each cProfile text report."""
+
+_ENV_VAR = "CHOMP_PROFILE"
+"""Environment variable with stages to profile."""
+
+_ENV_VAR_BUDGET = "CHOMP_MEMORY_BUDGET"
+"""Environment variable with the memory budget size."""
+
+_ENV_VAR_BUDGET_MODE = "CHOMP_MEMORY_BUDGET_MODE"
+"""Environment variable with the memory budget mode, "warn" or "block"."""
+
+_ENV_VAR_DIRPATH = "CHOMP_PROFILE_DIR"
+"""Environment variable with the directory to save profiles in."""
+
+_ENV_VAR_PROFILER = "CHOMP_PROFILER"
+"""Environment variable with the profiler to use."""
+
+_ENV_VAR_TRACEMALLOC = "CHOMP_TRACEMALLOC"
+"""Environment variable that turns memory tracing on."""
+
+_SIZE_UNITS = {"K": 1024, "M": 1024**2, "G": 1024**3}
+"""Multipliers for size suffixes."""
+
+_SNAPSHOT_INTERVAL = 1.0
+"""Minimum time in seconds between tracemalloc snapshots."""
+
+_SNAPSHOT_SHARE = 0.1
+"""Most of the run time to spend taking tracemalloc snapshots. With lots of
+memory traced, a snapshot can take a second or more."""
+
+PROFILERS = ["cprofile", "pyinstrument", "none"]
+"""Available profilers."""
+
+STAGES = ["get_responses", "get_metadata", "get_content", "save_manifest_file"]
+"""Stages that can be profiled."""
+
+
+###############################################################################
+# Profiler class.                                                             #
+###############################################################################
+
+
+class Profiler:
+    """Per-stage profiles and memory usage.
+
+    Profiles are kept per stage and thread, since neither profiler can share
+    one between threads, and merged when they're saved.
+    """
+
+    def __init__(
+        self,
+        stages: Iterable[str] = (),
+        profiler: str = "cprofile",
+        is_tracing_memory: bool = False,
+        dirpath: Union[Path, str] = _DEFAULT_DIRPATH,
+        num_allocators: int = _DEFAULT_NUM_ALLOCATORS,
+    ):
+        """Create a new Profiler instance.
+
+        Args:
+            stages: Stages to profile. Leave empty to profile nothing.
+            profiler: "cprofile", "pyinstrument" or "none".
+            is_tracing_memory: Trace memory with tracemalloc.
+            dirpath: Directory to save profiles in.
+            num_allocators: Number of top allocators to report for each stage.
+        """
+        log = getLogger(__name__)
+
+        if profiler == "pyinstrument" and not lazy.import_optional("pyinstrument"):
+            log.warning("pyinstrument isn't installed; using cProfile.")
+            profiler = "cprofile"
+        self.stages = set(stages)
+        self.profiler = profiler
+        self.is_tracing_memory = is_tracing_memory
+        self.dirpath = Path(dirpath)
+        self.num_allocators = num_allocators
+        self.lock = Lock()
+        self.local = local()
+        self.reset()
+
+        if self.stages and is_tracing_memory:
+            import tracemalloc
+
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    def reset(self) -> None:
+        """Clear all profiles."""
+        self.profiles = {}
+        self.memory = defaultdict(
+            lambda: {
+                "calls": 0,
+                "peak": 0,
+                "growth": 0,
+                "allocators": [],
+            }
+        )
+        self.next_snapshot_time = 0.0
+
+    def is_profiling(self, stage: str) -> bool:
+        """Check if a stage is being profiled."""
+        return stage in self.stages
+
+    @contextmanager
+    def profile(self, stage: str) -> Iterator[None]:
+        """Profile a block of code as part of a stage.
+
+        The profile of any stage already running in this thread is paused
+        until the block is done.
+        """
+        if stage not in self.stages:
+            yield
+            return
+
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        stack = self.local.stack
+        if stack:
+            pause(stack[-1])
+        profile = self.get_profile(stage)
+        stack.append(profile)
+        memory_start = get_traced_memory() if self.is_tracing_memory else 0
+        resume(profile)
+        try:
+            yield
+        finally:
+            pause(profile)
+            stack.pop()
+            if self.is_tracing_memory:
+                self.record_memory(stage, memory_start)
+            if stack:
+                resume(stack[-1])
+
+    def get_profile(self, stage: str) -> object:
+        """Get this thread's profile for a stage, or None if not profiling."""
+        key = stage, get_ident()
+        with self.lock:
+            if key not in self.profiles:
+                if self.profiler == "cprofile":
+                    import cProfile
+
+                    self.profiles[key] = cProfile.Profile()
+                elif self.profiler == "pyinstrument":
+                    pyinstrument = lazy.import_optional("pyinstrument")
+                    self.profiles[key] = pyinstrument.Profiler(async_mode="disabled")
+                else:
+                    self.profiles[key] = None
+            return self.profiles[key]
+
+    def record_memory(self, stage: str, memory_start: int) -> None:
+        """Record memory growth over a stage, and the top allocators if this is
+        the most memory the stage has seen.
+
+        Snapshots for the top allocators are rationed, so they may be from a
+        little short of the peak.
+        """
+        import tracemalloc
+
+        current = get_traced_memory()
+        start = monotonic()
+        with self.lock:
+            memory = self.memory[stage]
+            memory["calls"] += 1
+            memory["growth"] = max(memory["growth"], current - memory_start)
+            if current <= memory["peak"]:
+                return
+            memory["peak"] = current
+            if start < self.next_snapshot_time:
+                return
+            self.next_snapshot_time = float("inf")  # Just the one at a time.
+
+        # Snapshots are slow, so take them outside the lock.
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+            ]
+        )
+        allocators = [
+            str(stat) for stat in snapshot.statistics("lineno")[: self.num_allocators]
+        ]
+        end = monotonic()
+        with self.lock:
+            memory["allocators"] = allocators
+            self.next_snapshot_time = end + max(
+                _SNAPSHOT_INTERVAL, (end - start) / _SNAPSHOT_SHARE
+            )
+
+    def save(self, dirpath: Optional[Union[Path, str]] = None) -> List[Path]:
+        """Save profiles and the memory report.
+
+        For each stage, cProfile writes {stage}.prof (for pstats or snakeviz)
+        and {stage}.txt (the top functions by cumulative time); pyinstrument
+        writes {stage}.html and {stage}.txt. The memory report goes in
+        memory.txt.
+
+        Args:
+            dirpath: Directory to save in. Set None for the one the Profiler
+                was created with.
+
+        Returns:
+            Filenames saved.
+        """
+        import pstats
+
+        log = getLogger(__name__)
+
+        dirpath = Path(dirpath or self.dirpath)
+        dirpath.mkdir(parents=True, exist_ok=True)
+        filenames = []
+
+        with self.lock:
+            profiles = defaultdict(list)
+            for (stage, _), profile in self.profiles.items():
+                if profile is not None:
+                    profiles[stage].append(profile)
+            memory = {stage: dict(info) for stage, info in self.memory.items()}
+
+        for stage, stage_profiles in sorted(profiles.items()):
+            if self.profiler == "cprofile":
+                stats = None
+                for profile in stage_profiles:
+                    with suppress(TypeError):  # Nothing recorded in this one.
+                        if stats is None:
+                            stats = pstats.Stats(profile)
+                        else:
+                            stats.add(profile)
+                if stats is None:
+                    continue
+                stats.dump_stats(dirpath / f"{stage}.prof")
+                with open(dirpath / f"{stage}.txt", "w", encoding="utf-8") as f:
+                    stats.stream = f
+                    stats.sort_stats("cumulative").print_stats(_DEFAULT_NUM_FUNCTIONS)
+                filenames += [dirpath / f"{stage}.prof", dirpath / f"{stage}.txt"]
+            else:
+                from pyinstrument import renderers
+                from pyinstrument.session import Session
+
+                sessions = [p.last_session for p in stage_profiles if p.last_session]
+                if not sessions:
+                    continue
+                session = sessions[0]
+                for other in sessions[1:]:
+                    session = Session.combine(session, other)
+                (dirpath / f"{stage}.html").write_text(
+                    renderers.HTMLRenderer().render(session), encoding="utf-8"
+                )
+                (dirpath / f"{stage}.txt").write_text(
+                    renderers.ConsoleRenderer(unicode=True, color=False).render(
+                        session
+                    ),
+                    encoding="utf-8",
+                )
+                filenames += [dirpath / f"{stage}.html", dirpath / f"{stage}.txt"]
+
+        if memory or budget.limit != -1:
+            filename = dirpath / "memory.txt"
+            filename.write_text(format_memory(memory), encoding="utf-8")
+            filenames.append(filename)
+
+        log.info("Saved %i profile files to %s." % (len(filenames), dirpath))
+        return filenames
+
+
+###############################################################################
+# MemoryBudget class.                                                         #
+###############################################################################
+
+
+class MemoryBudget:
+    """Soft limit on the size of data held in buffers between stages.
+
+    Whoever puts something in a buffer acquires its size from the budget, and
+    whoever takes it out releases it. Sizes are the length of the raw text,
+    which is near enough to bytes for the purpose.
+    """
+
+    def __init__(self, limit: int = -1, is_blocking: bool = False):
+        """Create a new MemoryBudget instance.
+
+        Args:
+            limit: Size limit, or -1 for no limit.
+            is_blocking: Wait for room when over budget. Set False to just log
+                a warning.
+        """
+        self.limit = limit
+        self.is_blocking = is_blocking
+        self.condition = Condition()
+        self.usage = 0
+        self.peak = 0
+        self.holders = defaultdict(int)
+        self.peak_holders = {}
+        self.is_warned = False
+
+    def acquire(self, size: int, holder: str, is_waiting: bool = True) -> None:
+        """Add data to a buffer.
+
+        Args:
+            size: Size of the data.
+            holder: Name of the buffer, e.g. "responses".
+            is_waiting: Wait for room if the budget blocks. Set False if this
+                thread is the one that empties the buffer, and push back some
+                other way (see is_over()).
+        """
+        log = getLogger(__name__)
+
+        if self.limit == -1:
+            return
+        with self.condition:
+            if self.is_blocking and is_waiting:
+                self.condition.wait_for(
+                    lambda: not self.usage or self.usage + size <= self.limit
+                )
+            self.usage += size
+            self.holders[holder] += size
+            if self.usage > self.peak:
+                self.peak = self.usage
+                self.peak_holders = dict(self.holders)
+            if self.usage > self.limit and not self.is_warned:
+                self.is_warned = True
+                log.warning(
+                    "Over memory budget: %s held of %s (%s)."
+                    % (
+                        format_size(self.usage),
+                        format_size(self.limit),
+                        self.format_holders(),
+                    )
+                )
+        metrics.add_gauge("chomp_buffer_bytes", size, buffer=holder)
+
+    def release(self, size: int, holder: str) -> None:
+        """Take data out of a buffer."""
+        if self.limit == -1:
+            return
+        with self.condition:
+            self.usage -= size
+            self.holders[holder] -= size
+            if self.usage <= self.limit:
+                self.is_warned = False
+            self.condition.notify_all()
+        metrics.add_gauge("chomp_buffer_bytes", -size, buffer=holder)
+
+    def is_over(self) -> bool:
+        """Check if the budget blocks and there's more held than it allows."""
+        return self.is_blocking and self.limit != -1 and self.usage > self.limit
+
+    def format_holders(self, holders: Optional[Dict[str, int]] = None) -> str:
+        """Format sizes held by each buffer for humans."""
+        holders = self.holders if holders is None else holders
+        return ", ".join(
+            "%s: %s" % (holder, format_size(size))
+            for holder, size in sorted(holders.items(), key=lambda h: -h[1])
+        )
+
+
+###############################################################################
+# Module state and functions.                                                 #
+###############################################################################
+
+
+def parse_size(size_str: str) -> int:
+    """Parse a size like "512M" or "2G" into bytes."""
+    size_str = size_str.strip().upper().rstrip("B")
+    if size_str and size_str[-1] in _SIZE_UNITS:
+        return int(float(size_str[:-1]) * _SIZE_UNITS[size_str[-1]])
+    return int(size_str)
+
+
+def get_stages(stages_str: str) -> List[str]:
+    """Get stages to profile from a comma-separated list, or "all"."""
+    if stages_str.strip().lower() in {"1", "all"}:
+        return list(STAGES)
+    return [s.strip() for s in stages_str.split(",") if s.strip() and s != "0"]
+
+
+profiler = Profiler(
+    stages=get_stages(getenv(_ENV_VAR, "")),
+    profiler=getenv(_ENV_VAR_PROFILER, "cprofile").lower(),
+    is_tracing_memory=getenv(_ENV_VAR_TRACEMALLOC, "0") not in {"", "0"},
+    dirpath=getenv(_ENV_VAR_DIRPATH, _DEFAULT_DIRPATH),
+)
+"""Process-wide profiler."""
+
+budget = MemoryBudget(
+    limit=parse_size(getenv(_ENV_VAR_BUDGET, "-1")),
+    is_blocking=getenv(_ENV_VAR_BUDGET_MODE, "warn").lower() == "block",
+)
+"""Process-wide memory budget."""
+
+if profiler.stages:
+    atexit.register(lambda: profiler.save())
+
+
+def configure(
+    stages: Iterable[str] = STAGES,
+    profiler_name: str = "cprofile",
+    is_tracing_memory: bool = False,
+    dirpath: Union[Path, str] = _DEFAULT_DIRPATH,
+) -> Profiler:
+    """Replace the process-wide profiler. See Profiler for arguments."""
+    global profiler
+    if profiler.is_tracing_memory:
+        import tracemalloc
+
+        tracemalloc.stop()
+    profiler = Profiler(stages, profiler_name, is_tracing_memory, dirpath)
+    return profiler
+
+
+def set_budget(limit: int = -1, is_blocking: bool = False) -> MemoryBudget:
+    """Replace the process-wide memory budget. See MemoryBudget for arguments."""
+    global budget
+    budget = MemoryBudget(limit, is_blocking)
+    return budget
+
+
+def profiled(stage: str) -> Callable:
+    """Decorator to profile a function as a stage.
+
+    Generator functions are profiled one item at a time, so the time the
+    caller spends between items isn't counted.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.isgeneratorfunction(func):
+
+            @wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                items = func(*args, **kwargs)
+                if not profiler.is_profiling(stage):
+                    return (yield from items)
+                try:
+                    while True:
+                        with profiler.profile(stage):
+                            try:
+                                item = next(items)
+                            except StopIteration as e:
+                                return e.value
+                        yield item
+                finally:
+                    items.close()
+
+            return generator_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiler.is_profiling(stage):
+                return func(*args, **kwargs)
+            with profiler.profile(stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def save(dirpath: Optional[Union[Path, str]] = None) -> List[Path]:
+    """Save profiles and the memory report. See Profiler.save()."""
+    return profiler.save(dirpath)
+
+
+###############################################################################
+# Helper functions.                                                           #
+###############################################################################
+
+
+def format_memory(memory: Dict[str, Dict]) -> str:
+    """Format the memory report for humans."""
+    lines = []
+    for stage, info in sorted(memory.items()):
+        lines += [
+            f"{stage}",
+            f"    calls: {info['calls']}",
+            f"    peak traced memory: {format_size(info['peak'])}",
+            f"    largest growth in one call: {format_size(info['growth'])}",
+            "    top allocators at peak:",
+        ]
+        lines += [f"        {allocator}" for allocator in info["allocators"]]
+        lines.append("")
+
+    if budget.limit != -1:
+        lines += [
+            "memory budget",
+            f"    limit: {format_size(budget.limit)}",
+            f"    peak: {format_size(budget.peak)}",
+            f"    held at peak: {budget.format_holders(budget.peak_holders)}",
+            "",
+        ]
+    return "\n".join(lines)
+
+
+def format_size(size: int) -> str:
+    """Format a size in bytes for humans."""
+    for unit in ("G", "M", "K"):
+        if abs(size) >= _SIZE_UNITS[unit]:
+            return "%.1f %sB" % (size / _SIZE_UNITS[unit], unit)
+    return "%i B" % size
+
+
+def get_traced_memory() -> int:
+    """Get the size of memory traced by tracemalloc right now."""
+    import tracemalloc
+
+    return tracemalloc.get_traced_memory()[0]
+
+
+def pause(profile: object) -> None:
+    """Stop a profile recording, if it is."""
+    if profile is None:
+        return
+    with suppress(RuntimeError, ValueError):
+        if hasattr(profile, "disable"):  # cProfile
+            profile.disable()
+        elif profile.is_running:
+            profile.stop()
+
+
+def resume(profile: object) -> None:
+    """Start (or restart) a profile recording.
+
+    Another profiler may already be active, e.g. in another thread on Python
+    3.12+, where profiling is process-wide. Then this one misses out.
+    """
+    if profile is None:
+        return
+    with suppress(RuntimeError, ValueError):
+        if hasattr(profile, "enable"):  # cProfile
+            profile.enable()
+        else:
+            profile.start()
@@ -0,0 +1,527 @@
+"""Scraping tools for XML sitemaps.
+
+Sites without a Wordpress API can still tell us what they've published: most
+list their sitemaps in robots.txt, and news sites tend to keep dated ones.
+Walking them costs no Google CSE quota and has no cap on results. Sitemap
+indexes are followed down to the URL sets, gzipped or not, and each sitemap is
+parsed one entry at a time, so we never hold more than the download and the
+entries that pass the filters.
+
+Sitemaps can't be searched, so every article in the date range is a candidate.
+get_metadata() fetches them and keeps the ones that mention the search term.
+"""
+import gzip
+import json
+import re
+from datetime import datetime
+from io import BytesIO
+from logging import getLogger
+from typing import TYPE_CHECKING, Dict, Iterator, Optional, Set, Tuple, Union
+from xml.etree.ElementTree import ParseError, iterparse
+
+from we1s_chomp import clean, metrics, profiling, web
+from we1s_chomp.cache import Cache
+from we1s_chomp.model import Payload, load_payload
+from we1s_chomp.spool import Spool
+
+if TYPE_CHECKING:
+    from urllib.robotparser import RobotFileParser
+
+###############################################################################
+# Internal configuration parameters.                                          #
+###############################################################################
+
+
+_DATE_PATTERNS = [
+    re.compile(
+        r"<meta[^>]+(?:property|name|itemprop)=[\"']"
+        r"(?:article:published_time|datePublished|pubdate|date)[\"']"
+        r"[^>]*content=[\"']([^\"']+)",
+        re.IGNORECASE,
+    ),
+    re.compile(r"\"datePublished\"\s*:\s*\"([^\"]+)\""),
+]
+"""Patterns for publication dates in article HTML: meta tags and JSON-LD."""
+
+_DEFAULT_CONTENT_TYPES = {
+    "application/gzip",
+    "application/octet-stream",
+    "application/x-gzip",
+    "application/xml",
+    "text/plain",
+    "text/xml",
+}
+"""Content-Type allowlist for sitemaps."""
+
+_DEFAULT_MAX_CONTENT_LENGTH = 50 * 1024 * 1024
+"""Maximum sitemap size in bytes. The sitemap protocol allows up to 50 MB."""
+
+_DEFAULT_MAX_DEPTH = 3
+"""Default number of sitemap indexes deep to follow."""
+
+_DEFAULT_NUM_CLEAN_WORKERS = 0
+"""Default number of processes to clean articles with, or 0 for none."""
+
+_DEFAULT_NUM_WORKERS = 1
+"""Default number of sitemaps or articles to request at once."""
+
+_DEFAULT_PAGE_LIMIT = -1
+"""Stop after this # of sitemaps, or -1 for no limit."""
+
+_ENTRY_FIELDS = {"loc", "lastmod", "publication_date", "title"}
+"""Sitemap entry fields we keep. publication_date and title come from Google
+News sitemaps."""
+
+_NAMESPACES = {
+    "",
+    "http://www.sitemaps.org/schemas/sitemap/0.9",
+    "http://www.google.com/schemas/sitemap-news/0.9",
+}
+"""XML namespaces to take entry fields from. Image and video sitemap fields
+have their own loc and title, which aren't the article's."""
+
+_GZIP_MAGIC = b"\x1f\x8b"
+"""First bytes of a gzipped file."""
+
+_ROBOTS_USER_AGENT = "*"
+"""User agent to check robots.txt rules for."""
+
+_SITEMAP_PATH = "sitemap.xml"
+"""Where to look for a sitemap if robots.txt doesn't list any."""
+
+
+###############################################################################
+# Collector functions.                                                        #
+###############################################################################
+
+
+# Step 1: Get search responses.
+@profiling.profiled("get_responses")
+def get_responses(
+    query_str: str,
+    base_url: str,
+    url_stops: Set[str] = set(),
+    url_stopwords: Set[str] = set(),
+    page_limit: int = _DEFAULT_PAGE_LIMIT,
+    browser: Optional[web.Browser] = None,
+    num_workers: int = _DEFAULT_NUM_WORKERS,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    cache: Optional[Cache] = None,
+    max_depth: int = _DEFAULT_MAX_DEPTH,
+) -> Iterator[Tuple[str, str]]:
+    """Collect candidate article URLs from a site's sitemaps.
+
+    Sitemaps are found through robots.txt, or at /sitemap.xml if it doesn't
+    list any. Indexes are followed level by level; nested sitemaps last
+    modified before the start of the query can't have anything new in them,
+    so they're skipped. Each URL set becomes one response, with the entries
+    that pass the filters.
+
+    Sitemaps are always fetched with the Requests module: Chrome won't hand
+    back raw XML, let alone gzip.
+
+    Args:
+        query_str: Search term. Sitemaps can't be searched, so this is only
+            used for logging; get_metadata() does the matching.
+        base_url: Base site URL.
+        url_stops: Skip these article URLs altogether. Sitemap URLs aren't
+            checked or added, since the same sitemaps serve every query.
+        url_stopwords: Skip all article URLs that contain a word from this
+            set.
+        page_limit: Stop after this # of URL sets, or -1 for no limit.
+        browser: Unused, but accepted for the same interface as the other
+            collectors.
+        num_workers: Number of sitemaps to request at once.
+        start_date: Start date of query. Entries last modified before this
+            are skipped.
+        end_date: End date of query. Entries with a publication date after
+            this are skipped. (Last modified dates after it don't count, since
+            old articles get edited.)
+        cache: Cache for robots.txt and sitemap discovery. Set None to always
+            ask the site.
+        max_depth: Number of sitemap indexes deep to follow.
+
+    Returns:
+        Generator of (sitemap URL, JSON list of entry dicts) tuples, as
+        Payloads carrying the parsed entries along with them.
+    """
+    log = getLogger(__name__)
+
+    capabilities = get_capabilities(base_url, cache=cache)
+    robots = get_robots(capabilities["robots"])
+
+    def is_entry_ok(entry: Dict) -> bool:
+        url = entry.get("loc", "")
+        if not url:
+            return False
+        if not web.is_url_ok(url, url_stops, url_stopwords):
+            log.debug("Skipping (URL in stop list): %s" % url)
+            metrics.inc("chomp_skips_total", reason=web.SKIP_URL_STOP)
+            return False
+        if not robots.can_fetch(_ROBOTS_USER_AGENT, url):
+            log.debug("Skipping (%s): %s" % (web.SKIP_ROBOTS, url))
+            metrics.inc("chomp_skips_total", reason=web.SKIP_ROBOTS)
+            return False
+        if not is_entry_in_range(entry, start_date, end_date):
+            log.debug("Skipping (%s): %s" % (web.SKIP_DATE, url))
+            metrics.inc("chomp_skips_total", reason=web.SKIP_DATE)
+            return False
+        return True
+
+    # Work down the indexes one level at a time, fetching each level's
+    # sitemaps all at once.
+    count = num_urls = 0
+    seen = set()
+    sitemap_urls = capabilities["sitemaps"]
+    for depth in range(max_depth + 1):
+        next_sitemap_urls = []
+        urls = [url for url in sitemap_urls if url not in seen]
+        seen.update(urls)
+        sitemaps = web.get_batch(
+            urls,
+            web.get,
+            num_workers,
+            content_types=_DEFAULT_CONTENT_TYPES,
+            max_length=_DEFAULT_MAX_CONTENT_LENGTH,
+            is_binary=True,
+        )
+        for sitemap_url, body in sitemaps:
+            entries = []
+            for kind, entry in iter_sitemap(body):
+                if kind == "sitemapindex":
+                    if is_entry_in_range(entry, start_date):
+                        next_sitemap_urls.append(entry["loc"])
+                elif is_entry_ok(entry):
+                    entries.append(entry)
+            if not entries:
+                continue
+
+            count += 1
+            num_urls += len(entries)
+            yield sitemap_url, Payload(json.dumps(entries), entries)
+            if page_limit != -1 and count >= page_limit:
+                break
+
+        # Stop any sitemaps still in flight.
+        sitemaps.close()
+        if not next_sitemap_urls or (page_limit != -1 and count >= page_limit):
+            break
+        if depth == max_depth:
+            log.warning(
+                "Not following %i sitemaps more than %i indexes deep: %s"
+                % (len(next_sitemap_urls), max_depth, base_url)
+            )
+        sitemap_urls = next_sitemap_urls
+
+    log.info(
+        'Collected %i URLs from %i sitemaps for "%s": %s'
+        % (num_urls, count, query_str, base_url)
+    )
+
+
+# Step 2: Get metadata & content from responses.
+@profiling.profiled("get_metadata")
+def get_metadata(
+    response: Union[Payload, str],
+    query_str: str,
+    start_date: datetime,
+    end_date: datetime,
+    url_stops: Set[str] = set(),
+    url_stopwords: Set[str] = set(),
+    browser: Optional[web.Browser] = None,
+    num_workers: int = _DEFAULT_NUM_WORKERS,
+    num_clean_workers: int = _DEFAULT_NUM_CLEAN_WORKERS,
+    spool: Optional[Spool] = None,
+    content_cache: Optional[Cache] = None,
+) -> Iterator[Dict]:
+    """Collect metadata from the entries of a sitemap response.
+
+    Articles are fetched and cleaned the same way as for Google CSE results.
+    Since sitemaps can't be searched, articles that don't mention the search
+    term at all (in any case) are skipped.
+
+    Args:
+        response: Raw JSON string of sitemap entries, or a Payload straight
+            from get_responses().
+        query_str: Term to search for. Articles that contain this str, but
+            not verbatim, will be flagged as no_exact_match.
+        start_date: Start date of query. Articles dated before this, and those
+            without a date, will be ignored.
+        end_date: End date of query. Articles dated after this, and those
+            without a date, will be ignored.
+        url_stops: Skip these URLs altogether. This will be modified with each
+            additional result we find in order to prevent dupes.
+        url_stopwords: Skip all URLs that contain a word from this set.
+        browser: Selenium configuration wrapper for scraping content. Set None
+            to use Requests module.
+        num_workers: Number of articles to fetch at once.
+        num_clean_workers: Number of processes to clean article content with,
+            or 0 to clean it in this process.
+        spool: Write raw HTML here and return the spool file's Path as
+            content_html, instead of the HTML itself.
+        content_cache: Cache of cleaned content, so pages that haven't
+            changed aren't cleaned again. Set None to always clean.
+
+    Returns:
+        Generator containing article metadata as a dict. This can be used
+        as-is or passed to the Article constructor. With more than one worker,
+        articles are returned in the order they finish.
+    """
+    log = getLogger(__name__)
+
+    # Use Selenium if we have configuration information, otherwise default to
+    # the Requests module.
+    collector = web.get_interface(browser)
+
+    try:
+        entries = load_payload(response)
+    except json.JSONDecodeError:
+        log.warning('Could not decode JSON response "%s".' % clean.get_stub(response))
+        return None
+
+    # Check all the entries before we fetch anything.
+    count = skipped = 0
+    results = {}
+    for entry in entries:
+        url = entry["loc"]
+        if url in results or not web.is_url_ok(url, url_stops, url_stopwords):
+            log.info("Skipping %s (URL in stop list)." % url)
+            metrics.inc("chomp_skips_total", reason=web.SKIP_URL_STOP)
+            skipped += 1
+            continue
+        results[url] = entry
+
+    # Scrape and clean content.
+    if num_workers > 1:
+        pages = web.get_batch(results, collector, num_workers, ordered=False)
+    else:
+        pages = ((url, collector(url)) for url in results)
+    query_str_lower = query_str.lower()
+    for url, content_html, content in clean.get_content_batch(
+        pages, num_clean_workers, cache=content_cache
+    ):
+        if isinstance(content_html, web.Skipped):
+            skipped += 1
+            continue
+        if not content_html or content_html == "":
+            log.info("Skipping %s (No content)." % url)
+            metrics.inc("chomp_skips_total", reason=web.SKIP_NO_CONTENT)
+            skipped += 1
+            continue
+
+        # The page knows its publication date better than the sitemap does.
+        entry = results[url]
+        date = (
+            get_date(entry.get("publication_date", ""))
+            or get_page_date(content_html)
+            or get_date(entry.get("lastmod", ""))
+        )
+        if not date or not start_date <= date <= end_date:
+            log.info("Skipping %s (No date or out of date range)." % url)
+            metrics.inc("chomp_skips_total", reason=web.SKIP_DATE)
+            skipped += 1
+            continue
+
+        if query_str_lower not in content.lower():
+            log.info("Skipping %s (%s)." % (url, web.SKIP_NO_MATCH))
+            metrics.inc("chomp_skips_total", reason=web.SKIP_NO_MATCH)
+            skipped += 1
+            continue
+        no_exact_match = query_str not in content
+        title = entry.get("title") or get_page_title(content_html) or url
+        if spool is not None:
+            content_html = spool.write(content_html)
+
+        # Save metadata and return.
+        count += 1
+        url_stops.add(url)
+        yield {
+            "content": content,
+            "content_html": content_html,
+            "pub_date": date,
+            "title": title,
+            "url": url,
+            "no_exact_match": no_exact_match,
+        }
+        log.info("Got %s." % url)
+
+    log.info("Collected %i articles (%i skipped)." % (count, skipped))
+
+
+###############################################################################
+# Helper functions.                                                           #
+###############################################################################
+
+
+def get_capabilities(
+    base_url: str,
+    cache: Optional[Cache] = None,
+    is_refreshing: bool = False,
+) -> Dict:
+    """Find a site's sitemaps and crawl rules.
+
+    Args:
+        base_url: Base site URL.
+        cache: Cache for results. Set None to always ask the site.
+        is_refreshing: Ask the site even if we have a cached answer.
+
+    Returns:
+        Dict with "is_available" (bool), "sitemaps" (URLs of the top-level
+        sitemaps) and "robots" (text of robots.txt, or "" if there isn't one).
+    """
+    log = getLogger(__name__)
+
+    cache_key = ["sitemap", base_url.rstrip("/")]
+    if cache is not None and not is_refreshing:
+        capabilities = cache.get(cache_key)
+        if capabilities is not None:
+            log.debug("Found sitemaps in cache: %s" % base_url)
+            return capabilities
+
+    robots_text = web.get(
+        f"{base_url.rstrip('/')}/robots.txt", content_types={"text/plain"}
+    )
+    sitemaps = list(get_robots(robots_text or "").site_maps() or [])
+
+    # Check for a sitemap in the usual spot.
+    res = None
+    if not sitemaps:
+        url = f"{base_url.rstrip('/')}/{_SITEMAP_PATH}"
+        res = web.get(
+            url,
+            content_types=_DEFAULT_CONTENT_TYPES,
+            max_length=_DEFAULT_MAX_CONTENT_LENGTH,
+            is_binary=True,
+        )
+        if next(iter_sitemap(res), None) is not None:
+            sitemaps.append(url)
+
+    capabilities = {
+        "is_available": bool(sitemaps),
+        "sitemaps": sitemaps,
+        "robots": robots_text or "",
+    }
+    if sitemaps:
+        log.info("Found %i sitemaps: %s" % (len(sitemaps), base_url))
+    else:
+        log.info("No sitemaps found: %s" % base_url)
+
+    # Don't hold a connection error against the site.
+    if cache is not None and (robots_text is not None or res is not None):
+        cache.set(cache_key, capabilities)
+    return capabilities
+
+
+def get_date(date_str: str) -> Optional[datetime]:
+    """Parse a W3C datetime string from a sitemap (or a page), quickly.
+
+    Time zones are dropped, like everywhere else we keep dates.
+
+    Returns:
+        Parsed datetime; None if there isn't one or it doesn't parse.
+    """
+    date_str = date_str.strip()
+    if date_str[-1:] in ["Z", "z"]:
+        date_str = date_str[:-1] + "+00:00"
+
+    # Try it whole first, so offsets (and times without seconds) are read
+    # right, then just the parts we need.
+    for length in [None, 19, 10]:  # All, "YYYY-MM-DDThh:mm:ss", "YYYY-MM-DD"
+        try:
+            return datetime.fromisoformat(date_str[:length]).replace(tzinfo=None)
+        except ValueError:
+            continue
+    return None
+
+
+def get_page_date(html: str) -> Optional[datetime]:
+    """Find an article's publication date in its meta tags or JSON-LD."""
+    for pattern in _DATE_PATTERNS:
+        match = pattern.search(html)
+        if match:
+            date = get_date(match.group(1))
+            if date:
+                return date
+    return None
+
+
+def get_robots(robots_text: str) -> "RobotFileParser":
+    """Parse the rules in a robots.txt file."""
+    from urllib.robotparser import RobotFileParser
+
+    robots = RobotFileParser()
+    robots.parse(robots_text.splitlines())
+    return robots
+
+
+def get_page_title(html: str) -> str:
+    """Find a page's title, if it has one."""
+    match = re.search(r"<title[^>]*>([^<]*)</title>", html, re.IGNORECASE)
+    return match.group(1).strip() if match else ""
+
+
+def is_available(
+    base_url: str, cache: Optional[Cache] = None, is_refreshing: bool = False
+) -> bool:
+    """Check if a site has any sitemaps. See get_capabilities()."""
+    return get_capabilities(base_url, cache, is_refreshing)["is_available"]
+
+
+def is_entry_in_range(
+    entry: Dict,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+) -> bool:
+    """Check a sitemap entry's dates against a date range.
+
+    Entries without dates are let through, since the page may have one.
+    Publication dates are checked against both ends of the range; last
+    modified dates only against the start.
+    """
+    pub_date = get_date(entry.get("publication_date", ""))
+    if pub_date:
+        return (not start_date or pub_date >= start_date) and (
+            not end_date or pub_date <= end_date
+        )
+    lastmod = get_date(entry.get("lastmod", ""))
+    return not (lastmod and start_date and lastmod < start_date)
+
+
+def iter_sitemap(body: Optional[bytes]) -> Iterator[Tuple[str, Dict]]:
+    """Get the entries in a sitemap or sitemap index one at a time.
+
+    Gzipped sitemaps are decompressed as they're read. Namespaces are dropped
+    from field names, e.g. "news:publication_date" is "publication_date".
+
+    Returns:
+        Generator of (kind, entry dict) tuples, where kind is "urlset" or
+        "sitemapindex". Stops early if the sitemap is bad XML.
+    """
+    log = getLogger(__name__)
+
+    if not body:
+        return
+    xmlfile = BytesIO(body)
+    if body[:2] == _GZIP_MAGIC:
+        xmlfile = gzip.GzipFile(fileobj=xmlfile)
+
+    kind = root = None
+    entry = {}
+    try:
+        for event, element in iterparse(xmlfile, events=("start", "end")):
+            namespace, _, tag = element.tag.rpartition("}")
+            namespace = namespace.lstrip("{")
+            if event == "start":
+                if root is None:
+                    kind, root = tag, element
+                continue
+            if tag in _ENTRY_FIELDS and namespace in _NAMESPACES and element.text:
+                entry[tag] = element.text.strip()
+            elif tag in ("url", "sitemap"):
+                if entry.get("loc"):
+                    yield kind, entry
+                entry = {}
+                root.clear()  # Don't keep what we've been through.
+    except (EOFError, OSError, ParseError) as e:
+        log.warning("Could not parse sitemap: %s" % e)
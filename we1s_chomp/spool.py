@@ -0,0 +1,101 @@
+"""Spool files for raw article HTML.
+
+The metadata generators hand back each article's raw HTML along with its
+cleaned content, and every Article and copy made on the way to disk keeps it
+alive a little longer. Given a Spool, they write the HTML to a file as soon as
+it's cleaned and hand back the file's Path instead. db.save_manifest_file()
+moves the file into place rather than writing the HTML out again, so no more
+than one page's HTML is in memory at once, however big the pages are.
+
+Keep the spool on the same filesystem as the manifests, so moving a file is
+just a rename.
+"""
+import os
+from contextlib import suppress
+from logging import getLogger
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from time import time
+from typing import Union
+
+###############################################################################
+# Internal configuration parameters.                                          #
+###############################################################################
+
+
+_DEFAULT_MAX_AGE = 24 * 60 * 60.0
+"""Default age in seconds past which spool files are taken to be left over
+from a run that died."""
+
+
+###############################################################################
+# Spool class.                                                                #
+###############################################################################
+
+
+class Spool:
+    """Directory of raw HTML files waiting to be saved."""
+
+    def __init__(self, dirpath: Path, max_age: float = _DEFAULT_MAX_AGE):
+        """Create a new Spool instance, clearing out any old files.
+
+        Args:
+            dirpath: Directory to spool to. Created if necessary. It can be
+                shared by several workers.
+            max_age: Age in seconds past which files are left over from a run
+                that died, and deleted. Set -1 to keep them.
+        """
+        self.dirpath = Path(dirpath)
+        self.dirpath.mkdir(parents=True, exist_ok=True)
+        if max_age != -1:
+            self.clear(max_age)
+
+    def write(self, content: str) -> Path:
+        """Spool some HTML.
+
+        Returns:
+            Path to the spool file. Pass it on in place of the HTML.
+        """
+        with NamedTemporaryFile(
+            "w", encoding="utf-8", dir=self.dirpath, suffix=".html", delete=False
+        ) as htmlfile:
+            htmlfile.write(content)
+        return Path(htmlfile.name)
+
+    def discard(self, handle: Union[Path, str]) -> None:
+        """Delete a spool file that won't be saved. Strings are ignored, so
+        this is safe to call on any content_html."""
+        if isinstance(handle, Path):
+            with suppress(FileNotFoundError):
+                handle.unlink()
+
+    def clear(self, max_age: float = 0.0) -> int:
+        """Delete spool files older than max_age seconds.
+
+        Returns:
+            Number of files deleted.
+        """
+        log = getLogger(__name__)
+
+        count = 0
+        now = time()
+        for filename in self.dirpath.glob("*.html"):
+            with suppress(FileNotFoundError):
+                if now - os.path.getmtime(filename) >= max_age:
+                    filename.unlink()
+                    count += 1
+        if count:
+            log.info("Cleared %i spool files: %s" % (count, self.dirpath))
+        return count
+
+
+###############################################################################
+# Helper functions.                                                           #
+###############################################################################
+
+
+def read(handle: Union[Path, str]) -> str:
+    """Get the HTML behind a content_html value, spooled or not."""
+    if isinstance(handle, Path):
+        return handle.read_text(encoding="utf-8")
+    return handle
@@ -11,15 +11,32 @@
 - Implement some form of security for the Selenium containers and make sure the
     Browser class is made aware of it (i.e. basicauth or equivalent).
 - Reinforce exception handling.
+
+Requests and Selenium are imported on first use, so jobs that never go online
+don't pay to import them.
 """
 import random
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
 from logging import getLogger
 from time import sleep  # noqa
-from typing import Callable, Optional, Set, Tuple
-
-import requests
-from selenium import webdriver
-from selenium.common.exceptions import WebDriverException, NoSuchElementException
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from we1s_chomp import metrics
+
+if TYPE_CHECKING:
+    from selenium import webdriver
 
 ###############################################################################
 # Internal configuration parameters.                                          #
@@ -35,6 +52,38 @@
 _DEFAULT_BROWSER_TYPE = "chrome"
 """Default browser node type for which to ask Selenium hub."""
 
+_DEFAULT_BLOCKED_CONTENT = {"images", "stylesheets", "fonts"}
+"""Default kinds of content to block in a lightweight profile."""
+
+_BLOCKED_URL_PATTERNS = {
+    "images": ["*.gif", "*.jpeg", "*.jpg", "*.png", "*.svg", "*.webp"],
+    "stylesheets": ["*.css"],
+    "fonts": ["*.eot", "*.otf", "*.ttf", "*.woff", "*.woff2"],
+}
+"""URL patterns to block for each kind of content. Chrome only has a content
+setting for images, so the rest are blocked through the DevTools protocol."""
+
+_CDP_COMMAND = ("POST", "/session/$sessionId/goog/cdp/execute")
+"""ChromeDriver endpoint for DevTools commands. Remote drivers don't know it."""
+
+_DEFAULT_PAGE_LOAD_STRATEGY = "normal"
+"""Default Selenium page load strategy ("normal", "eager" or "none")."""
+
+_DEFAULT_PAGE_LOAD_TIMEOUT = -1.0
+"""Default maximum time in seconds to wait for a page load, or -1 for none."""
+
+_DEFAULT_CHUNK_SIZE = 64 * 1024
+"""Size in bytes of each chunk read from a streaming download."""
+
+_DEFAULT_CONTENT_TYPES = {"text/html", "application/xhtml+xml", "text/plain"}
+"""Default Content-Type allowlist for page downloads."""
+
+_DEFAULT_JSON_CONTENT_TYPES = {"application/json", "text/javascript", "text/plain"}
+"""Default Content-Type allowlist when expecting a JSON response."""
+
+_DEFAULT_MAX_CONTENT_LENGTH = 10 * 1024 * 1024
+"""Default maximum response body size in bytes, or -1 for no limit."""
+
 _DEFAULT_NUM_BATCH_WORKERS = 1
 """Default number of worker threads to use for batch collection."""
 
@@ -44,6 +93,51 @@
 _HUB_STATUS_URL_SUFFIX = "/wd/hub/status"
 """Suffix for Grid URL to get at status report JSON."""
 
+SKIP_CONTENT_LENGTH = "Content too large"
+"""Skip reason for responses over the maximum body size."""
+
+SKIP_CONTENT_TYPE = "Content type not allowed"
+"""Skip reason for responses outside the Content-Type allowlist."""
+
+SKIP_DATE = "No date or out of date range"
+"""Skip reason for articles we can't date, or from outside the query dates."""
+
+SKIP_NO_CONTENT = "No content"
+"""Skip reason for articles with nothing left after cleaning."""
+
+SKIP_NO_MATCH = "Search term not found"
+"""Skip reason for articles that don't mention the search term at all."""
+
+SKIP_ROBOTS = "Disallowed by robots.txt"
+"""Skip reason for URLs a site's robots.txt asks us to leave alone."""
+
+SKIP_URL_STOP = "URL in stop list"
+"""Skip reason for URLs already collected or containing a stopword."""
+
+
+###############################################################################
+# Skipped class.                                                              #
+###############################################################################
+
+
+class Skipped(str):
+    """Empty response for a page we chose not to download.
+
+    It's falsy, like a page with no content, so callers that don't care can
+    treat it as one. Callers that do can tell it apart from an error (None)
+    and find out why from its reason.
+    """
+
+    reason: str
+
+    def __new__(cls, reason: str):
+        obj = super().__new__(cls, "")
+        obj.reason = reason
+        return obj
+
+    def __repr__(self) -> str:
+        return "Skipped(%r)" % self.reason
+
 
 ###############################################################################
 # Browser class.                                                              #
@@ -64,22 +158,113 @@ def __init__(
         browser_type: str = _DEFAULT_BROWSER_TYPE,
         timeout: float = _DEFAULT_BROWSER_TIMEOUT,
         sleep_range: Tuple[float, float] = _DEFAULT_BROWSER_SLEEP,
+        headless: bool = False,
+        blocked_content: Set[str] = set(),
+        page_load_strategy: str = _DEFAULT_PAGE_LOAD_STRATEGY,
+        page_load_timeout: float = _DEFAULT_PAGE_LOAD_TIMEOUT,
+        wait_selector: Optional[str] = None,
     ):
         """Create a new Browser instance.
 
+        The defaults ask the grid for a stock copy of Chrome. Since all we
+        want is the DOM text, most collection jobs will do better with a
+        lightweight profile--see Browser.lightweight().
+
         Args:
             hub_url: Raw Selenium Grid URL, with port number.
             timeout: Maximum time in seconds for the browser to await a
                 response.
             sleep_range: Tuple with minimum and maximum random sleep time, in
                 seconds.
+            headless: Run Chrome without a display.
+            blocked_content: Kinds of content to block: "images",
+                "stylesheets" and/or "fonts". Chrome only.
+            page_load_strategy: Selenium page load strategy. "eager" returns
+                once the DOM is ready; "none" returns immediately.
+            page_load_timeout: Maximum time in seconds to wait for a page
+                load, or -1 for the driver default. Whatever has loaded by
+                then is returned.
+            wait_selector: CSS selector to wait for before reading the page
+                source. Useful with the "eager" and "none" strategies.
         """
         self.hub_url = hub_url.rstrip("/")
+        self.browser_type = browser_type
         self.timeout = timeout
         self.sleep_range = sleep_range
+        self.headless = headless
+        self.blocked_content = set(blocked_content)
+        self.page_load_strategy = page_load_strategy
+        self.page_load_timeout = page_load_timeout
+        self.wait_selector = wait_selector
+
+    @classmethod
+    def lightweight(cls, hub_url: str, **kwargs) -> "Browser":
+        """Create a Browser that only loads what we need for the DOM text.
+
+        Runs headless, blocks images, stylesheets and fonts, and stops waiting
+        once the DOM is ready. Any Browser argument can be overridden.
+        """
+        kwargs.setdefault("headless", True)
+        kwargs.setdefault("blocked_content", _DEFAULT_BLOCKED_CONTENT)
+        kwargs.setdefault("page_load_strategy", "eager")
+        kwargs.setdefault("page_load_timeout", 30.0)
+        kwargs.setdefault("wait_selector", "body")
+        return cls(hub_url, **kwargs)
+
+    def get_capabilities(self) -> Dict:
+        """Build desired capabilities for the rendering profile."""
+        capabilities = {
+            "browserName": self.browser_type,
+            "pageLoadStrategy": self.page_load_strategy,
+        }
+        if self.browser_type == "chrome":
+            args = ["--headless", "--disable-gpu"] if self.headless else []
+            prefs = {}
+            if "images" in self.blocked_content:
+                args.append("--blink-settings=imagesEnabled=false")
+                prefs["profile.managed_default_content_settings.images"] = 2
+            capabilities["goog:chromeOptions"] = {"args": args, "prefs": prefs}
+        return capabilities
+
+    def get_blocked_urls(self) -> List[str]:
+        """Get the URL patterns to block for the rendering profile."""
+        if self.browser_type != "chrome":
+            return []
+        return [
+            pattern
+            for content in sorted(self.blocked_content)
+            for pattern in _BLOCKED_URL_PATTERNS.get(content, [])
+        ]
+
+    def block_urls(self, driver: "webdriver.Remote") -> bool:
+        """Block requests for unwanted content through the DevTools protocol.
+
+        Returns:
+            True if anything was blocked.
+        """
+        from selenium.common.exceptions import WebDriverException
+
+        log = getLogger(__name__)
+
+        urls = self.get_blocked_urls()
+        if not urls:
+            return False
+        driver.command_executor._commands["executeCdpCommand"] = _CDP_COMMAND
+        try:
+            driver.execute("executeCdpCommand", {"cmd": "Network.enable", "params": {}})
+            driver.execute(
+                "executeCdpCommand",
+                {"cmd": "Network.setBlockedURLs", "params": {"urls": urls}},
+            )
+        except WebDriverException as e:
+            log.info("Could not block content, loading everything: %s" % e)
+            return False
+        return True
 
     def is_grid_ready(self) -> bool:
         """Check if Selenium Grid is ready."""
+        import requests
+
         log = getLogger(__name__)
 
         try:
@@ -106,6 +291,13 @@ def get(
         Returns:
             Raw text content of the response, None if error.
         """
+        from selenium import webdriver
+        from selenium.common.exceptions import (
+            NoSuchElementException,
+            TimeoutException,
+            WebDriverException,
+        )
+
         log = getLogger(__name__)
 
         if not sleep_range:
@@ -122,67 +314,253 @@ def get(
                 log.error("Browser timed out waiting for open grid slot.")
                 return None
 
+        driver = None
+        host = metrics.get_host(url)
+        in_flight = metrics.track("chomp_requests_in_flight", collector="selenium")
+        fetch_timer = metrics.timer(
+            "chomp_fetch_seconds", collector="selenium", host=host
+        )
         try:
-            driver = webdriver.Remote(
-                command_executor=self.hub_url + _HUB_URL_SUFFIX,
-                desired_capabilities={"browserName": "chrome"},
-            )
-            driver.get(url)
-            response = (
-                driver.find_element_by_tag_name("pre").text
-                if is_expecting_json
-                else driver.page_source
+            with in_flight, fetch_timer:
+                driver = webdriver.Remote(
+                    command_executor=self.hub_url + _HUB_URL_SUFFIX,
+                    desired_capabilities=self.get_capabilities(),
+                )
+                if self.page_load_timeout != -1:
+                    driver.set_page_load_timeout(self.page_load_timeout)
+                self.block_urls(driver)
+
+                # A page that takes too long to load may still have the
+                # content we want, so hang on to whatever we have at the
+                # timeout.
+                try:
+                    driver.get(url)
+                except TimeoutException:
+                    log.info("Page load timed out, using partial DOM: %s" % url)
+                if self.wait_selector and not is_expecting_json:
+                    self.wait_for(driver, self.wait_selector)
+
+                response = (
+                    driver.find_element_by_tag_name("pre").text
+                    if is_expecting_json
+                    else driver.page_source
+                )
+            metrics.inc("chomp_fetches_total", collector="selenium", host=host)
+            metrics.inc(
+                "chomp_fetch_bytes_total",
+                len(response.encode("utf-8")),
+                collector="selenium",
+                host=host,
             )
 
         except (NoSuchElementException, WebDriverException) as e:
             log.info('Error while trying to get URL "%s": %s' % (url, e))
+            metrics.inc("chomp_fetch_errors_total", collector="selenium", host=host)
             response = None
 
         finally:
             random_sleep(sleep_range)
-            driver.quit()
+            if driver is not None:
+                driver.quit()
 
         return response
 
+    def get_batch(
+        self,
+        urls: Iterable[str],
+        num_workers: int = _DEFAULT_NUM_BATCH_WORKERS,
+        **kwargs,
+    ) -> Iterator[Tuple[str, str]]:
+        """Get page sources from several URLs at once using Selenium Grid.
+
+        See get_batch() for details. Each worker holds one grid slot.
+        """
+        return get_batch(urls, self.get, num_workers, **kwargs)
+
+    def wait_for(self, driver: "webdriver.Remote", selector: str) -> bool:
+        """Wait for an element matching a CSS selector to appear."""
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        log = getLogger(__name__)
+
+        timeout = self.timeout
+        if self.page_load_timeout != -1:
+            timeout = self.page_load_timeout
+        try:
+            WebDriverWait(driver, timeout).until(
+                expected_conditions.presence_of_element_located(
+                    (By.CSS_SELECTOR, selector)
+                )
+            )
+        except TimeoutException:
+            log.info('Timed out waiting for "%s": %s' % (selector, driver.current_url))
+            return False
+        return True
+
 
 def get(
     url: str,
     sleep_range: Tuple[float, float] = _DEFAULT_BROWSER_SLEEP,
     is_expecting_json: bool = False,
-) -> str:
+    max_length: int = _DEFAULT_MAX_CONTENT_LENGTH,
+    content_types: Optional[Set[str]] = None,
+    is_binary: bool = False,
+) -> Union[str, bytes]:
     """Get page source from URL using the Requests module.
 
     N.b. some websites will attempt to block programmatic requests. Try Browser
     and Browser.get() or .get_batch() if you aren't getting good results.
 
+    The response is streamed: headers are checked against the Content-Type
+    allowlist and the declared Content-Length before the body is read, and the
+    download is abandoned as soon as it grows past max_length.
+
     Args:
         url: URL of page to get.
         sleep_range: Min. and max. time to sleep after request.
+        is_expecting_json: Use the JSON Content-Type allowlist by default.
+        max_length: Maximum body size in bytes, or -1 for no limit.
+        content_types: Allowed Content-Type values. Set None to use the
+            default allowlist for the kind of response expected.
+        is_binary: Return the body as bytes, without decoding it, e.g. for
+            gzipped files.
 
     Returns:
-        Raw text content of the response, None if error.
+        Raw text content of the response, None if error, or Skipped with the
+        reason if we chose not to download it.
     """
+    import requests
+
     log = getLogger(__name__)
 
     if "http://" not in url and "https://" not in url:
         url = "http://" + url
 
+    if content_types is None:
+        content_types = (
+            _DEFAULT_JSON_CONTENT_TYPES if is_expecting_json else _DEFAULT_CONTENT_TYPES
+        )
+
+    host = metrics.get_host(url)
+    in_flight = metrics.track("chomp_requests_in_flight", collector="requests")
+    fetch_timer = metrics.timer("chomp_fetch_seconds", collector="requests", host=host)
     try:
-        response = requests.get(url).text
+        with in_flight, fetch_timer, requests.get(url, stream=True) as res:
+
+            # Check headers before we commit to downloading anything.
+            content_type = res.headers.get("Content-Type", "")
+            if not is_content_type_ok(content_type, content_types):
+                log.info("Skipping (%s): %s" % (SKIP_CONTENT_TYPE, url))
+                metrics.inc("chomp_skips_total", reason=SKIP_CONTENT_TYPE)
+                return Skipped(SKIP_CONTENT_TYPE)
+            content_length = res.headers.get("Content-Length", "")
+            if (
+                max_length != -1
+                and content_length.isdigit()
+                and int(content_length) > max_length
+            ):
+                log.info("Skipping (%s): %s" % (SKIP_CONTENT_LENGTH, url))
+                metrics.inc("chomp_skips_total", reason=SKIP_CONTENT_LENGTH)
+                return Skipped(SKIP_CONTENT_LENGTH)
+
+            # Stream the body, bailing out if it runs past the limit. Servers
+            # don't always send Content-Length (or tell the truth about it).
+            body = bytearray()
+            for chunk in res.iter_content(_DEFAULT_CHUNK_SIZE):
+                body += chunk
+                if max_length != -1 and len(body) > max_length:
+                    log.info("Skipping (%s): %s" % (SKIP_CONTENT_LENGTH, url))
+                    metrics.inc("chomp_skips_total", reason=SKIP_CONTENT_LENGTH)
+                    return Skipped(SKIP_CONTENT_LENGTH)
+
+            if is_binary:
+                response = bytes(body)
+            else:
+                encoding = res.encoding or get_apparent_encoding(bytes(body))
+                response = body.decode(encoding, errors="replace")
+        metrics.inc("chomp_fetches_total", collector="requests", host=host)
+        metrics.inc(
+            "chomp_fetch_bytes_total", len(body), collector="requests", host=host
+        )
         random_sleep(sleep_range)
 
     except requests.RequestException as e:
         log.info('Error while trying to get URL "%s": %s' % (url, e))
+        metrics.inc("chomp_fetch_errors_total", collector="requests", host=host)
         return None
 
     return response
 
 
+def get_batch(
+    urls: Iterable[str],
+    collector: Callable = get,
+    num_workers: int = _DEFAULT_NUM_BATCH_WORKERS,
+    ordered: bool = True,
+    **kwargs,
+) -> Iterator[Tuple[str, str]]:
+    """Get page sources from several URLs concurrently.
+
+    URLs are pulled lazily, so this works with open-ended generators: at most
+    num_workers requests are in flight at once, and nothing more is requested
+    once the caller stops iterating. Pending requests are cancelled when the
+    generator is closed.
+
+    Args:
+        urls: URLs of pages to get.
+        collector: Collector interface, i.e. get() or Browser.get().
+        num_workers: Maximum number of concurrent requests.
+        ordered: Return results in the order given. Set False to return them
+            as soon as they complete.
+        kwargs: Passed on to the collector.
+
+    Returns:
+        Generator of (url, raw text content) tuples. The content is None if
+        there was an error.
+    """
+    urls = iter(urls)
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        pending = {}
+
+        def submit(num_urls: int) -> None:
+            for url in islice(urls, num_urls):
+                pending[executor.submit(collector, url, **kwargs)] = url
+            metrics.set_gauge("chomp_queue_depth", len(pending), queue="fetch")
+
+        submit(num_workers)
+        try:
+            while pending:
+                if ordered:
+                    done = [next(iter(pending))]
+                else:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    response = future.result()
+                    url = pending.pop(future)
+                    submit(1)
+                    yield url, response
+        finally:
+            for future in pending:
+                future.cancel()
+            metrics.set_gauge("chomp_queue_depth", 0, queue="fetch")
+
+
 ###############################################################################
 # Helper functions for Browser class.                                         #
 ###############################################################################
 
 
+def get_apparent_encoding(body: bytes) -> str:
+    """Guess the encoding of a body without a charset, the way Requests
+    does for Response.text."""
+    from requests.compat import chardet
+
+    return chardet.detect(body)["encoding"] or "utf-8"
+
+
 def get_interface(browser: Optional[Browser] = None) -> Callable:
     """Switch collector interface."""
     if browser is not None and isinstance(browser, Browser):
@@ -190,6 +568,15 @@ def get_interface(browser: Optional[Browser] = None) -> Callable:
     return get
 
 
+def is_content_type_ok(content_type: str, content_types: Set[str]) -> bool:
+    """Check a Content-Type header against an allowlist.
+
+    Missing headers are let through, since plenty of servers don't bother.
+    """
+    mime_type = content_type.split(";")[0].strip().lower()
+    return not mime_type or mime_type in content_types
+
+
 def is_url_ok(url: str, url_stops: Set[str] = {}, url_stopwords: Set[str] = {}) -> bool:
     """Check URL against stop lists."""
     return not (url in url_stops or next((s for s in url_stopwords if s in url), False))
@@ -1,12 +1,17 @@
 """Scraping tools for the Wordpress API.
 """
 import json
+from contextlib import suppress
 from datetime import datetime
 from logging import getLogger
-from typing import Dict, Iterator, Optional, Set, Tuple
+from pathlib import Path
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
-from we1s_chomp import web
-from we1s_chomp.clean import get_content, get_stub, str_to_date
+from we1s_chomp import lazy, metrics, profiling, web
+from we1s_chomp.cache import Cache
+from we1s_chomp.clean import get_cached_content, get_stub, str_to_date
+from we1s_chomp.model import Payload, load_payload
+from we1s_chomp.spool import Spool
 
 ###############################################################################
 # Internal configuration parameters.                                          #
@@ -20,9 +25,30 @@
 _DEFAULT_ENDPOINTS = {"pages", "posts"}
 """Wordpress endpoints to collect."""
 
+_DEFAULT_FIELDS = ["link", "date", "modified", "title", "content"]
+"""Fields to request for each result. We don't use the rest."""
+
+_DEFAULT_NUM_WORKERS = 1
+"""Default number of pages to request at once."""
+
 _DEFAULT_PAGE_LIMIT = -1
 """Stop after this # of pages, or -1 for no limit."""
 
+_DEFAULT_PER_PAGE = 100
+"""Number of results per page. 100 is the most Wordpress will give us."""
+
+_END_CODES = {"rest_post_invalid_page_number"}
+"""Wordpress error codes that just mean we've run out of pages."""
+
+_NO_API_CODES = {"rest_no_route"}
+"""Wordpress error codes that mean there's no API for us at a URL."""
+
+_PEEK_LENGTH = 64
+"""Characters to read from the start of a response to see what's in it."""
+
+_STRFTIME = "%Y-%m-%dT%H:%M:%S"
+"""Datetime to string formatter for Wordpress API date arguments."""
+
 
 ###############################################################################
 # Collector functions.                                                        #
@@ -30,6 +56,7 @@
 
 
 # Step 1: Get search responses.
+@profiling.profiled("get_responses")
 def get_responses(
     query_str: str,
     base_url: str,
@@ -38,9 +65,25 @@ def get_responses(
     url_stopwords: Set[str] = set(),
     page_limit: int = _DEFAULT_PAGE_LIMIT,
     browser: Optional[web.Browser] = None,
+    num_workers: int = _DEFAULT_NUM_WORKERS,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    watermarks: Optional[Cache] = None,
+    is_streaming: bool = False,
 ) -> Iterator[Tuple[str, str]]:
     """Collect raw JSON search responses from Wordpress API.
 
+    The first page of each endpoint is requested with the pagination headers
+    (X-WP-Total, X-WP-TotalPages) in a JSON envelope, so we know up front how
+    many pages there are and can request the rest all at once. The envelope is
+    kept as it came, with the posts in its body; get_metadata() unwraps it.
+    Sites too old to do envelopes are paged through one at a time, as before.
+
+    With a watermark store, collection is incremental: we remember the newest
+    modified date seen for each site, search term and date range, and next
+    time only ask for posts modified since then. The watermark only moves if
+    every page came back, so nothing is missed for good after an error.
+
     Args:
         query_str: Search term.
         base_url: Base site URL.
@@ -51,72 +94,229 @@ def get_responses(
         page_limit: Stop after this # of pages, or -1 for no limit.
         browser: Selenium configuration information. Set None to use Requests
             module.
+        num_workers: Number of pages to request at once, across all endpoints.
+        start_date: Start date of query. Posts from before this date are
+            filtered out by Wordpress.
+        end_date: End date of query. Posts from after this date are filtered
+            out by Wordpress.
+        watermarks: Store for the newest modified date seen per site and
+            query. Set None to collect everything every time.
+        is_streaming: Don't parse whole pages up front. Responses are only
+            checked for content (and the first page for its page count), and
+            get_metadata() parses posts one at a time as it goes. Needs ijson;
+            without it, pages are parsed whole as usual.
 
     Returns:
-        Generator continaing formatted JSON strings with response data.
+        Generator continaing raw JSON strings with response data, as Payloads
+        carrying the parsed data along with them.
     """
     log = getLogger(__name__)
 
     # Use Selenium if we have configuration information, otherwise default to
     # the requests module.
     collector = web.get_interface(browser)
+    is_streaming = is_streaming and lazy.import_optional("ijson") is not None
+
+    # Only ask for what's changed since last time, if we've been here before.
+    # Anything modified after the end of the query is no use to us, though.
+    watermark_key = [
+        "wordpress",
+        base_url,
+        query_str,
+        start_date.strftime(_STRFTIME) if start_date else "",
+        end_date.strftime(_STRFTIME) if end_date else "",
+    ]
+    watermark = modified_after = None
+    if watermarks is not None:
+        watermark = watermarks.get(watermark_key)
+    if watermark:
+        modified_after = str_to_date(watermark)
+        if end_date and modified_after and modified_after > end_date:
+            modified_after = end_date
+        log.info("Collecting posts modified since %s: %s" % (watermark, base_url))
+
+    def get_url_in_range(endpoint: str, page: int = 1) -> str:
+        return get_url(
+            query_str,
+            base_url,
+            endpoint,
+            page,
+            after=start_date,
+            before=end_date,
+            modified_after=modified_after,
+        )
+
+    # Pages we didn't get. Running out of pages is fine; this isn't, and
+    # neither is stopping at the page limit before we run out.
+    errors = []
+    is_truncated = False
+
+    def fetch(url: str, is_enveloped: bool = False) -> Tuple[Optional[Payload], int]:
+        raw = collector(
+            url + "&_envelope" if is_enveloped else url, is_expecting_json=True
+        )
+        if not raw:
+            log.warning("Could not get response: %s" % url)
+            errors.append(url)
+            return None, 0
+
+        # Just make sure there's something in there; the rest can wait. Pages
+        # without any posts are small, so we find out why below.
+        if is_streaming and next(iter_posts(raw), None) is not None:
+            return Payload(raw), get_num_pages(raw) if is_enveloped else -1
 
-    # Collect once for each Wordpress endpoint.
+        try:
+            res = json.loads(raw)
+        except (json.JSONDecodeError, TypeError):
+            log.warning("Could not decode JSON response: %s" % url)
+            errors.append(url)
+            return None, 0
+
+        # Unwrap the envelope. If there isn't one, we don't know the page count.
+        num_pages = -1
+        if isinstance(res, dict) and "body" in res:
+            with suppress(TypeError, ValueError):
+                num_pages = int(res.get("headers", {}).get("X-WP-TotalPages", -1))
+            res = res["body"]
+
+        # If a list returns, ye've pages t' burn
+        #   If a dict ye score, thar be pages no more
+        if isinstance(res, dict) and res.get("code") not in _END_CODES:
+            log.warning("Wordpress error (%s): %s" % (res.get("code"), url))
+            errors.append(url)
+            return None, 0
+        if not isinstance(res, list) or not len(res) > 0:
+            log.info("Out of pages or no content: %s" % url)
+            return None, 0
+
+        return Payload(raw, res), num_pages
+
+    def update_watermark(payload: Payload) -> None:
+        nonlocal watermark
+
+        # WP dates are ISO 8601, so they sort as strings.
+        for modified in iter_modified_dates(payload):
+            if not watermark or modified > watermark:
+                watermark = modified
+
+    def fetch_batch(urls: List[str], **kwargs) -> Iterator[Tuple[str, Tuple]]:
+        if num_workers > 1:
+            return web.get_batch(urls, fetch, num_workers, **kwargs)
+        return ((url, fetch(url, **kwargs)) for url in urls)
+
+    # Get the first page of each endpoint, along with the page count.
     count = 0
     skipped = 0
-    for endpoint in endpoints:
+    first_urls = {get_url_in_range(e): e for e in sorted(endpoints)}
+    next_urls = []
+    unpaged_endpoints = []
+    for url, (res, num_pages) in fetch_batch(list(first_urls), is_enveloped=True):
+        if res is None:
+            continue
+
+        # We need the page count either way, but don't save the page twice.
+        if web.is_url_ok(url, url_stops, url_stopwords):
+            count += 1
+            url_stops.add(url)
+            if watermarks is not None:
+                update_watermark(res)
+            yield url, res
+        else:
+            log.info("Skipping (URL in stop list): %s" % url)
+            metrics.inc("chomp_skips_total", reason=web.SKIP_URL_STOP)
+            skipped += 1
+
+        endpoint = first_urls[url]
+        if num_pages == -1:
+            unpaged_endpoints.append(endpoint)
+            continue
+        if page_limit != -1 and num_pages > page_limit:
+            num_pages = page_limit
+            is_truncated = True
+        next_urls += [get_url_in_range(endpoint, p) for p in range(2, num_pages + 1)]
+
+    # Fan out over the rest of the pages.
+    urls = []
+    for url in next_urls:
+        if not web.is_url_ok(url, url_stops, url_stopwords):
+            log.info("Skipping (URL in stop list): %s" % url)
+            metrics.inc("chomp_skips_total", reason=web.SKIP_URL_STOP)
+            skipped += 1
+            continue
+        urls.append(url)
+    for url, (res, _) in fetch_batch(urls):
+        if res is None:
+            continue
+        count += 1
+        url_stops.add(url)
+        if watermarks is not None:
+            update_watermark(res)
+        yield url, res
+
+    # Page through whatever endpoints didn't tell us how many pages they have.
+    for endpoint in unpaged_endpoints:
 
         # Check for collected pages and URL stop words.
-        page = 1
-        url = get_url(query_str, base_url, endpoint, page)
+        page = 2
+        url = get_url_in_range(endpoint, page)
         while not web.is_url_ok(url, url_stops, url_stopwords):
             log.info("Skipping (URL in stop list): %s" % url)
+            metrics.inc("chomp_skips_total", reason=web.SKIP_URL_STOP)
             page += 1
             skipped += 1
-            url = get_url(query_str, base_url, endpoint, page)
+            url = get_url_in_range(endpoint, page)
 
         # Stop after page limit, if set. Otherwise, onward and upward!
         while page_limit == -1 or page <= page_limit:
-
-            # Collect the result.
-            res = collector(url, is_expecting_json=True)
-            try:
-                res = json.loads(res)
-            except json.JSONDecodeError:
-                log.warning("Could not decode JSON response: %s" % url)
-                break
-
-            # If a list returns, ye've pages t' burn
-            #   If a dict ye score, thar be pages no more
-            if not isinstance(res, list) or not len(res) > 0:
-                log.info("Out of pages or no content: %s" % url)
+            res, _ = fetch(url)
+            if res is None:
                 break
 
             # Save response.
             count += 1
             url_stops.add(url)
-            yield url, json.dumps(res)
+            if watermarks is not None:
+                update_watermark(res)
+            yield url, res
 
             # Get a new URL.
             page += 1
-            url = get_url(query_str, base_url, endpoint, page)
+            url = get_url_in_range(endpoint, page)
+        else:
+            # We stopped at the page limit, not the last page.
+            is_truncated = True
+
+    # Only move the watermark once we've made it all the way through.
+    if errors:
+        log.warning(
+            "Not moving watermark (%i pages failed): %s" % (len(errors), base_url)
+        )
+    elif is_truncated:
+        log.info("Not moving watermark (Stopped at page limit): %s" % base_url)
+    elif watermarks is not None and watermark:
+        watermarks.set(watermark_key, watermark)
 
     log.info("Collected %i responses (%i skipped): %s" % (count, skipped, base_url))
 
 
 # Step 2: Get metadata & content from responses.
+@profiling.profiled("get_metadata")
 def get_metadata(
-    response: str,
+    response: Union[Payload, str, bytes, IO],
     query_str: str,
     start_date: datetime,
     end_date: datetime,
     url_stops: Set[str] = {},
     url_stopwords: Set[str] = {},
+    spool: Optional[Spool] = None,
+    content_cache: Optional[Cache] = None,
 ) -> Iterator[Dict]:
     """Collect metadata from Wordpress API response.
 
     Args:
-        response: Raw JSON string of response data.
+        response: Raw JSON string of response data, or a Payload straight
+            from get_responses(). Raw responses (including open files) are
+            parsed one post at a time if ijson is installed.
         query_str: Term to search for. Articles that do not contain this str in
             their content field will be flagged as no_exact_match.
         start_date: Start date of query. Articles dated before this, and those
@@ -126,6 +326,10 @@ def get_metadata(
         url_stops: Skip these URLs altogether. This will be modified with each
             additional result we find in order to prevent dupes.
         url_stopwords: Skip all URLs that contain a word from this set.
+        spool: Write raw HTML here and return the spool file's Path as
+            content_html, instead of the HTML itself.
+        content_cache: Cache of cleaned content, so pages that haven't
+            changed aren't cleaned again. Set None to always clean.
 
     Returns:
         Generator containing article metadata as a dict (or None if error).
@@ -136,21 +340,15 @@ def get_metadata(
     """
     log = getLogger(__name__)
 
-    # Parse JSON response string.
-    try:
-        response = json.loads(response)
-    except json.JSONDecodeError:
-        log.warning("Could not decode JSON response: %s" % get_stub(response))
-        return None
-
     # Loop over the articles in the response and parse metadata.
     count = skipped = 0
-    for result in response:
+    for result in iter_posts(response):
 
         # Check for a URL stop.
         url = result["link"]
         if not web.is_url_ok(url, url_stops, url_stopwords):
             log.info("Skipping (URL in stop list): %s" % url)
+            metrics.inc("chomp_skips_total", reason=web.SKIP_URL_STOP)
             skipped += 1
             continue
 
@@ -158,6 +356,7 @@ def get_metadata(
         date = str_to_date(result["date"], (start_date, end_date))
         if not date:
             log.info("Skipping (No date or out of date range): %s" % url)
+            metrics.inc("chomp_skips_total", reason=web.SKIP_DATE)
             skipped += 1
             continue
 
@@ -165,11 +364,14 @@ def get_metadata(
         content_html = result["content"]["rendered"]
         if not content_html or content_html == "":
             log.info("Skipping (No content): %s" % url)
+            metrics.inc("chomp_skips_total", reason=web.SKIP_NO_CONTENT)
             skipped += 1
             continue
 
-        content = get_content(content_html)
+        content = get_cached_content(content_html, content_cache)
         no_exact_match = query_str not in content
+        if spool is not None:
+            content_html = spool.write(content_html)
 
         # Save metadata and return.
         url_stops.add(url)
@@ -184,9 +386,7 @@ def get_metadata(
         }
         log.info("Chomped: %s" % url)
 
-    log.info(
-        "Chomped %i articles (%i skipped): %s" % (count, skipped, get_stub(response))
-    )
+    log.info("Chomped %i articles (%i skipped)." % (count, skipped))
 
 
 ###############################################################################
@@ -194,8 +394,131 @@ def get_metadata(
 ###############################################################################
 
 
+def iter_posts(
+    response: Union[Payload, str, bytes, IO, Path, List]
+) -> Iterator[Dict]:
+    """Get posts from a Wordpress API response one at a time.
+
+    If the response has been parsed already, we use that. Otherwise, if ijson
+    is installed, we parse incrementally, so only one parsed post needs to be
+    in memory at once and the first is ready right away. Text is fed to ijson a
+    chunk at a time, and files (e.g. spooled responses) are read as we go.
+    Responses in a JSON envelope (see get_responses()) are unwrapped.
+
+    Returns:
+        Generator of post dicts. Stops early if the response is bad JSON.
+    """
+    log = getLogger(__name__)
+
+    if isinstance(response, Path):
+        with open(response, "rb") as response_file:
+            yield from iter_posts(response_file)
+        return
+
+    # Parse the whole thing if we have to (or if it's been done already).
+    ijson = lazy.import_optional("ijson")
+    if ijson is None or isinstance(response, list) or getattr(response, "data", None):
+        try:
+            if hasattr(response, "read"):
+                posts = json.load(response)
+            else:
+                posts = load_payload(response)
+        except (json.JSONDecodeError, TypeError):
+            log.warning("Could not decode JSON response: %s" % get_stub(str(response)))
+            return
+        if isinstance(posts, dict):
+            posts = posts.get("body")
+        yield from posts if isinstance(posts, list) else []
+        return
+
+    # ijson wants bytes, not text.
+    prefix = "body.item" if is_enveloped(response) else "item"
+    source = TextReader(response) if isinstance(response, str) else response
+    try:
+        yield from ijson.items(source, prefix, use_float=True)
+    except (ijson.JSONError, TypeError):
+        log.warning("Could not decode JSON response: %s" % get_stub(str(response)))
+
+
+def iter_modified_dates(response: Union[Payload, str, bytes, IO]) -> Iterator[str]:
+    """Get the modified date (or failing that, the date) of each post in a
+    Wordpress API response. With ijson, the rest of the posts are skipped
+    over, not parsed."""
+    log = getLogger(__name__)
+
+    ijson = lazy.import_optional("ijson")
+    if ijson is None or getattr(response, "data", None):
+        for post in iter_posts(response):
+            yield str(post.get("modified", post.get("date", "")))
+        return
+
+    prefix = "body.item" if is_enveloped(response) else "item"
+    source = TextReader(response) if isinstance(response, str) else response
+    try:
+        yield from ijson.items(source, prefix + ".modified")
+    except (ijson.JSONError, TypeError):
+        log.warning("Could not decode JSON response: %s" % get_stub(str(response)))
+
+
+def get_num_pages(response: Union[str, bytes, IO]) -> int:
+    """Get the page count from a raw response in a JSON envelope, or -1 if it
+    doesn't say. With ijson, the posts are skipped over, not parsed."""
+    ijson = lazy.import_optional("ijson")
+    if ijson is None:
+        with suppress(KeyError, TypeError, ValueError):
+            return int(json.loads(response)["headers"]["X-WP-TotalPages"])
+        return -1
+
+    source = TextReader(response) if isinstance(response, str) else response
+    with suppress(ijson.JSONError, StopIteration, TypeError, ValueError):
+        return int(next(ijson.items(source, "headers.X-WP-TotalPages")))
+    return -1
+
+
+def is_enveloped(response: Union[str, bytes, IO]) -> bool:
+    """Check whether a raw Wordpress API response is in a JSON envelope,
+    without parsing it. Files are put back where they were."""
+    if hasattr(response, "read"):
+        position = response.tell()
+        head = response.read(_PEEK_LENGTH)
+        response.seek(position)
+    else:
+        head = response[:_PEEK_LENGTH]
+    if isinstance(head, bytes):
+        head = head.decode("utf-8", errors="replace")
+    return head.lstrip().startswith("{")
+
+
+class TextReader:
+    """File-like view of a str as UTF-8, for ijson.
+
+    Each read encodes just the chunk asked for, so a page is never copied
+    whole.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.position = 0
+
+    def read(self, size: int = -1) -> bytes:
+        """Read up to size characters' worth of UTF-8, or the rest if -1."""
+        if size < 0:
+            size = len(self.text) - self.position
+        chunk = self.text[self.position : self.position + size]
+        self.position += len(chunk)
+        return chunk.encode("utf-8")
+
+
 def get_url(
-    query_str: str, base_url: str, endpoint: str = "posts", page: int = 1
+    query_str: str,
+    base_url: str,
+    endpoint: str = "posts",
+    page: int = 1,
+    per_page: int = _DEFAULT_PER_PAGE,
+    fields: Iterable[str] = _DEFAULT_FIELDS,
+    after: Optional[datetime] = None,
+    before: Optional[datetime] = None,
+    modified_after: Optional[datetime] = None,
 ) -> str:
     """Create query URL for Wordpress API search.
 
@@ -204,31 +527,64 @@ def get_url(
         base_url: Site URL.
         endpoint: Wordpress endpoint.
         page: Result page to start at.
+        per_page: Number of results per page.
+        fields: Fields to include in each result. Leave empty for all of them.
+        after: Only include posts published after this date.
+        before: Only include posts published before this date.
+        modified_after: Only include posts modified after this date.
     """
+    params = [f"search={query_str}", "sentence=1", f"page={page}"]
+    params.append(f"per_page={per_page}")
+    if fields:
+        params.append("_fields=" + ",".join(fields))
+    for param, date in [
+        ("after", after),
+        ("before", before),
+        ("modified_after", modified_after),
+    ]:
+        if date:
+            params.append(f"{param}={date.strftime(_STRFTIME)}")
+
     url = (
         base_url.strip().rstrip("/").rstrip("?")  # Just in case...
         + f"/{_API_SUFFIX}"
         + f"/{endpoint}"
         + "?"
-        + "&".join([f"search={query_str}", "sentence=1", f"page={page}"])
+        + "&".join(params)
     )
     return url
 
 
-def is_api_available(
+def get_capabilities(
     base_url: str,
     browser: Optional[web.Browser] = None,
-    endpoints: Set[str] = _DEFAULT_ENDPOINTS,
-) -> bool:
-    """Check for an open Wordpress API.
+    cache: Optional[Cache] = None,
+    is_refreshing: bool = False,
+) -> Dict:
+    """Find out what a site's Wordpress API can do.
+
+    The route index can run to hundreds of KB, so results are kept in the
+    cache, if we have one, and reused until they go stale.
 
     Args:
-        url: Base site URL.
+        base_url: Base site URL.
         browser: Selenium configuration information. Set None to use Requests
             module.
-        endpoints: Wordpress endpoints.
+        cache: Cache for capabilities. Set None to always ask the site.
+        is_refreshing: Ask the site even if we have a cached answer.
+
+    Returns:
+        Dict with "is_available" (bool), "endpoints" (endpoints with a GET
+        method) and "search_endpoints" (endpoints that take a search argument).
     """
-    log = getLogger()
+    log = getLogger(__name__)
+
+    cache_key = ["wordpress-api", base_url.rstrip("/")]
+    if cache is not None and not is_refreshing:
+        capabilities = cache.get(cache_key)
+        if capabilities is not None:
+            log.debug("Found Wordpress API capabilities in cache: %s" % base_url)
+            return capabilities
 
     # Switch collector interface.
     collector = web.get_interface(browser)
@@ -237,25 +593,106 @@ def is_api_available(
     api_url = f"{base_url.rstrip('/')}/{_API_SUFFIX}"
     res = collector(api_url, is_expecting_json=True)
 
-    # Check for endpoint endpoints.
-    for endpoint in endpoints:
+    # Check each endpoint's routes for GET and search. One odd route (e.g.
+    # from a plugin) doesn't mean the rest of the API is no good.
+    capabilities = {"is_available": False, "endpoints": [], "search_endpoints": []}
+    data = routes = None
+    with suppress(json.JSONDecodeError, TypeError):
+        data = json.loads(res)
+    if isinstance(data, dict):
+        routes = data.get("routes")
+    if isinstance(routes, dict):
+        capabilities["is_available"] = True
+    else:
+        log.info("No Wordpress API found: %s" % base_url)
+        routes = {}
+    for route, route_info in routes.items():
+        endpoint = route[len(f"/{_API_VER}/") :]
+        if not route.startswith(f"/{_API_VER}/") or "/" in endpoint:
+            continue
         try:
-            routes = json.loads(res)["routes"]["/wp/v2/" + endpoint]
+            if "GET" not in route_info["methods"]:
+                continue
+            get_info = next(e for e in route_info["endpoints"] if "GET" in e["methods"])
+            is_searchable = "search" in get_info["args"].keys()
+        except (AttributeError, KeyError, StopIteration, TypeError):
+            log.debug("Skipping (Bad route info): %s%s" % (base_url, route))
+            continue
+        capabilities["endpoints"].append(endpoint)
+        if is_searchable:
+            capabilities["search_endpoints"].append(endpoint)
+
+    # Don't hold a connection error, a page we skipped (e.g. a bot check) or
+    # one we couldn't read against the site. Only a route index, or Wordpress
+    # telling us there isn't one, is worth keeping.
+    is_definitive = capabilities["is_available"] or (
+        isinstance(data, dict) and data.get("code") in _NO_API_CODES
+    )
+    if cache is not None and is_definitive:
+        cache.set(cache_key, capabilities)
+    return capabilities
+
+
+def get_capabilities_batch(
+    base_urls: Iterable[str],
+    browser: Optional[web.Browser] = None,
+    cache: Optional[Cache] = None,
+    is_refreshing: bool = False,
+    num_workers: int = _DEFAULT_NUM_WORKERS,
+) -> Dict[str, Dict]:
+    """Find out what several sites' Wordpress APIs can do, all at once.
 
-            # Is the GET method available for this route?
-            if "GET" not in routes["methods"]:
-                log.info("No Wordpress API found: %s" % base_url)
-                return False
+    See get_capabilities() for details.
 
-            # Is the search argument available?
-            endpoint = next(e for e in routes["endpoints"] if "GET" in e["methods"])
-            if "search" not in endpoint["args"].keys():
-                log.info("Search not available for Wordpress API: %s" % base_url)
-                return False
+    Returns:
+        Dict of capabilities by base URL.
+    """
+    return dict(
+        web.get_batch(
+            base_urls,
+            get_capabilities,
+            num_workers,
+            browser=browser,
+            cache=cache,
+            is_refreshing=is_refreshing,
+        )
+    )
 
-        except (AttributeError, KeyError, json.JSONDecodeError, TypeError):
+
+def is_api_available(
+    base_url: str,
+    browser: Optional[web.Browser] = None,
+    endpoints: Set[str] = _DEFAULT_ENDPOINTS,
+    cache: Optional[Cache] = None,
+    is_refreshing: bool = False,
+) -> bool:
+    """Check for an open Wordpress API.
+
+    Args:
+        url: Base site URL.
+        browser: Selenium configuration information. Set None to use Requests
+            module.
+        endpoints: Wordpress endpoints.
+        cache: Cache for capabilities. Set None to always ask the site.
+        is_refreshing: Ask the site even if we have a cached answer.
+    """
+    log = getLogger(__name__)
+
+    capabilities = get_capabilities(base_url, browser, cache, is_refreshing)
+    if not capabilities["is_available"]:
+        return False
+
+    for endpoint in endpoints:
+
+        # Is the GET method available for this route?
+        if endpoint not in capabilities["endpoints"]:
             log.info("No Wordpress API found: %s" % base_url)
             return False
 
-    log.info("Found Wordpress API: %s" % api_url)
+        # Is the search argument available?
+        if endpoint not in capabilities["search_endpoints"]:
+            log.info("Search not available for Wordpress API: %s" % base_url)
+            return False
+
+    log.info("Found Wordpress API: %s" % base_url)
     return True